@@ -61,6 +61,12 @@ class Config(object):
         self.database_debug = False
         self.twophase_commit = False
 
+        # File storage.
+        self.file_storage_path = None
+        self.file_storage_compress = False
+        self.file_storage_compress_min_size = 4096
+        self.file_storage_compress_max_ratio = 0.8
+
         # Worker.
         self.keep_sandbox = True
         self.use_cgroups = True
@@ -59,7 +59,7 @@ __all__ = [
     "Manager", "Testcase",
     # submission
     "Submission", "File", "Token", "SubmissionResult", "Executable",
-    "Evaluation",
+    "Evaluation", "TaskScore",
     # usertest
     "UserTest", "UserTestFile", "UserTestManager", "UserTestResult",
     "UserTestExecutable",
@@ -71,12 +71,13 @@ __all__ = [
     "drop_db",
     # util
     "get_contest_list", "is_contest_id", "ask_for_contest",
+    "enumerate_referenced_files", "get_file_references",
     ]
 
 
 # Instantiate or import these objects.
 
-version = 11
+version = 13
 
 
 engine = create_engine(config.database, echo=config.database_debug,
@@ -93,7 +94,7 @@ from .user import User, Message, Question
 from .task import Task, Statement, Attachment, SubmissionFormatElement, \
     Dataset, Manager, Testcase
 from .submission import Submission, File, Token, SubmissionResult, \
-    Executable, Evaluation
+    Executable, Evaluation, TaskScore
 from .usertest import UserTest, UserTestFile, UserTestManager, \
     UserTestResult, UserTestExecutable
 from .fsobject import FSObject
@@ -101,7 +102,8 @@ from .fsobject import FSObject
 from .init import init_db
 from .drop import drop_db
 
-from .util import get_contest_list, is_contest_id, ask_for_contest
+from .util import get_contest_list, is_contest_id, ask_for_contest, \
+    enumerate_referenced_files, get_file_references
 
 
 configure_mappers()
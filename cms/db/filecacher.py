@@ -28,19 +28,23 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import errno
 import hashlib
 import io
 import logging
 import os
 import tempfile
+import zlib
 
 import gevent
+import gevent.pool
+import gevent.threadpool
 
 from sqlalchemy.exc import IntegrityError
 
 from cms import config, mkdir
 from cms.db import SessionGen, FSObject
-from cms.io.GeventUtils import copyfileobj, move, rmtree
+from cms.io.GeventUtils import copyfileobj, rmtree
 
 
 logger = logging.getLogger(__name__)
@@ -64,12 +68,16 @@ class FileCacherBackend(object):
         """
         raise NotImplementedError("Please subclass this class.")
 
-    def put_file(self, digest, desc=""):
+    def put_file(self, digest, desc="", compress=False):
         """Store a file to the storage.
 
         digest (unicode): the digest of the file to store.
         desc (unicode): the optional description of the file to
             store, intended for human beings.
+        compress (bool): a hint that the file is worth compressing;
+            backends that support compression store it compressed
+            (and decompress it transparently in get_file), the others
+            ignore it.
 
         return (fileobj): a writable binary file-like object on which
             to write the contents of the file, or None if the file is
@@ -78,6 +86,40 @@ class FileCacherBackend(object):
         """
         raise NotImplementedError("Please subclass this class.")
 
+    def put_file_from_path(self, digest, path, desc="", compress=False):
+        """Store a file to the storage, copying it from the file-system.
+
+        The content of the file is trusted to match the digest. This
+        default implementation writes it on the file-object returned
+        by put_file(); backends may override it with a faster way.
+
+        digest (unicode): the digest of the file to store.
+        path (string): the location of the file on the file-system.
+        desc (unicode): see put_file().
+        compress (bool): see put_file().
+
+        """
+        fobj = self.put_file(digest, desc, compress)
+
+        if fobj is None:
+            return
+
+        try:
+            with io.open(path, 'rb') as src:
+                copyfileobj(src, fobj, FileCacher.CHUNK_SIZE)
+        finally:
+            fobj.close()
+
+    def exists(self, digest):
+        """Tell whether a file is in the storage.
+
+        digest (unicode): the digest of the file to look up.
+
+        return (bool): whether the file is available.
+
+        """
+        raise NotImplementedError("Please subclass this class.")
+
     def describe(self, digest):
         """Return the description of a file given its digest.
 
@@ -121,21 +163,278 @@ class FileCacherBackend(object):
         raise NotImplementedError("Please subclass this class.")
 
 
+def _get_umask():
+    """Return the file mode creation mask of the process.
+
+    return (int): the umask.
+
+    """
+    # It can only be read by setting it.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+class _AtomicFile(io.RawIOBase):
+    """A writable file-object that publishes its content atomically.
+
+    Data is written to a temporary file, that is moved to its final
+    location (by an atomic rename) only when the file-object is closed.
+    If a digest is given, the content (before compression, if any) is
+    hashed while it is written and the rename happens only if the
+    result matches: otherwise the temporary file is discarded and an
+    IOError is raised. Therefore, readers never see a partial file.
+
+    """
+
+    def __init__(self, path, temp_dir, digest=None, compress=False):
+        """Create the temporary file.
+
+        path (string): the final location of the file.
+        temp_dir (string): a directory on the same file system as path
+            where to keep the content while it's being written.
+        digest (unicode|None): the expected digest of the content, or
+            None not to check it.
+        compress (bool): whether to compress the content with zlib.
+
+        """
+        io.RawIOBase.__init__(self)
+
+        self.path = path
+        self.digest = digest
+        self._hasher = hashlib.sha1() if digest is not None else None
+        self._compressor = zlib.compressobj() if compress else None
+
+        fd, self._temp_path = tempfile.mkstemp(dir=temp_dir)
+        # mkstemp makes the file readable only by us, give it instead
+        # the permissions a file created by open would have.
+        os.fchmod(fd, 0o666 & ~_get_umask())
+        self._fobj = io.open(fd, 'wb')
+
+    def writable(self):
+        """See IOBase.writable().
+
+        """
+        return True
+
+    def write(self, buf):
+        """See RawIOBase.write().
+
+        """
+        buf = memoryview(buf).tobytes()
+        if self._hasher is not None:
+            self._hasher.update(buf)
+        if self._compressor is not None:
+            self._fobj.write(self._compressor.compress(buf))
+        else:
+            self._fobj.write(buf)
+        return len(buf)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Publish the file only if no exception happened.
+
+        """
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+    def discard(self):
+        """Delete the temporary file, without publishing it.
+
+        """
+        if self.closed:
+            return
+
+        try:
+            self._fobj.close()
+            os.unlink(self._temp_path)
+        finally:
+            io.RawIOBase.close(self)
+
+    def close(self):
+        """Move the file to its final location.
+
+        raise (IOError): if the digest of the content doesn't match
+            the expected one.
+
+        """
+        if self.closed:
+            return
+
+        try:
+            if self._compressor is not None:
+                self._fobj.write(self._compressor.flush())
+            self._fobj.close()
+
+            if self._hasher is not None:
+                computed_digest = self._hasher.hexdigest().decode("ascii")
+                if computed_digest != self.digest:
+                    os.unlink(self._temp_path)
+                    raise IOError("File with hash %s actually has hash %s." %
+                                  (self.digest, computed_digest))
+
+            os.rename(self._temp_path, self.path)
+        finally:
+            io.RawIOBase.close(self)
+
+
+class _CompressingWriter(io.RawIOBase):
+    """A writable file-object that compresses data with zlib.
+
+    The compressed data is written to another binary file-object, that
+    is closed together with this one.
+
+    """
+
+    def __init__(self, fobj):
+        """Wrap the given file-object.
+
+        fobj (fileobj): a writable binary file-like object receiving
+            the compressed data.
+
+        """
+        io.RawIOBase.__init__(self)
+
+        self._fobj = fobj
+        self._compressor = zlib.compressobj()
+
+    def writable(self):
+        """See IOBase.writable().
+
+        """
+        return True
+
+    def write(self, buf):
+        """See RawIOBase.write().
+
+        """
+        buf = memoryview(buf).tobytes()
+        data = self._compressor.compress(buf)
+        while len(data) > 0:
+            written = self._fobj.write(data)
+            if written is None:
+                break
+            data = data[written:]
+        return len(buf)
+
+    def close(self):
+        """See IOBase.close().
+
+        """
+        if self.closed:
+            return
+
+        try:
+            data = self._compressor.flush()
+            while len(data) > 0:
+                written = self._fobj.write(data)
+                if written is None:
+                    break
+                data = data[written:]
+        finally:
+            self._fobj.close()
+            io.RawIOBase.close(self)
+
+
+def _get_decompressed_size(fobj, chunk_size):
+    """Compute the size of the content of a compressed file.
+
+    fobj (fileobj): a _DecompressingReader; it will be closed.
+    chunk_size (int): how much data to decompress at once.
+
+    return (int): the size of the decompressed content, in bytes.
+
+    """
+    size = 0
+    with fobj:
+        buf = fobj.read(chunk_size)
+        while len(buf) > 0:
+            size += len(buf)
+            buf = fobj.read(chunk_size)
+    return size
+
+
+class _DecompressingReader(io.RawIOBase):
+    """A readable file-object that decompresses a zlib stream.
+
+    The compressed data is read lazily, in chunks, from another binary
+    file-object, that is closed together with this one.
+
+    """
+
+    def __init__(self, fobj, chunk_size=2 ** 14):
+        """Wrap the given file-object.
+
+        fobj (fileobj): a readable binary file-like object providing
+            the compressed data.
+        chunk_size (int): how much compressed data to read at once.
+
+        """
+        io.RawIOBase.__init__(self)
+
+        self._fobj = fobj
+        self._chunk_size = chunk_size
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b""
+
+    def readable(self):
+        """See IOBase.readable().
+
+        """
+        return True
+
+    def readinto(self, buf):
+        """See RawIOBase.readinto().
+
+        """
+        while len(self._buffer) == 0:
+            if self._decompressor is None:
+                return 0
+            data = self._fobj.read(self._chunk_size)
+            if len(data) > 0:
+                self._buffer = self._decompressor.decompress(data)
+            else:
+                self._buffer = self._decompressor.flush()
+                self._decompressor = None
+
+        length = min(len(buf), len(self._buffer))
+        buf[:length] = self._buffer[:length]
+        self._buffer = self._buffer[length:]
+        return length
+
+    def close(self):
+        """See IOBase.close().
+
+        """
+        if not self.closed:
+            self._fobj.close()
+        io.RawIOBase.close(self)
+
+
 class FSBackend(FileCacherBackend):
     """This class implements a backend for FileCacher that keeps all
     the files in a file system directory, named after their digest. Of
     course this directory can be shared, for example with NFS, acting
     as an actual remote file storage.
 
-    TODO: Actually store the descriptions, that get discarded at the
-    moment.
+    To alleviate the work of the file system driver, files are spread
+    over two levels of directories, named after the first two pairs of
+    characters of the digest (i.e., 'ROOT/ab/cd/abcdef...'). Files put
+    directly in the root (i.e., 'ROOT/abcdef...'), as older versions
+    of this backend did, are still found but never created.
 
-    TODO: Use an additional level of directories, to alleviate the
-    work of the file system driver (e.g., 'ROOT/a/abcdef...' instead
-    of 'ROOT/abcdef...'.
+    Files are written atomically (see _AtomicFile) and, when asked to,
+    compressed with zlib, in which case their name gets a '.z' suffix.
+    The two kinds of files can coexist, so compression can be turned
+    on or off at any time. Non-empty descriptions are stored in
+    separate files, with a '.desc' suffix.
 
     """
 
+    COMPRESSED_SUFFIX = ".z"
+    DESCRIPTION_SUFFIX = ".desc"
+
     def __init__(self, path):
         """Initialize the backend.
 
@@ -143,73 +442,187 @@ class FSBackend(FileCacherBackend):
 
         """
         self.path = path
+        self.temp_path = os.path.join(self.path, "_temp")
 
-        # Create the directory if it doesn't exist
+        # Create the directories if they don't exist
         try:
-            os.makedirs(self.path)
+            os.makedirs(self.temp_path)
         except OSError:
             pass
 
+    def _get_path(self, digest):
+        """Return the path where a file has to be stored.
+
+        digest (unicode): the digest of the file.
+
+        return (string): the path of the file in the storage, without
+            the suffix telling whether it is compressed.
+
+        """
+        return os.path.join(self.path, digest[0:2], digest[2:4], digest)
+
+    def _find(self, digest):
+        """Look up a file in the storage.
+
+        digest (unicode): the digest of the file to look up.
+
+        return ((string, bool)): the path of the file and whether it
+            is compressed.
+
+        raise (KeyError): if the file cannot be found.
+
+        """
+        file_path = self._get_path(digest)
+        for candidate, compressed in [
+                (file_path, False),
+                (file_path + self.COMPRESSED_SUFFIX, True),
+                (os.path.join(self.path, digest), False)]:
+            if os.path.isfile(candidate):
+                return candidate, compressed
+
+        raise KeyError("File not found.")
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
         """
-        file_path = os.path.join(self.path, digest)
+        file_path, compressed = self._find(digest)
+
+        fobj = io.open(file_path, 'rb')
+        if compressed:
+            return _DecompressingReader(fobj)
+        return fobj
+
+    def _prepare(self, digest, desc, compress):
+        """Get ready to store a file, unless it's already stored.
+
+        Create the directories the file goes in and store its
+        description.
+
+        digest (unicode): the digest of the file to store.
+        desc (unicode): the description of the file.
+        compress (bool): whether the file will be compressed.
+
+        return (string|None): the path where the file has to be
+            written, or None if it is already stored.
+
+        """
+        if self.exists(digest):
+            return None
+
+        file_path = self._get_path(digest)
+        try:
+            os.makedirs(os.path.dirname(file_path))
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
 
-        if not os.path.exists(file_path):
-            raise KeyError("File not found.")
+        if len(desc) > 0:
+            with _AtomicFile(file_path + self.DESCRIPTION_SUFFIX,
+                             self.temp_path) as fobj:
+                fobj.write(desc.encode("utf-8"))
 
-        return io.open(file_path, 'rb')
+        if compress:
+            file_path += self.COMPRESSED_SUFFIX
+        return file_path
 
-    def put_file(self, digest, desc=""):
+    def put_file(self, digest, desc="", compress=False):
         """See FileCacherBackend.put_file().
 
         """
-        file_path = os.path.join(self.path, digest)
+        file_path = self._prepare(digest, desc, compress)
 
-        if os.path.exists(file_path):
+        if file_path is None:
             return None
 
-        return io.open(file_path, 'wb')
+        return _AtomicFile(file_path, self.temp_path, digest, compress)
+
+    def put_file_from_path(self, digest, path, desc="", compress=False):
+        """See FileCacherBackend.put_file_from_path().
+
+        As the content is trusted, it is not hashed again.
+
+        """
+        file_path = self._prepare(digest, desc, compress)
+
+        if file_path is None:
+            return
+
+        with _AtomicFile(file_path, self.temp_path,
+                         compress=compress) as dst:
+            with io.open(path, 'rb') as src:
+                copyfileobj(src, dst, FileCacher.CHUNK_SIZE)
+
+    def exists(self, digest):
+        """See FileCacherBackend.exists().
+
+        """
+        try:
+            self._find(digest)
+        except KeyError:
+            return False
+        return True
 
     def describe(self, digest):
         """See FileCacherBackend.describe().
 
         """
-        file_path = os.path.join(self.path, digest)
+        self._find(digest)
 
-        if not os.path.exists(file_path):
-            raise KeyError("File not found.")
-
-        return ""
+        try:
+            with io.open(self._get_path(digest) + self.DESCRIPTION_SUFFIX,
+                         'rt', encoding="utf-8") as fobj:
+                return fobj.read()
+        except IOError:
+            return ""
 
     def get_size(self, digest):
         """See FileCacherBackend.get_size().
 
+        The size of compressed files isn't stored anywhere, so it has
+        to be computed by decompressing them.
+
         """
-        file_path = os.path.join(self.path, digest)
+        file_path, compressed = self._find(digest)
 
-        if not os.path.exists(file_path):
-            raise KeyError("File not found.")
+        if not compressed:
+            return os.stat(file_path).st_size
 
-        return os.stat(file_path).st_size
+        return _get_decompressed_size(self.get_file(digest),
+                                      FileCacher.CHUNK_SIZE)
 
     def delete(self, digest):
         """See FileCacherBackend.delete().
 
         """
-        file_path = os.path.join(self.path, digest)
+        file_path = self._get_path(digest)
 
-        try:
-            os.unlink(file_path)
-        except OSError:
-            pass
+        for path in [file_path,
+                     file_path + self.COMPRESSED_SUFFIX,
+                     file_path + self.DESCRIPTION_SUFFIX,
+                     os.path.join(self.path, digest)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
     def list(self):
         """See FileCacherBackend.list().
 
         """
-        return list((x, "") for x in os.listdir(self.path))
+        digests = set()
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            # Don't descend in the directory for temporary files.
+            if dirpath == self.path and "_temp" in dirnames:
+                dirnames.remove("_temp")
+            for filename in filenames:
+                if filename.endswith(self.DESCRIPTION_SUFFIX):
+                    continue
+                if filename.endswith(self.COMPRESSED_SUFFIX):
+                    filename = filename[:-len(self.COMPRESSED_SUFFIX)]
+                digests.add(filename)
+
+        return list((digest, self.describe(digest)) for digest in digests)
 
 
 class DBBackend(FileCacherBackend):
@@ -217,6 +630,9 @@ class DBBackend(FileCacherBackend):
     stores the files as lobjects (encapsuled in a FSObject) into a
     PostgreSQL database.
 
+    Files can be stored compressed with zlib: this is recorded in the
+    FSObject and they are decompressed on the fly when read.
+
     """
 
     def get_file(self, digest):
@@ -229,9 +645,11 @@ class DBBackend(FileCacherBackend):
             if fso is None:
                 raise KeyError("File not found.")
 
+            if fso.compressed:
+                return _DecompressingReader(fso.get_lobject(mode='rb'))
             return fso.get_lobject(mode='rb')
 
-    def put_file(self, digest, desc=""):
+    def put_file(self, digest, desc="", compress=False):
         """See FileCacherBackend.put_file().
 
         """
@@ -249,7 +667,7 @@ class DBBackend(FileCacherBackend):
                 # If it is not already present, copy the file into the
                 # lobject
                 else:
-                    fso = FSObject(description=desc)
+                    fso = FSObject(description=desc, compressed=compress)
                     fso.digest = digest
 
                     session.add(fso)
@@ -265,12 +683,21 @@ class DBBackend(FileCacherBackend):
 
                     session.commit()
 
+                    if compress:
+                        return _CompressingWriter(lobject)
                     return lobject
 
         except IntegrityError:
             logger.warning("File %s caused an IntegrityError, ignoring..." %
                            digest)
 
+    def exists(self, digest):
+        """See FileCacherBackend.exists().
+
+        """
+        with SessionGen() as session:
+            return FSObject.get_from_digest(digest, session) is not None
+
     def describe(self, digest):
         """See FileCacherBackend.describe().
 
@@ -295,6 +722,11 @@ class DBBackend(FileCacherBackend):
             if fso is None:
                 raise KeyError("File not found.")
 
+            if fso.compressed:
+                return _get_decompressed_size(
+                    _DecompressingReader(fso.get_lobject(mode='rb')),
+                    FileCacher.CHUNK_SIZE)
+
             with fso.get_lobject(mode='rb') as lobj:
                 return lobj.seek(0, io.SEEK_END)
 
@@ -348,9 +780,12 @@ class NullBackend(FileCacherBackend):
     def get_file(self, digest):
         raise KeyError("File not found.")
 
-    def put_file(self, digest, desc=""):
+    def put_file(self, digest, desc="", compress=False):
         return None
 
+    def exists(self, digest):
+        return False
+
     def describe(self, digest):
         raise KeyError("File not found.")
 
@@ -387,8 +822,10 @@ class FileCacher(object):
     def __init__(self, service=None, path=None, null=False):
         """Initialize.
 
-        By default the database-powered backend will be used, but this
-        can be changed using the parameters.
+        By default the backend is chosen according to the configuration
+        (the file system-based one if file_storage_path is set, the
+        database-powered one otherwise), but this can be changed using
+        the parameters.
 
         service (Service): the service we are running for. Only used to
             determine the location of the file-system cache (and to
@@ -404,6 +841,9 @@ class FileCacher(object):
         """
         self.service = service
 
+        if path is None:
+            path = config.file_storage_path
+
         if null:
             self.backend = NullBackend()
         elif path is None:
@@ -536,31 +976,56 @@ class FileCacher(object):
             with io.open(dst_path, 'wb') as dst:
                 copyfileobj(src, dst, self.CHUNK_SIZE)
 
+    def should_compress(self, path):
+        """Tell whether a file is worth storing compressed.
+
+        Compression has to be enabled in the configuration and the file
+        has to be large enough. Moreover, to skip files that are
+        already compressed or that anyway don't compress well (e.g.,
+        most executables), a sample from its beginning is compressed
+        and the ratio is checked.
+
+        path (string): the location of the file on the file-system.
+
+        return (bool): whether the file should be compressed.
+
+        """
+        if not config.file_storage_compress:
+            return False
+
+        if os.stat(path).st_size < config.file_storage_compress_min_size:
+            return False
+
+        with io.open(path, 'rb') as fobj:
+            sample = fobj.read(self.CHUNK_SIZE)
+        compressed_size = len(zlib.compress(sample, 1))
+        return compressed_size <= \
+            len(sample) * config.file_storage_compress_max_ratio
+
     def save(self, digest, desc=""):
         """Save the file with the given digest into the backend.
 
         Use to local copy, available in the file-system cache, to store
-        the file in the backend, if it's not already there.
+        the file in the backend, if it's not already there. The file is
+        compressed if should_compress() says it's worth it.
 
         digest (unicode): the digest of the file to load.
         desc (unicode): the (optional) description to associate to the
             file.
 
         """
-        cache_file_path = os.path.join(self.file_dir, digest)
-
-        fobj = self.backend.put_file(digest, desc)
-
-        if fobj is None:
+        if self.backend.exists(digest):
+            logger.debug("File %s already stored in the backend, not "
+                         "sending it again." % digest)
             return
 
-        try:
-            with io.open(cache_file_path, 'rb') as src:
-                copyfileobj(src, fobj, self.CHUNK_SIZE)
-        finally:
-            fobj.close()
+        cache_file_path = os.path.join(self.file_dir, digest)
 
-    def put_file_from_fobj(self, src, desc=""):
+        self.backend.put_file_from_path(
+            digest, cache_file_path, desc,
+            self.should_compress(cache_file_path))
+
+    def put_file_from_fobj(self, src, desc="", digest=None):
         """Store a file in the storage.
 
         If it's already (for some reason...) in the cache send that
@@ -574,21 +1039,35 @@ class FileCacher(object):
             to read the contents of the file.
         desc (unicode): the (optional) description to associate to the
             file.
+        digest (unicode|None): the digest of the file, if the caller
+            already knows it. In that case, if the backend already has
+            the file, its content isn't even read; otherwise the digest
+            is checked against the content.
 
         return (unicode): the digest of the stored file.
 
+        raise (ValueError): if the given digest doesn't match the one
+            of the content.
+
         """
+        if digest is not None and self.backend.exists(digest):
+            logger.debug("File %s already stored in the backend, not "
+                         "reading it." % digest)
+            return digest
+
         logger.debug("Reading input file to store on the database.")
 
+        expected_digest = digest
+
         # Unfortunately, we have to read the whole file-obj to compute
         # the digest but we take that chance to save it to a temporary
-        # path so that we then just need to move it. Hoping that both
-        # locations will be on the same filesystem, that should be way
-        # faster than reading the whole file-obj again (as it could be
-        # compressed or require network communication).
+        # path in the cache directory so that we then just need to
+        # rename it, which is way faster than reading the whole
+        # file-obj again (as it could be compressed or require network
+        # communication).
         # XXX We're *almost* reimplementing copyfileobj.
         with tempfile.NamedTemporaryFile('wb', delete=False,
-                                         dir=config.temp_dir) as dst:
+                                         dir=self.temp_dir) as dst:
             hasher = hashlib.sha1()
             buf = src.read(self.CHUNK_SIZE)
             while len(buf) > 0:
@@ -606,10 +1085,15 @@ class FileCacher(object):
 
             logger.debug("File has digest %s." % digest)
 
+            if expected_digest is not None and digest != expected_digest:
+                os.unlink(dst.name)
+                raise ValueError("File with hash %s actually has hash %s." %
+                                 (expected_digest, digest))
+
             cache_file_path = os.path.join(self.file_dir, digest)
 
             if not os.path.exists(cache_file_path):
-                move(dst.name, cache_file_path)
+                os.rename(dst.name, cache_file_path)
             else:
                 os.unlink(dst.name)
 
@@ -621,7 +1105,7 @@ class FileCacher(object):
 
         return digest
 
-    def put_file_content(self, content, desc=""):
+    def put_file_content(self, content, desc="", digest=None):
         """Store a file in the storage.
 
         See `put_file_from_fobj'. This method will read the content of
@@ -630,14 +1114,15 @@ class FileCacher(object):
         content (bytes): the content of the file to store.
         desc (unicode): the (optional) description to associate to the
             file.
+        digest (unicode|None): see `put_file_from_fobj'.
 
         return (unicode): the digest of the stored file.
 
         """
         with io.BytesIO(content) as src:
-            return self.put_file_from_fobj(src, desc)
+            return self.put_file_from_fobj(src, desc, digest)
 
-    def put_file_from_path(self, src_path, desc=""):
+    def put_file_from_path(self, src_path, desc="", digest=None):
         """Store a file in the storage.
 
         See `put_file_from_fobj'. This method will read the content of
@@ -647,12 +1132,13 @@ class FileCacher(object):
             from which to read the contents of the file.
         desc (unicode): the (optional) description to associate to the
             file.
+        digest (unicode|None): see `put_file_from_fobj'.
 
         return (unicode): the digest of the stored file.
 
         """
         with io.open(src_path, 'rb') as src:
-            return self.put_file_from_fobj(src, desc)
+            return self.put_file_from_fobj(src, desc, digest)
 
     def describe(self, digest):
         """Return the description of a file given its digest.
@@ -706,7 +1192,8 @@ class FileCacher(object):
 
         """
         self.destroy_cache()
-        if not mkdir(config.cache_dir) or not mkdir(self.file_dir):
+        if not mkdir(config.cache_dir) or not mkdir(self.file_dir) \
+                or not mkdir(self.temp_dir):
             logger.error("Cannot create necessary directories.")
             raise RuntimeError("Cannot create necessary directories.")
 
@@ -728,37 +1215,145 @@ class FileCacher(object):
         """
         return self.backend.list()
 
-    def check_backend_integrity(self, delete=False):
-        """Check the integrity of the backend.
+    def _compute_digest(self, digest, cooperative=True):
+        """Recompute the digest of a file in the backend.
+
+        digest (unicode): the digest the file is stored with.
+        cooperative (bool): whether to yield to the other greenlets
+            after each chunk; False if running in another thread.
+
+        return (unicode): the digest of its actual content.
+
+        raise (KeyError): if the file cannot be found.
+
+        """
+        fobj = self.backend.get_file(digest)
+        hasher = hashlib.sha1()
+        try:
+            buf = fobj.read(self.CHUNK_SIZE)
+            while len(buf) > 0:
+                hasher.update(buf)
+                if cooperative:
+                    # Cooperative yield.
+                    gevent.sleep(0)
+                buf = fobj.read(self.CHUNK_SIZE)
+        finally:
+            fobj.close()
+        return hasher.hexdigest().decode("ascii")
+
+    def find_corrupt_files(self, delete=False, concurrency=1,
+                           checkpoint_path=None):
+        """Find the files in the backend whose content is corrupt.
 
         Request all the files from the backend. For each of them the
         digest is recomputed and checked against the one recorded in
-        the backend.
+        the backend. Up to concurrency files are checked at the same
+        time, each in its own greenlet, so that the time spent waiting
+        for the backend overlaps. Reading and hashing the files of a
+        FSBackend blocks, so for it they are done in a pool of as many
+        threads (which run in parallel, as both release the GIL).
+
+        If a checkpoint path is given, the outcome for each file is
+        appended to it as soon as it's known, and the files already
+        listed there are not checked again: this way an interrupted
+        check can be resumed by running it again with the same path.
 
-        If mismatches are found, they are reported with ERROR
-        severity. The method returns False if at least a mismatch is
-        found, True otherwise.
+        Mismatches are reported with ERROR severity.
 
         delete (bool): if True, files with wrong digest are deleted.
+        concurrency (int): how many files to check at the same time.
+        checkpoint_path (string|None): the file recording the progress.
+
+        return ([unicode]): the digests of the corrupt files (including
+            those found in a previous run, according to the
+            checkpoint).
 
         """
-        clean = True
-        for digest, description in self.list():
-            fobj = self.backend.get_file(digest)
-            hasher = hashlib.sha1()
+        checked = dict()
+        # Whether the checkpoint ends with a complete line.
+        complete = True
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            with io.open(checkpoint_path, 'rt', encoding='ascii') as fobj:
+                for line in fobj:
+                    # The last line may have been left truncated by a
+                    # crash: the file is then checked again.
+                    complete = line.endswith("\n")
+                    fields = line.split()
+                    if not complete or len(fields) != 2 or \
+                            fields[1] not in ("ok", "corrupt"):
+                        continue
+                    checked[fields[0]] = fields[1]
+            logger.info("Resuming from checkpoint, %d files already "
+                        "checked." % len(checked))
+
+        corrupt = list(digest for digest, status in checked.iteritems()
+                       if status == "corrupt")
+        stats = {"checked": len(checked)}
+
+        checkpoint = None
+        if checkpoint_path is not None:
+            checkpoint = io.open(checkpoint_path, 'at', encoding='ascii')
+            if not complete:
+                checkpoint.write("\n")
+
+        threads = None
+        if isinstance(self.backend, FSBackend):
+            threads = gevent.threadpool.ThreadPool(concurrency)
+
+        def check(digest):
             try:
-                buf = fobj.read(self.CHUNK_SIZE)
-                while len(buf) > 0:
-                    hasher.update(buf)
-                    buf = fobj.read(self.CHUNK_SIZE)
-            finally:
-                fobj.close()
-            computed_digest = hasher.hexdigest().decode("ascii")
-            if digest != computed_digest:
+                if threads is not None:
+                    computed_digest = threads.apply(
+                        self._compute_digest, (digest, False))
+                else:
+                    computed_digest = self._compute_digest(digest)
+            except KeyError:
+                # The file was deleted in the meantime.
+                return
+
+            if computed_digest != digest:
                 logger.error("File with hash %s actually has hash %s" %
                              (digest, computed_digest))
                 if delete:
                     self.delete(digest)
-                clean = False
+                corrupt.append(digest)
+
+            if checkpoint is not None:
+                checkpoint.write("%s %s\n" % (
+                    digest, "ok" if computed_digest == digest else "corrupt"))
+                checkpoint.flush()
+
+            stats["checked"] += 1
+            if stats["checked"] % 1000 == 0:
+                logger.info("%d files checked." % stats["checked"])
+
+        pool = gevent.pool.Pool(concurrency)
+        try:
+            for digest, unused_description in self.list():
+                if digest not in checked:
+                    pool.spawn(check, digest)
+            pool.join(raise_error=True)
+        finally:
+            pool.kill()
+            if threads is not None:
+                threads.kill()
+            if checkpoint is not None:
+                checkpoint.close()
 
-        return clean
+        return corrupt
+
+    def check_backend_integrity(self, delete=False, concurrency=1,
+                                checkpoint_path=None):
+        """Check the integrity of the backend.
+
+        See find_corrupt_files(), that does the actual work. The method
+        returns False if at least a mismatch is found, True otherwise.
+
+        delete (bool): if True, files with wrong digest are deleted.
+        concurrency (int): how many files to check at the same time.
+        checkpoint_path (string|None): the file recording the progress,
+            to resume an interrupted check.
+
+        """
+        return len(self.find_corrupt_files(
+            delete, concurrency, checkpoint_path)) == 0
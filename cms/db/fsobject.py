@@ -33,7 +33,7 @@ import io
 import six
 
 from sqlalchemy.schema import Column
-from sqlalchemy.types import Integer, String, Unicode
+from sqlalchemy.types import Boolean, Integer, String, Unicode
 
 import psycopg2
 import psycopg2.extensions
@@ -371,6 +371,13 @@ class FSObject(Base):
         Unicode,
         nullable=True)
 
+    # Whether the content of the large object is compressed with zlib
+    # (the digest is always the one of the uncompressed content)
+    compressed = Column(
+        Boolean,
+        nullable=False,
+        default=False)
+
     def get_lobject(self, mode='rb'):
         """Return an open file bound to the represented large object.
 
@@ -31,7 +31,8 @@ from __future__ import unicode_literals
 
 from sqlalchemy.schema import Column, ForeignKey, ForeignKeyConstraint, \
     UniqueConstraint
-from sqlalchemy.types import Integer, Float, String, Unicode, DateTime
+from sqlalchemy.types import Boolean, Integer, Float, String, Unicode, \
+    DateTime
 from sqlalchemy.orm import relationship, backref
 
 from . import Base, User, Task, Dataset, Testcase
@@ -622,3 +623,51 @@ class Evaluation(Base):
     def codename(self):
         """Return the codename of the testcase."""
         return self.testcase.codename
+
+
+class TaskScore(Base):
+    """Class to store the score of a user on a task.
+
+    It is derived from the submissions of the user on the task and
+    from their results on the active dataset (see
+    cms.grading.task_score), and it's kept up to date by
+    cms.grading.update_task_scores, so that rankings can be built
+    without loading all the submissions.
+
+    """
+    __tablename__ = 'task_scores'
+
+    # Primary key is (user_id, task_id).
+    user_id = Column(
+        Integer,
+        ForeignKey(User.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True)
+    user = relationship(
+        User,
+        backref=backref(
+            "task_scores",
+            cascade="all, delete-orphan",
+            passive_deletes=True))
+
+    task_id = Column(
+        Integer,
+        ForeignKey(Task.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+        index=True)
+    task = relationship(
+        Task,
+        backref=backref(
+            "task_scores",
+            cascade="all, delete-orphan",
+            passive_deletes=True))
+
+    # The score, and whether it could change because of a submission
+    # yet to score.
+    score = Column(
+        Float,
+        nullable=False)
+    partial = Column(
+        Boolean,
+        nullable=False)
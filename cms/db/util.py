@@ -30,7 +30,27 @@ from __future__ import unicode_literals
 
 import sys
 
-from . import SessionGen, Contest
+from . import SessionGen, Contest, Statement, Attachment, Manager, \
+    Testcase, File, Executable, UserTest, UserTestFile, UserTestManager, \
+    UserTestResult, UserTestExecutable
+
+
+# The columns that hold the digests of files in the storage, as pairs
+# of class and attribute name.
+FILE_COLUMNS = [
+    (Statement, "digest"),
+    (Attachment, "digest"),
+    (Manager, "digest"),
+    (Testcase, "input"),
+    (Testcase, "output"),
+    (File, "digest"),
+    (Executable, "digest"),
+    (UserTest, "input"),
+    (UserTestFile, "digest"),
+    (UserTestManager, "digest"),
+    (UserTestResult, "output"),
+    (UserTestExecutable, "digest"),
+]
 
 
 def get_contest_list(session=None):
@@ -110,3 +130,46 @@ def ask_for_contest(skip=None):
             sys.exit(1)
 
     return contest_id
+
+
+def enumerate_referenced_files(session):
+    """Return the digests of all the files referenced in the database.
+
+    session (Session): the session to use.
+
+    return (set): the digests referenced by at least an object.
+
+    """
+    digests = set()
+    for cls, attr in FILE_COLUMNS:
+        column = getattr(cls, attr)
+        digests.update(digest for digest, in session.query(column)
+                       .filter(column.isnot(None)).distinct())
+    return digests
+
+
+def get_file_references(digests, session):
+    """Find the objects that reference the given files.
+
+    digests ([unicode]): the digests to look up.
+    session (Session): the session to use.
+
+    return ({unicode: [unicode]}): for each digest, a description of
+        each object referencing it (e.g., "Testcase 42 (input)").
+
+    """
+    digests = list(digests)
+    references = dict((digest, []) for digest in digests)
+
+    # Don't put too many values in a single IN clause.
+    chunk_size = 1000
+    for cls, attr in FILE_COLUMNS:
+        column = getattr(cls, attr)
+        for i in xrange(0, len(digests), chunk_size):
+            chunk = digests[i:i + chunk_size]
+            for obj_id, digest in session.query(cls.id, column)\
+                    .filter(column.in_(chunk)):
+                references[digest].append(
+                    "%s %d (%s)" % (cls.__name__, obj_id, attr))
+
+    return references
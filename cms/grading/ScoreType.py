@@ -36,9 +36,12 @@ from __future__ import unicode_literals
 
 import json
 import logging
+from array import array
 
 from tornado.template import Template
 
+from cms.util import LRUCache
+
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +51,110 @@ def N_(message):
     return message
 
 
+# The latest score details decoded by decode_details, indexed by their
+# JSON encoding, up to a total length of the encodings of 16 MiB.
+_decoded_details = LRUCache(16 * 1024 * 1024,
+                            weigh=lambda details, decoded: len(details))
+
+
+def decode_details(details):
+    """Decode a JSON-encoded field of a SubmissionResult.
+
+    The details of the results are decoded each time they are shown
+    or sent to the rankings, and many results have exactly the same
+    details, so the decoded values are cached. They are shared between
+    callers, which must not modify them.
+
+    details (str): the JSON-encoded details, e.g., score_details or
+        ranking_score_details.
+
+    return (object): the decoded details.
+
+    raise (TypeError): if details is None.
+    raise (ValueError): if details is not valid JSON.
+
+    """
+    decoded = _decoded_details.get(details)
+    if decoded is None:
+        decoded = json.loads(details)
+        _decoded_details.put(details, decoded)
+    return decoded
+
+
+class OutcomeMatrix(object):
+    """The outcomes of many submission results on the testcases of a
+    dataset, in a compact form suitable for scoring them in bulk.
+
+    Row i is about the result of the submission submission_ids[i]:
+    outcomes[i] is an array with its outcome on each testcase (in the
+    order of codenames, i.e., the lexicographical one used by the score
+    types) and evaluations[i] the list of the (text, execution time,
+    execution memory) of each of them, needed to build the details.
+    Both are None if the result was not evaluated (i.e., if its
+    compilation failed).
+
+    """
+    def __init__(self, codenames):
+        """Initializer.
+
+        codenames ([unicode]): the codenames of the testcases.
+
+        """
+        self.codenames = sorted(codenames)
+        self._columns = dict((codename, i)
+                             for i, codename in enumerate(self.codenames))
+        self.submission_ids = list()
+        self.outcomes = list()
+        self.evaluations = list()
+
+    def __len__(self):
+        return len(self.submission_ids)
+
+    def add_row(self, submission_id, evaluations):
+        """Add the result of a submission.
+
+        submission_id (int): the id of the submission.
+        evaluations ([(unicode, unicode, string, float, int)]|None):
+            the codename, outcome, text, execution time and execution
+            memory of each evaluation, or None if the result was not
+            evaluated.
+
+        raise (KeyError): if there is no evaluation on a testcase.
+
+        """
+        if evaluations is None:
+            outcomes = None
+            infos = None
+        else:
+            outcomes = array(b"d", [0.0]) * len(self.codenames)
+            infos = [None] * len(self.codenames)
+            for codename, outcome, text, time_, memory in evaluations:
+                column = self._columns.get(codename)
+                if column is None:
+                    continue
+                outcomes[column] = float(outcome)
+                infos[column] = (text, time_, memory)
+            if None in infos:
+                raise KeyError(self.codenames[infos.index(None)])
+        self.submission_ids.append(submission_id)
+        self.outcomes.append(outcomes)
+        self.evaluations.append(infos)
+
+    def add_submission_result(self, submission_result):
+        """Add a submission result.
+
+        submission_result (SubmissionResult): the result, with its
+            evaluations if it was evaluated.
+
+        """
+        evaluations = None
+        if submission_result.evaluated():
+            evaluations = [(ev.codename, ev.outcome, ev.text,
+                            ev.execution_time, ev.execution_memory)
+                           for ev in submission_result.evaluations]
+        self.add_row(submission_result.submission_id, evaluations)
+
+
 class ScoreType(object):
     """Base class for all score types, that must implement all methods
     defined here.
@@ -55,6 +162,16 @@ class ScoreType(object):
     """
     TEMPLATE = ""
 
+    # The compiled TEMPLATE of each class.
+    _compiled_templates = dict()
+
+    # The latest HTML strings returned by get_html_details, indexed by
+    # class, score details and locale code, up to a total length (of
+    # the details and the HTML) of 32 MiB.
+    _html_cache = LRUCache(
+        32 * 1024 * 1024,
+        weigh=lambda key, html: len(key[1]) + len(html))
+
     def __init__(self, parameters, public_testcases):
         """Initializer.
 
@@ -71,29 +188,57 @@ class ScoreType(object):
         self.max_score, self.max_public_score, self.ranking_headers = \
             self.max_scores()
 
-    def get_html_details(self, score_details, translator=None):
+    @classmethod
+    def get_template(cls):
+        """Return the compiled TEMPLATE of this class.
+
+        return (Template): the template, compiled at the first call.
+
+        """
+        template = ScoreType._compiled_templates.get(cls)
+        if template is None:
+            template = Template(cls.TEMPLATE)
+            ScoreType._compiled_templates[cls] = template
+        return template
+
+    def get_html_details(self, score_details, translator=None,
+                         locale_code=None):
         """Return an HTML string representing the score details of a
         submission.
 
+        The result is cached, unless a translator is given without the
+        code of its locale.
+
         score_details (dict): the data saved by the score type itself
                               in the database; can be public or
                               private.
         translator (function): the function to localize strings.
+        locale_code (unicode|None): the code of the locale of
+            translator, if any.
         return (string): an HTML string representing score_details.
 
         """
+        key = None
+        if translator is None or locale_code is not None:
+            key = (self.__class__, score_details, locale_code)
+            html = ScoreType._html_cache.get(key)
+            if html is not None:
+                return html
+
         if translator is None:
             translator = lambda string: string
         try:
-            score_details = json.loads(score_details)
+            details = decode_details(score_details)
         except (TypeError, ValueError):
             # TypeError raised if score_details is None
             logger.error("Found a null or non-JSON score details string. "
                          "Try invalidating scores.")
             return translator("Score details temporarily unavailable.")
-        else:
-            return Template(self.TEMPLATE).generate(details=score_details,
-                                                    _=translator)
+
+        html = self.get_template().generate(details=details, _=translator)
+        if key is not None:
+            ScoreType._html_cache.put(key, html)
+        return html
 
     def max_scores(self):
         """Returns the maximum score that one could aim to in this
@@ -123,6 +268,26 @@ class ScoreType(object):
         logger.error("Unimplemented method compute_score.")
         raise NotImplementedError("Please subclass this class.")
 
+    def compute_scores(self, matrix):
+        """Compute the scores of many submission results at once.
+
+        Score types that can do it work on the outcomes alone, that are
+        much cheaper to gather than the SubmissionResult objects; the
+        others don't override this method, and their results have to be
+        scored one by one with compute_score.
+
+        matrix (OutcomeMatrix): the outcomes of the results.
+
+        return ([(float, str, float, str, str)]): for each row of the
+            matrix, the same values that compute_score returns.
+
+        raise (NotImplementedError): if the score type doesn't support
+            it.
+
+        """
+        raise NotImplementedError("Score type %s can't compute scores in "
+                                  "bulk." % self.__class__.__name__)
+
 
 class ScoreTypeAlone(ScoreType):
     """Intermediate class to manage tasks where the score of a
@@ -260,78 +425,96 @@ class ScoreTypeGroup(ScoreTypeAlone):
     def compute_score(self, submission_result):
         """Compute the score of a submission.
 
-        submission_id (int): the submission to evaluate.
-        returns (float): the score
+        See the same method in ScoreType for details.
 
         """
-        # Actually, this means it didn't even compile!
-        if not submission_result.evaluated():
-            return 0.0, "[]", 0.0, "[]", \
-                json.dumps(["%lg" % 0.0 for _ in self.parameters])
+        matrix = OutcomeMatrix(self.public_testcases.keys())
+        matrix.add_submission_result(submission_result)
+        return self.compute_scores(matrix)[0]
 
-        # XXX Lexicographical order by codename
-        indices = sorted(self.public_testcases.keys())
-        evaluations = dict((ev.codename, ev)
-                           for ev in submission_result.evaluations)
-        subtasks = []
-        public_subtasks = []
-        ranking_details = []
+    def compute_scores(self, matrix):
+        """Compute the scores of many submission results at once.
+
+        Each subtask is reduced on all the results before moving to the
+        next one, computing the public outcome of each distinct outcome
+        only once.
+
+        See the same method in ScoreType for details.
+
+        """
+        rows = [i for i, outcomes in enumerate(matrix.outcomes)
+                if outcomes is not None]
+        subtasks = dict((i, []) for i in rows)
+        public_subtasks = dict((i, []) for i in rows)
+        ranking_details = dict((i, []) for i in rows)
         tc_start = 0
         tc_end = 0
 
         for st_idx, parameter in enumerate(self.parameters):
             tc_end = tc_start + parameter[1]
-            st_score = self.reduce([float(evaluations[idx].outcome)
-                                    for idx in indices[tc_start:tc_end]],
-                                   parameter) * parameter[0]
-            st_public = all(self.public_testcases[idx]
-                            for idx in indices[tc_start:tc_end])
-            tc_outcomes = dict((
-                idx,
-                self.get_public_outcome(
-                    float(evaluations[idx].outcome), parameter)
-                ) for idx in indices[tc_start:tc_end])
-
-            testcases = []
-            public_testcases = []
-            for idx in indices[tc_start:tc_end]:
-                testcases.append({
-                    "idx": idx,
-                    "outcome": tc_outcomes[idx],
-                    "text": evaluations[idx].text,
-                    "time": evaluations[idx].execution_time,
-                    "memory": evaluations[idx].execution_memory,
-                    })
-                if self.public_testcases[idx]:
-                    public_testcases.append(testcases[-1])
-                else:
-                    public_testcases.append({"idx": idx})
-            subtasks.append({
-                "idx": st_idx + 1,
-                "score": st_score,
-                "max_score": parameter[0],
-                "testcases": testcases,
-                })
-            if st_public:
-                public_subtasks.append(subtasks[-1])
-            else:
-                public_subtasks.append({
+            indices = matrix.codenames[tc_start:tc_end]
+            st_public = all(self.public_testcases[idx] for idx in indices)
+            tc_public = [self.public_testcases[idx] for idx in indices]
+            public_outcomes = dict()
+
+            for i in rows:
+                outcomes = matrix.outcomes[i][tc_start:tc_end].tolist()
+                st_score = self.reduce(outcomes, parameter) * parameter[0]
+
+                testcases = []
+                public_testcases = []
+                for idx, outcome, public, (text, time_, memory) in zip(
+                        indices, outcomes, tc_public,
+                        matrix.evaluations[i][tc_start:tc_end]):
+                    if outcome not in public_outcomes:
+                        public_outcomes[outcome] = \
+                            self.get_public_outcome(outcome, parameter)
+                    testcases.append({
+                        "idx": idx,
+                        "outcome": public_outcomes[outcome],
+                        "text": text,
+                        "time": time_,
+                        "memory": memory,
+                        })
+                    if public:
+                        public_testcases.append(testcases[-1])
+                    else:
+                        public_testcases.append({"idx": idx})
+                subtasks[i].append({
                     "idx": st_idx + 1,
-                    "testcases": public_testcases,
+                    "score": st_score,
+                    "max_score": parameter[0],
+                    "testcases": testcases,
                     })
+                if st_public:
+                    public_subtasks[i].append(subtasks[i][-1])
+                else:
+                    public_subtasks[i].append({
+                        "idx": st_idx + 1,
+                        "testcases": public_testcases,
+                        })
 
-            ranking_details.append("%g" % round(st_score, 2))
+                ranking_details[i].append("%g" % round(st_score, 2))
 
             tc_start = tc_end
 
-        score = sum(st["score"] for st in subtasks)
-        public_score = sum(st["score"]
-                           for st in public_subtasks
-                           if "score" in st)
-
-        return score, json.dumps(subtasks), \
-            public_score, json.dumps(public_subtasks), \
-            json.dumps(ranking_details)
+        # Actually, this means it didn't even compile!
+        not_evaluated = (0.0, "[]", 0.0, "[]",
+                         json.dumps(["%lg" % 0.0 for _ in self.parameters]))
+
+        results = []
+        for i in xrange(len(matrix)):
+            if i not in subtasks:
+                results.append(not_evaluated)
+                continue
+            score = sum(st["score"] for st in subtasks[i])
+            public_score = sum(st["score"]
+                               for st in public_subtasks[i]
+                               if "score" in st)
+            results.append((score, json.dumps(subtasks[i]),
+                            public_score, json.dumps(public_subtasks[i]),
+                            json.dumps(ranking_details[i])))
+        return results
 
     def get_public_outcome(self, outcome, parameter):
         """Return a public outcome from an outcome.
@@ -32,10 +32,12 @@ import os
 
 from collections import namedtuple
 
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 
 from cms import LANG_C, LANG_CPP, LANG_PASCAL, LANG_PYTHON, LANG_PHP, LANG_JAVA
-from cms.db import Submission
+from cms.db import Submission, SubmissionResult, Task, TaskScore, Token
 from cms.grading.Sandbox import Sandbox
 
 
@@ -753,6 +755,32 @@ def task_score(user, task):
     # submission_results table.  Doing so means that this function should incur
     # no exta database queries.
 
+    submissions = [s for s in user.submissions if s.task is task]
+    results = list()
+    for s in submissions:
+        sr = s.get_result(task.active_dataset)
+        results.append((s.timestamp, s.tokened(),
+                        sr.score if sr is not None and sr.scored()
+                        else None))
+
+    return task_score_from_results(results)
+
+
+def task_score_from_results(results):
+    """Return the score of a user on a task, given their submissions.
+
+    results ([(datetime, bool, float|None)]): for each submission of
+        the user on the task, its timestamp, whether it was tokened and
+        the score of its result on the active dataset (None if it is
+        not scored yet).
+
+    return ((float, bool)): the score of the user on the task, and True
+        if the score could change because of a submission yet to score.
+
+    """
+    if len(results) == 0:
+        return 0.0, False
+
     # The score of the last submission (if valid, otherwise 0.0).
     last_score = 0.0
     # The maximum score amongst the tokened submissions (invalid
@@ -762,29 +790,165 @@ def task_score(user, task):
     # / evaluated / scored.
     partial = False
 
-    submissions = [s for s in user.submissions if s.task is task]
-    submissions.sort(key=lambda s: s.timestamp)
-
-    if submissions == []:
-        return 0.0, False
-
     # Last score: if the last submission is scored we use that,
     # otherwise we use 0.0 (and mark that the score is partial
     # when the last submission could be scored).
-    last_s = submissions[-1]
-    last_sr = last_s.get_result(task.active_dataset)
-
-    if last_sr is not None and last_sr.scored():
-        last_score = last_sr.score
-    else:
+    last = results[0]
+    for result in results[1:]:
+        if result[0] >= last[0]:
+            last = result
+    last_score = last[2]
+    if last_score is None:
+        last_score = 0.0
         partial = True
 
-    for s in submissions:
-        sr = s.get_result(task.active_dataset)
-        if s.tokened():
-            if sr is not None and sr.scored():
-                max_tokened_score = max(max_tokened_score, sr.score)
+    for _, tokened, score in results:
+        if tokened:
+            if score is not None:
+                max_tokened_score = max(max_tokened_score, score)
             else:
                 partial = True
 
     return max(last_score, max_tokened_score), partial
+
+
+def _load_task_results(session, task_id, user_ids=None):
+    """Load what task_score_from_results needs for some users on a task.
+
+    session (Session): the session to use.
+    task_id (int): the id of the task.
+    user_ids ([int]|None): the ids of the users, or None for all.
+
+    return ({int: [(datetime, bool, float|None)]}): the results on the
+        active dataset of the submissions of each user with at least
+        one, as task_score_from_results expects them.
+
+    """
+    active_dataset_id = session.query(Task.active_dataset_id)\
+        .filter(Task.id == task_id).scalar()
+    scored = and_(SubmissionResult.score.isnot(None),
+                  SubmissionResult.score_details.isnot(None),
+                  SubmissionResult.public_score.isnot(None),
+                  SubmissionResult.public_score_details.isnot(None),
+                  SubmissionResult.ranking_score_details.isnot(None))
+    submissions = session.query(Submission.user_id,
+                                Submission.timestamp,
+                                Token.id,
+                                SubmissionResult.score,
+                                scored)\
+        .outerjoin(Submission.token)\
+        .outerjoin(SubmissionResult,
+                   and_(SubmissionResult.submission_id == Submission.id,
+                        SubmissionResult.dataset_id == active_dataset_id))\
+        .filter(Submission.task_id == task_id)
+    if user_ids is not None:
+        submissions = submissions.filter(Submission.user_id.in_(user_ids))
+
+    results = dict()
+    for user_id, timestamp, token_id, score, is_scored in submissions:
+        results.setdefault(user_id, list()).append(
+            (timestamp, token_id is not None, score if is_scored else None))
+
+    return results
+
+
+def update_task_scores(session, task_id, user_ids=None):
+    """Compute again and store the scores of some users on a task.
+
+    To be called, in the same transaction, after anything that could
+    change them: a new submission, a token, a (re)scored or invalidated
+    result on the active dataset, a different active dataset. Only the
+    columns needed by task_score_from_results are loaded. Concurrent
+    updates of the same scores are serialized by locking their rows;
+    if another transaction inserted some of the missing ones in the
+    meantime, they are locked and the scores computed again, as the
+    other transaction couldn't see the changes of this one.
+
+    session (Session): the session to use.
+    task_id (int): the id of the task.
+    user_ids ([int]|None): the ids of the users, or None for all the
+        users with a score or a submission on the task.
+
+    """
+    scores = session.query(TaskScore)\
+        .filter(TaskScore.task_id == task_id)
+    if user_ids is not None:
+        scores = scores.filter(TaskScore.user_id.in_(user_ids))
+    scores = dict((task_score.user_id, task_score)
+                  for task_score in scores.with_for_update())
+
+    results = dict((user_id, list()) for user_id in scores)
+    for user_id in user_ids if user_ids is not None else []:
+        results[user_id] = list()
+    results.update(_load_task_results(session, task_id, user_ids))
+
+    new_scores = list()
+    for user_id, user_results in results.iteritems():
+        score, partial = task_score_from_results(user_results)
+        if user_id in scores:
+            scores[user_id].score = score
+            scores[user_id].partial = partial
+        else:
+            new_scores.append({"user_id": user_id, "task_id": task_id,
+                               "score": score, "partial": partial})
+
+    if len(new_scores) > 0:
+        try:
+            with session.begin_nested():
+                session.execute(TaskScore.__table__.insert(), new_scores)
+        except IntegrityError:
+            # The other transaction has committed (the insertion waits
+            # for it), so its rows can now be locked and updated.
+            logger.info("Scores of task %d inserted concurrently, "
+                        "updating them.", task_id)
+            update_task_scores(session, task_id,
+                               [new_score["user_id"]
+                                for new_score in new_scores])
+
+
+def get_task_scores(session, contest_id, store=True):
+    """Return the scores of all the users on all the tasks of a contest.
+
+    The scores that are missing although the user has a submission on
+    the task (e.g., because the contest has been imported) are computed
+    and, if store is True, stored first: the caller should then commit
+    the session. Otherwise nothing is written nor locked.
+
+    session (Session): the session to use.
+    contest_id (int): the id of the contest.
+    store (bool): whether to store the missing scores.
+
+    return ({(int, int): (float, bool)}): the score and the partial
+        flag of each user on each task (see task_score), indexed by
+        user id and task id; users without submissions on a task
+        may be missing, their score on it is (0.0, False).
+
+    """
+    missing = session.query(Submission.task_id, Submission.user_id)\
+        .join(Submission.task)\
+        .outerjoin(TaskScore,
+                   and_(TaskScore.task_id == Submission.task_id,
+                        TaskScore.user_id == Submission.user_id))\
+        .filter(Task.contest_id == contest_id)\
+        .filter(TaskScore.task_id.is_(None))\
+        .distinct().all()
+    missing_by_task = dict()
+    for task_id, user_id in missing:
+        missing_by_task.setdefault(task_id, list()).append(user_id)
+    if store:
+        for task_id, user_ids in missing_by_task.iteritems():
+            update_task_scores(session, task_id, user_ids)
+
+    scores = dict(((user_id, task_id), (score, partial))
+                  for user_id, task_id, score, partial in session.query(
+                      TaskScore.user_id, TaskScore.task_id,
+                      TaskScore.score, TaskScore.partial)
+                  .join(TaskScore.task)
+                  .filter(Task.contest_id == contest_id))
+    if not store:
+        for task_id, user_ids in missing_by_task.iteritems():
+            for user_id, user_results in _load_task_results(
+                    session, task_id, user_ids).iteritems():
+                scores[(user_id, task_id)] = \
+                    task_score_from_results(user_results)
+    return scores
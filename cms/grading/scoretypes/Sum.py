@@ -25,7 +25,7 @@ from __future__ import unicode_literals
 
 import json
 
-from cms.grading.ScoreType import ScoreTypeAlone
+from cms.grading.ScoreType import OutcomeMatrix, ScoreTypeAlone
 
 
 # Dummy function to mark translatable string.
@@ -113,39 +113,58 @@ class Sum(ScoreTypeAlone):
         See the same method in ScoreType for details.
 
         """
-        # Actually, this means it didn't even compile!
-        if not submission_result.evaluated():
-            return 0.0, "[]", 0.0, "[]", json.dumps([])
+        matrix = OutcomeMatrix(self.public_testcases.keys())
+        matrix.add_submission_result(submission_result)
+        return self.compute_scores(matrix)[0]
 
-        # XXX Lexicographical order by codename
-        indices = sorted(self.public_testcases.keys())
-        evaluations = dict((ev.codename, ev)
-                           for ev in submission_result.evaluations)
-        testcases = []
-        public_testcases = []
-        score = 0.0
-        public_score = 0.0
+    def compute_scores(self, matrix):
+        """Compute the scores of many submission results at once.
 
-        for idx in indices:
-            this_score = float(evaluations[idx].outcome) * self.parameters
-            tc_outcome = self.get_public_outcome(this_score)
-            score += this_score
-            testcases.append({
-                "idx": idx,
-                "outcome": tc_outcome,
-                "text": evaluations[idx].text,
-                "time": evaluations[idx].execution_time,
-                "memory": evaluations[idx].execution_memory,
-                })
-            if self.public_testcases[idx]:
-                public_score += this_score
-                public_testcases.append(testcases[-1])
-            else:
-                public_testcases.append({"idx": idx})
-
-        return score, json.dumps(testcases), \
-            public_score, json.dumps(public_testcases), \
-            json.dumps([])
+        See the same method in ScoreType for details.
+
+        """
+        # XXX Lexicographical order by codename
+        indices = matrix.codenames
+        tc_public = [self.public_testcases[idx] for idx in indices]
+        public_outcomes = dict()
+
+        results = []
+        for outcomes, evaluations in zip(matrix.outcomes,
+                                         matrix.evaluations):
+            # Actually, this means it didn't even compile!
+            if outcomes is None:
+                results.append((0.0, "[]", 0.0, "[]", json.dumps([])))
+                continue
+
+            testcases = []
+            public_testcases = []
+            score = 0.0
+            public_score = 0.0
+
+            for idx, outcome, public, (text, time_, memory) in zip(
+                    indices, outcomes, tc_public, evaluations):
+                this_score = outcome * self.parameters
+                if this_score not in public_outcomes:
+                    public_outcomes[this_score] = \
+                        self.get_public_outcome(this_score)
+                score += this_score
+                testcases.append({
+                    "idx": idx,
+                    "outcome": public_outcomes[this_score],
+                    "text": text,
+                    "time": time_,
+                    "memory": memory,
+                    })
+                if public:
+                    public_score += this_score
+                    public_testcases.append(testcases[-1])
+                else:
+                    public_testcases.append({"idx": idx})
+
+            results.append((score, json.dumps(testcases),
+                            public_score, json.dumps(public_testcases),
+                            json.dumps([])))
+        return results
 
     def get_public_outcome(self, outcome):
         """Return a public outcome from an outcome.
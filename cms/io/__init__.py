@@ -26,7 +26,8 @@ from __future__ import unicode_literals
 
 __all__ = [
     # rpc
-    "RPCError", "rpc_method", "RemoteServiceServer", "RemoteServiceClient",
+    "RPCError", "rpc_method", "chunked", "RemoteServiceServer",
+    "RemoteServiceClient",
     # service
     "Service",
     # web_rpc
@@ -38,7 +39,8 @@ __all__ = [
 
 # Instantiate or import these objects.
 
-from .rpc import RPCError, rpc_method, RemoteServiceServer, RemoteServiceClient
+from .rpc import RPCError, rpc_method, chunked, RemoteServiceServer, \
+    RemoteServiceClient
 from .service import Service
 from .web_rpc import RPCMiddleware
 from .web_service import WebService
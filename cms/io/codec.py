@@ -0,0 +1,195 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Serialization formats for the messages of the RPC protocol.
+
+A codec converts between Python objects and bytes. All codecs accept
+the same objects, i.e., those that can be represented in JSON: dicts
+with string keys, lists (and tuples, that become lists), strings
+(that become unicode), numbers, booleans and None.
+
+JSON is always available; msgpack, faster and more compact, is used
+if the msgpack package is installed with its C extension (its pure
+Python implementation is much slower than json, see
+cmstestsuite/BenchmarkRPCCodecs.py). Which one is used on a connection
+is negotiated during the RPC handshake.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec(object):
+    """Base class for the codecs.
+
+    """
+    # The name used to refer to the codec in the handshake.
+    name = None
+
+    def encode(self, obj):
+        """Serialize an object.
+
+        obj (object): the object to encode.
+
+        return (bytes): its serialization.
+
+        raise (TypeError, ValueError): if the object can't be encoded.
+
+        """
+        raise NotImplementedError("Please subclass this class.")
+
+    def decode(self, data):
+        """Deserialize an object.
+
+        data (bytes): the serialization of an object.
+
+        return (object): the object.
+
+        raise (ValueError): if the data isn't a valid serialization.
+
+        """
+        raise NotImplementedError("Please subclass this class.")
+
+
+class JSONCodec(Codec):
+    """Codec using JSON.
+
+    """
+    name = "json"
+
+    def encode(self, obj):
+        """See Codec.encode."""
+        return json.dumps(obj, encoding='utf-8')
+
+    def decode(self, data):
+        """See Codec.decode."""
+        return json.loads(data, encoding='utf-8')
+
+
+def _as_json(obj):
+    """Convert an object to what JSON would give back after encoding.
+
+    Byte strings are decoded from UTF-8, tuples become lists and keys
+    of dicts that are numbers, booleans or None become strings, as
+    json.dumps does. Other objects are left as they are.
+
+    obj (object): the object to convert.
+
+    return (object): the converted object.
+
+    raise (TypeError): if a key has a type JSON doesn't accept.
+    raise (ValueError): if a byte string isn't valid UTF-8.
+
+    """
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8')
+    if isinstance(obj, (list, tuple)):
+        return [_as_json(item) for item in obj]
+    if isinstance(obj, dict):
+        converted = dict()
+        for key, value in obj.iteritems():
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            elif isinstance(key, (int, long)):
+                key = unicode(key)
+            elif isinstance(key, float):
+                key = unicode(repr(key))
+            elif key is None:
+                key = "null"
+            elif not isinstance(key, unicode):
+                raise TypeError("Key %r is not a string." % (key,))
+            converted[key] = _as_json(value)
+        return converted
+    return obj
+
+
+def _check_keys(pairs):
+    """Fail if a map decoded by msgpack has a key that isn't a string.
+
+    pairs ([(object, object)]): the items of the map.
+
+    raise (TypeError): if a key isn't unicode.
+
+    """
+    for key, _ in pairs:
+        if type(key) is not unicode:
+            raise TypeError("Key %r is not a string." % (key,))
+
+
+class MsgpackCodec(Codec):
+    """Codec using msgpack.
+
+    The receiver gets the same objects with both codecs, and the errors
+    happen on the sending side: the serialization is decoded once with
+    the C extension to check that its strings are UTF-8 and its keys
+    strings, which is much faster than walking the object in Python;
+    only if the check fails the object is converted as JSON would do
+    (see _as_json), raising if JSON can't represent it.
+
+    """
+    name = "msgpack"
+
+    def encode(self, obj):
+        """See Codec.encode."""
+        data = msgpack.packb(obj, use_bin_type=False)
+        try:
+            msgpack.unpackb(data, raw=False, object_pairs_hook=_check_keys)
+        except (TypeError, ValueError):
+            data = msgpack.packb(_as_json(obj), use_bin_type=False)
+        return data
+
+    def decode(self, data):
+        """See Codec.decode."""
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except ValueError:
+            raise
+        except Exception as error:
+            raise ValueError("%s: %s" % (error.__class__.__name__, error))
+
+
+JSON_CODEC = JSONCodec()
+
+# The available codecs, in order of preference.
+CODECS = list()
+if msgpack is not None and msgpack.Packer.__module__ != "msgpack.fallback":
+    CODECS.append(MsgpackCodec())
+CODECS.append(JSON_CODEC)
+
+
+def get_codec(name):
+    """Return the available codec with the given name.
+
+    name (unicode): the name of a codec.
+
+    return (Codec|None): the codec, or None if not available.
+
+    """
+    for codec in CODECS:
+        if codec.name == name:
+            return codec
+    return None
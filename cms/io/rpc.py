@@ -25,10 +25,14 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import functools
+import inspect
 import json
 import logging
+import os
 import socket
+import struct
 import traceback
+import types
 import uuid
 from weakref import WeakSet
 
@@ -38,6 +42,8 @@ import gevent.socket
 import gevent.event
 
 from cms import get_service_address
+from cms.io.codec import CODECS, JSON_CODEC, get_codec
+from cms.io.rpc_stats import rpc_statistics
 
 
 logger = logging.getLogger(__name__)
@@ -48,19 +54,56 @@ class RPCError(Exception):
     pass
 
 
+# Keyword arguments that the proxies of RemoteServiceClient keep for
+# themselves, and therefore can't be the name of a parameter of a
+# method called via RPC.
+RESERVED_ARGUMENTS = frozenset(["callback", "plus", "batch", "timeout"])
+
+
 def rpc_method(func):
     """Decorator for a method that other services are allowed to call.
 
-    Does not do a lot, just defines the right method's attribute.
+    Does not do a lot, just defines the right method's attribute. The
+    method can't have parameters with the names in RESERVED_ARGUMENTS,
+    as they'd be taken by RemoteServiceClient.__getattr__.
 
     func (function): the method to make RPC callable.
     return (function): the decorated method.
 
+    raise (ValueError): if a parameter has a reserved name.
+
     """
+    reserved = RESERVED_ARGUMENTS.intersection(inspect.getargspec(func).args)
+    if len(reserved) > 0:
+        raise ValueError("Method %s has parameters with reserved names: %s." %
+                         (func.__name__, ", ".join(sorted(reserved))))
     func.rpc_callable = True
     return func
 
 
+def chunked(iterable, size=1000):
+    """Split an iterable in lists of the given size.
+
+    Useful to write RPC methods whose results are streamed: such
+    methods are generators yielding lists, that are sent one by one
+    (if the client supports it) and then concatenated by the client.
+
+    iterable (iterable): the items to split.
+    size (int): the maximum length of each list.
+
+    yield ([object]): the lists, the last one possibly shorter.
+
+    """
+    chunk = list()
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = list()
+    if len(chunk) > 0:
+        yield chunk
+
+
 class RemoteServiceBase(object):
     """Base class for both ends of a RPC connection.
 
@@ -77,11 +120,54 @@ class RemoteServiceBase(object):
     When the state changes the on_connect or on_disconnect handlers
     will be fired.
 
+    Messages can be delimited on the wire in two ways (framings):
+    - "line" framing, where each message is terminated by "\\r\\n";
+      it requires scanning for the delimiter and bounds the size of
+      messages (see MAX_MESSAGE_SIZE);
+    - "length" framing, where each message is split in one or more
+      chunks, each preceded by a 4-byte big-endian header holding its
+      length; the most significant bit of the header is set if more
+      chunks follow. Messages can then be of any size.
+    Connections start with line framing; the client then proposes to
+    switch to length framing with a handshake (see
+    RemoteServiceClient._handshake), that peers not supporting it just
+    answer with an error.
+
+    Messages are serialized with a codec (see cms.io.codec), JSON
+    unless a faster one has been agreed upon in the handshake. The
+    handshake itself is always in JSON.
+
+    If agreed upon in the handshake, many requests (and their
+    responses) can be sent in a single message, as {"__batch": [...]}.
+
+    Requests can carry a "__timeout" (in seconds): the server stops
+    executing the method, and doesn't answer, if it takes longer than
+    that (the client gave up on it anyway).
+
+    Methods can also be generators yielding lists (see chunked): if
+    agreed upon in the handshake, each list is sent in its own message
+    ({"__id": ..., "__chunk": [...]}) as soon as it is produced, and
+    then a response with "__stream" set and no data ends the stream;
+    otherwise the lists are concatenated and sent as usual. Either way,
+    the client gets their concatenation as result.
+
     """
     # Incoming messages larger than 1 MiB are dropped to avoid DOS
-    # attacks. XXX Check that this size is sensible.
+    # attacks. XXX Check that this size is sensible. With length
+    # framing, this is instead the maximum size of a single chunk.
     MAX_MESSAGE_SIZE = 1024 * 1024
 
+    LINE_FRAMING = "line"
+    LENGTH_FRAMING = "length"
+
+    # Header of each chunk with length framing.
+    FRAME_HEADER = struct.Struct(b"!I")
+    FRAME_MORE = 1 << 31
+
+    # Chunks smaller than this are sent in the same write as their
+    # header, copying them; larger ones are sent without copying.
+    SMALL_CHUNK_SIZE = 64 * 1024
+
     def __init__(self, remote_address):
         """Prepare to handle a connection with the given remote address.
 
@@ -92,6 +178,12 @@ class RemoteServiceBase(object):
         self.remote_address = remote_address
         self.connected = False
 
+        self._codec = JSON_CODEC
+        # Cleared while the options of the connection are being
+        # settled, i.e., until the handshake (if any) ends: see _send.
+        self._ready = gevent.event.Event()
+        self._ready.set()
+
         self._on_connect_handlers = list()
         self._on_disconnect_handlers = list()
 
@@ -120,7 +212,7 @@ class RemoteServiceBase(object):
             remote address, for use in log messages and exceptions.
 
         """
-        return "%s:%d" % (self.remote_address)
+        return "%r" % (self.remote_address,)
 
     def initialize(self, sock, plus):
         """Activate the communication on the given socket.
@@ -136,13 +228,26 @@ class RemoteServiceBase(object):
         if self.connected:
             raise RuntimeError("Already connected.")
 
-        self._socket = sock
+        # Keep our own object for the socket, as the caller may close
+        # the one it gave us (StreamServer does, once handle returns).
+        self._socket = sock.dup()
         self._reader = self._socket.makefile('rb')
         self._writer = self._socket.makefile('wb')
         self._read_lock = gevent.coros.RLock()
         self._write_lock = gevent.coros.RLock()
+        self._framing = self.LINE_FRAMING
+        self._codec = JSON_CODEC
+        self._ready = gevent.event.Event()
         self.connected = True
 
+        # Small frame headers must not wait for the ACK of the previous
+        # packet to be sent.
+        try:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                                    1)
+        except socket.error:
+            pass
+
         logger.info("Established connection with %s.", self._repr_remote())
 
         for handler in self._on_connect_handlers:
@@ -166,7 +271,10 @@ class RemoteServiceBase(object):
         self.__dict__.pop("_writer", None)
         self.__dict__.pop("_read_lock", None)
         self.__dict__.pop("_write_lock", None)
+        self.__dict__.pop("_framing", None)
         self.connected = False
+        # Wake up who's waiting to send, to let them fail.
+        self._ready.set()
 
         logger.info("Terminated connection with %s: %s", self._repr_remote(),
                     reason)
@@ -190,13 +298,30 @@ class RemoteServiceBase(object):
         finally:
             self.finalize("Disconnection requested.")
 
+    def _is_encodable(self, message):
+        """Return whether the codec in use can encode the message.
+
+        message (object): a request or a response.
+
+        return (bool): whether encoding it succeeds.
+
+        """
+        try:
+            self._codec.encode(message)
+        except (TypeError, ValueError):
+            return False
+        return True
+
     def _read(self):
         """Receive a message from the socket.
 
-        Read from the socket until a "\\r\\n" is found. That is what we
-        consider a "message" in the communication protocol.
+        With line framing, read from the socket until a "\\r\\n" is
+        found. With length framing, read chunks until one that isn't
+        followed by others. That is what we consider a "message" in the
+        communication protocol.
 
-        return (bytes): the retrieved message.
+        return (bytes): the retrieved message (empty if the connection
+            was closed).
 
         raise (IOError): if reading fails.
 
@@ -208,6 +333,8 @@ class RemoteServiceBase(object):
             with self._read_lock:
                 if not self.connected:
                     raise IOError("Not connected.")
+                if self._framing == self.LENGTH_FRAMING:
+                    return self._read_frames()
                 data = self._reader.readline(self.MAX_MESSAGE_SIZE)
                 # If there weren't a "\r\n" between the last message
                 # and the EOF we would have a false positive here.
@@ -226,10 +353,107 @@ class RemoteServiceBase(object):
 
         return data
 
+    def _read_frames(self):
+        """Receive a message made of length-prefixed chunks.
+
+        To be called with the read lock held.
+
+        return (bytes): the retrieved message (empty if the connection
+            was closed).
+
+        raise (IOError): if reading fails.
+
+        """
+        chunks = list()
+        while True:
+            header = self._reader.read(self.FRAME_HEADER.size)
+            if len(header) == 0 and len(chunks) == 0:
+                return b""
+            if len(header) < self.FRAME_HEADER.size:
+                self.finalize("Connection closed in the middle of a message.")
+                raise IOError("Truncated message.")
+
+            length, = self.FRAME_HEADER.unpack(header)
+            more = length & self.FRAME_MORE != 0
+            length &= ~self.FRAME_MORE
+            if length > self.MAX_MESSAGE_SIZE:
+                logger.error(
+                    "The client sent a chunk larger than %d bytes (that is "
+                    "MAX_MESSAGE_SIZE).", self.MAX_MESSAGE_SIZE)
+                self.finalize("Client misbehaving.")
+                raise IOError("Chunk too long.")
+
+            chunk = self._reader.read(length)
+            if len(chunk) < length:
+                self.finalize("Connection closed in the middle of a message.")
+                raise IOError("Truncated message.")
+            chunks.append(chunk)
+
+            if not more:
+                break
+
+        if len(chunks) == 1:
+            return chunks[0]
+        return b"".join(chunks)
+
+    def _write_frames(self, data):
+        """Send a message as length-prefixed chunks.
+
+        Chunks are sent straight from the buffer holding the message,
+        without copying it. To be called with the write lock held.
+
+        data (bytes): the message to transmit.
+
+        raise (socket.error): if writing fails.
+
+        """
+        view = memoryview(data)
+        start = 0
+        while True:
+            chunk = view[start:start + self.MAX_MESSAGE_SIZE]
+            start += len(chunk)
+            more = start < len(data)
+            header = self.FRAME_HEADER.pack(
+                len(chunk) | (self.FRAME_MORE if more else 0))
+            if len(chunk) < self.SMALL_CHUNK_SIZE:
+                self._socket.sendall(header + chunk.tobytes())
+            else:
+                self._socket.sendall(header)
+                self._socket.sendall(chunk)
+            if not more:
+                break
+
+    def _send(self, message):
+        """Encode and send a message, once the options are settled.
+
+        Messages other than the handshake must be sent this way, so
+        that they don't precede it and are encoded and framed as it
+        agreed. Encoding is done holding the write lock for the same
+        reason.
+
+        message (object): the request(s) or response(s) to transmit.
+
+        return (int): the size of the encoded message.
+
+        raise (TypeError, ValueError): if encoding fails.
+        raise (IOError): if writing fails.
+
+        """
+        if not self.connected:
+            raise IOError("Not connected.")
+        self._ready.wait()
+        if not self.connected:
+            raise IOError("Not connected.")
+        with self._write_lock:
+            data = self._codec.encode(message)
+            self._write(data)
+        return len(data)
+
     def _write(self, data):
         """Send a message to the socket.
 
-        Automatically append "\\r\\n" to make it a correct message.
+        With line framing, automatically append "\\r\\n" to make it a
+        correct message. With length framing, prepend the headers.
 
         data (bytes): the message to transmit.
 
@@ -239,19 +463,23 @@ class RemoteServiceBase(object):
         if not self.connected:
             raise IOError("Not connected.")
 
-        if len(data + b'\r\n') > self.MAX_MESSAGE_SIZE:
-            logger.error(
-                "A message wasn't sent to %r because it was larger than %d "
-                "bytes (that is MAX_MESSAGE_SIZE). Consider raising that "
-                "value if the message seemed legit.", self._repr_remote(),
-                self.MAX_MESSAGE_SIZE)
-            # No need to call finalize.
-            raise IOError("Message too long.")
-
         try:
+            # The framing is checked holding the lock, as a handshake
+            # may be changing it meanwhile.
             with self._write_lock:
                 if not self.connected:
                     raise IOError("Not connected.")
+                if self._framing == self.LENGTH_FRAMING:
+                    self._write_frames(data)
+                    return
+                if len(data) + 2 > self.MAX_MESSAGE_SIZE:
+                    logger.error(
+                        "A message wasn't sent to %r because it was larger "
+                        "than %d bytes (that is MAX_MESSAGE_SIZE). Consider "
+                        "raising that value if the message seemed legit.",
+                        self._repr_remote(), self.MAX_MESSAGE_SIZE)
+                    # No need to call finalize.
+                    raise IOError("Message too long.")
                 # Does the same as self._socket.sendall.
                 self._writer.write(data + b'\r\n')
                 self._writer.flush()
@@ -283,6 +511,9 @@ class RemoteServiceServer(RemoteServiceBase):
         super(RemoteServiceServer, self).__init__(remote_address)
         self.local_service = local_service
 
+        # Whether the client accepts streamed results.
+        self._streaming = False
+
         self.pending_incoming_requests_threads = WeakSet()
 
     def finalize(self, reason=""):
@@ -306,7 +537,12 @@ class RemoteServiceServer(RemoteServiceBase):
         This method won't return as long as there's something to read,
         it's therefore advisable to spawn a greenlet to call it.
 
+        The first message may be a handshake, that is handled right
+        away since it may change the way next messages are read and
+        written.
+
         """
+        first = True
         while True:
             try:
                 data = self._read()
@@ -317,39 +553,186 @@ class RemoteServiceServer(RemoteServiceBase):
                 self.finalize("Connection closed.")
                 break
 
+            if first:
+                first = False
+                handshake = self._handshake(data)
+                self._ready.set()
+                if handshake:
+                    continue
+
             gevent.spawn(self.process_data, data)
 
+    def _handshake(self, data):
+        """Answer to the handshake, if the message is one.
+
+        Reply with the options chosen among those proposed by the
+        client, and start using them. See
+        RemoteServiceClient._handshake.
+
+        data (bytes): the first message read from the socket.
+
+        return (bool): whether the message was a handshake.
+
+        """
+        try:
+            request = json.loads(data, encoding='utf-8')
+        except ValueError:
+            return False
+
+        if not isinstance(request, dict) or \
+                request.get("__method") != "__handshake" or \
+                not isinstance(request.get("__data"), dict):
+            return False
+
+        proposed = request["__data"]
+        options = dict()
+        options["framing"] = self.LENGTH_FRAMING \
+            if self.LENGTH_FRAMING in proposed.get("framing", []) \
+            else self.LINE_FRAMING
+        options["codec"] = JSON_CODEC.name
+        for name in proposed.get("codecs", []):
+            if get_codec(name) is not None:
+                options["codec"] = name
+                break
+        options["batch"] = proposed.get("batch", False) is True
+        options["stream"] = proposed.get("stream", False) is True
+
+        response = {"__id": request.get("__id"),
+                    "__data": options,
+                    "__error": None}
+
+        try:
+            self._write(json.dumps(response, encoding='utf-8'))
+        except IOError:
+            return True
+
+        self._framing = options["framing"]
+        self._codec = get_codec(options["codec"])
+        self._streaming = options["stream"]
+
+        return True
+
     def process_data(self, data):
         """Handle the message.
 
-        JSON-decode it and forward it to process_incoming_request
-        (unconditionally!).
+        Decode it and forward it to process_incoming_request, or to
+        process_incoming_batch if it is a batch (unconditionally!).
 
         data (bytes): the message read from the socket.
 
         """
         # Decode the incoming data.
         try:
-            message = json.loads(data, encoding='utf-8')
+            message = self._codec.decode(data)
         except ValueError:
             logger.warning("Cannot parse incoming message, discarding.")
             return
 
-        self.process_incoming_request(message)
+        if isinstance(message, dict) and "__batch" in message:
+            self.process_incoming_batch(message["__batch"], len(data))
+        else:
+            self.process_incoming_request(message, len(data))
 
-    def process_incoming_request(self, request):
+    def process_incoming_request(self, request, size=0):
         """Handle the request.
 
         Parse the request, execute the method it asks for, format the
         result and send the response.
 
-        request (dict): the JSON-decoded request.
+        request (dict): the decoded request.
+        size (int): the size of the encoded request, for statistics.
+
+        """
+        response = self._execute_request(request, size, self._streaming)
+        if response is None:
+            return
+
+        # Encode and send it.
+        try:
+            size = self._send(response)
+        except (TypeError, ValueError):
+            logger.warning("Encoding failed.")
+            return
+        except IOError:
+            # Log messages have already been produced.
+            return
+
+        stats = rpc_statistics.incoming.get(request["__method"])
+        if stats is not None:
+            stats.response_bytes += size
+
+    def process_incoming_batch(self, requests, size=0):
+        """Handle a batch of requests.
+
+        Execute the requests concurrently, each in its own greenlet
+        (as if they had been sent one by one), and once all of them
+        are done send their responses together in a single message.
+
+        requests ([dict]): the decoded requests.
+        size (int): the size of the encoded batch, for statistics
+            (split evenly among the requests).
+
+        """
+        if not isinstance(requests, list):
+            logger.warning("Batch isn't a list, ignoring.")
+            return
+
+        threads = [gevent.spawn(self._execute_request, request,
+                                size // max(len(requests), 1))
+                   for request in requests]
+        gevent.joinall(threads)
+
+        responses = list()
+        methods = list()
+        for request, thread in zip(requests, threads):
+            # Threads are killed if the connection is closed meanwhile.
+            if thread.successful() and thread.value is not None:
+                responses.append(thread.value)
+                methods.append(request["__method"])
+
+        # Encode and send them, dropping the responses that can't be
+        # encoded, as process_incoming_request would do.
+        try:
+            try:
+                size = self._send({"__batch": responses})
+            except (TypeError, ValueError):
+                logger.warning("Encoding failed.")
+                encodable = [self._is_encodable(response)
+                             for response in responses]
+                responses = [response for response, ok
+                             in zip(responses, encodable) if ok]
+                methods = [method for method, ok
+                           in zip(methods, encodable) if ok]
+                size = self._send({"__batch": responses})
+        except IOError:
+            # Log messages have already been produced.
+            return
+
+        for method in methods:
+            stats = rpc_statistics.incoming.get(method)
+            if stats is not None:
+                stats.response_bytes += size // len(methods)
+
+    def _execute_request(self, request, size=0, stream=False):
+        """Execute the method a request asks for.
+
+        Record statistics about the call in rpc_statistics.
+
+        request (dict): the decoded request.
+        size (int): the size of the encoded request, for statistics.
+        stream (bool): whether to stream the result, if the method is a
+            generator, sending each chunk as soon as it's produced.
+
+        return (dict|None): the response to send, or None if the
+            request is invalid or its timeout expired.
 
         """
         # Validate the request.
-        if not {"__id", "__method", "__data"}.issubset(request.iterkeys()):
+        if not isinstance(request, dict) or \
+                not {"__id", "__method", "__data"}.issubset(
+                    request.iterkeys()):
             logger.warning("Request is missing some fields, ingoring.")
-            return
+            return None
 
         # Determine the ID.
         id_ = request["__id"]
@@ -372,26 +755,62 @@ class RemoteServiceServer(RemoteServiceBase):
             if not getattr(method, "rpc_callable", False):
                 response["__error"] = "Method %s isn't callable." % method_name
             else:
+                timeout = request.get("__timeout")
+                if not isinstance(timeout, (int, float)):
+                    timeout = None
+                else:
+                    timeout = max(timeout, 0)
+                deadline = gevent.Timeout(timeout)
+
+                stats = rpc_statistics.incoming[method_name]
+                stats.request_bytes += size
+                start = stats.start()
+                deadline.start()
                 try:
-                    response["__data"] = method(**request["__data"])
+                    result = method(**request["__data"])
+                    if isinstance(result, types.GeneratorType):
+                        if stream:
+                            self._send_chunks(id_, result, stats)
+                            response["__stream"] = True
+                            result = None
+                        else:
+                            result = [item for chunk in result
+                                      for item in chunk]
+                    response["__data"] = result
+                except gevent.Timeout as error:
+                    if error is not deadline:
+                        raise
+                    logger.warning("Execution of %s cancelled, as it took "
+                                   "longer than %s seconds.",
+                                   method_name, timeout)
+                    response = None
                 except Exception as error:
                     response["__error"] = "%s: %s\n%s" % \
                         (error.__class__.__name__, error,
                          traceback.format_exc())
+                finally:
+                    deadline.cancel()
+                    stats.end(start, response is not None and
+                              response["__error"] is None)
 
-        # Encode it.
-        try:
-            data = json.dumps(response, encoding='utf-8')
-        except (TypeError, ValueError):
-            logger.warning("JSON encoding failed.")
-            return
+        return response
 
-        # Send it.
-        try:
-            self._write(data)
-        except IOError:
-            # Log messages have already been produced.
-            return
+    def _send_chunks(self, id_, chunks, stats):
+        """Send the chunks of a streamed result.
+
+        id_ (unicode): the ID of the request.
+        chunks (iterable): the lists composing the result.
+        stats (MethodStatistics): where to record their size.
+
+        raise (TypeError, ValueError): if encoding fails.
+        raise (IOError): if writing fails.
+
+        """
+        for chunk in chunks:
+            stats.response_bytes += self._send({"__id": id_,
+                                                "__chunk": chunk})
+            # Let other greenlets run between chunks.
+            gevent.sleep(0)
 
 
 class RemoteServiceClient(RemoteServiceBase):
@@ -408,6 +827,15 @@ class RemoteServiceClient(RemoteServiceBase):
     the reader loop should be started by calling run.
 
     """
+    # How long to wait for the server to answer the handshake.
+    HANDSHAKE_TIMEOUT = 10.0
+
+    # Requests to be batched are held for at most BATCH_WINDOW seconds,
+    # and then sent together with those issued meanwhile, at most
+    # BATCH_MAX_SIZE in a message.
+    BATCH_WINDOW = 0.01
+    BATCH_MAX_SIZE = 1000
+
     def __init__(self, remote_service_coord, auto_retry=None):
         """Create a caller for the service at the given coords.
 
@@ -425,36 +853,129 @@ class RemoteServiceClient(RemoteServiceBase):
 
         self.pending_outgoing_requests = dict()
         self.pending_outgoing_requests_results = dict()
+        # Chunks received so far of streamed results, and functions to
+        # pass them to, for requests that asked so.
+        self.pending_outgoing_requests_chunks = dict()
+        self.pending_outgoing_requests_chunk_handlers = dict()
+
+        # Whether the server accepts batches, the requests waiting to
+        # be sent in the next one and the greenlet that will send it.
+        self._batching = False
+        self._batch = list()
+        self._batch_timer = None
 
         self.auto_retry = auto_retry
 
     def _repr_remote(self):
         """See RemoteServiceBase._repr_remote."""
-        return "%s:%d (%r)" % (self.remote_address +
-                               (self.remote_service_coord,))
+        return "%r (%r)" % (self.remote_address, self.remote_service_coord)
 
     def finalize(self, reason=""):
         """See RemoteServiceBase.finalize."""
         super(RemoteServiceClient, self).finalize(reason)
 
+        self._batching = False
+        self._batch = list()
+        if self._batch_timer is not None:
+            if self._batch_timer is not gevent.getcurrent():
+                self._batch_timer.kill(block=False)
+            self._batch_timer = None
+
         for result in self.pending_outgoing_requests_results.itervalues():
             result.set_exception(RPCError(reason))
 
         self.pending_outgoing_requests.clear()
         self.pending_outgoing_requests_results.clear()
+        self.pending_outgoing_requests_chunks.clear()
+        self.pending_outgoing_requests_chunk_handlers.clear()
 
     def _connect(self):
         """Establish a connection and initialize that socket.
 
+        If the service has a UNIX domain socket and it exists (i.e.,
+        the service runs on this host) connect through it, otherwise,
+        or if that fails, through TCP.
+
         """
-        try:
-            sock = gevent.socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect(self.remote_address)
-        except socket.error as error:
-            logger.debug("Couldn't connect to %s: %s.",
-                         self._repr_remote(), error)
-        else:
-            self.initialize(sock, self.remote_service_coord)
+        sock = None
+        path = self.remote_address.path
+        if path is not None and os.path.exists(path):
+            try:
+                sock = gevent.socket.socket(socket.AF_UNIX,
+                                            socket.SOCK_STREAM)
+                sock.connect(path)
+            except socket.error as error:
+                logger.debug("Couldn't connect to %s through %s: %s.",
+                             self._repr_remote(), path, error)
+                # Creating the socket may have failed too.
+                if sock is not None:
+                    sock.close()
+                sock = None
+        if sock is None:
+            try:
+                sock = gevent.socket.socket(socket.AF_INET,
+                                            socket.SOCK_STREAM)
+                sock.connect((self.remote_address.ip,
+                              self.remote_address.port))
+            except socket.error as error:
+                logger.debug("Couldn't connect to %s: %s.",
+                             self._repr_remote(), error)
+                if sock is not None:
+                    sock.close()
+                return
+        self.initialize(sock, self.remote_service_coord)
+
+    def _handshake(self):
+        """Negotiate the options of the connection with the server.
+
+        Send (with line framing) a request for the special "__handshake"
+        method, listing the options we support, and switch to those
+        the server chose. Servers that don't know about handshakes
+        answer with an error, and we stay with line framing.
+
+        Requests issued meanwhile (e.g., by the on_connect handlers)
+        wait for the negotiation to end, see _send.
+
+        """
+        id_ = uuid.uuid4().hex
+        request = {"__id": id_,
+                   "__method": "__handshake",
+                   "__data": {"framing": [self.LENGTH_FRAMING],
+                              "codecs": [codec.name for codec in CODECS],
+                              "batch": True,
+                              "stream": True}}
+
+        with self._write_lock:
+            try:
+                with gevent.Timeout(self.HANDSHAKE_TIMEOUT,
+                                    IOError("Handshake timed out.")):
+                    self._write(json.dumps(request, encoding='utf-8'))
+                    data = self._read()
+                response = json.loads(data, encoding='utf-8')
+                if response["__id"] != id_:
+                    raise ValueError("Unexpected response.")
+            except (IOError, ValueError, KeyError, TypeError) as error:
+                logger.warning("Handshake with %s failed: %s.",
+                               self._repr_remote(), error)
+                super(RemoteServiceClient, self).disconnect()
+                return
+
+            if response.get("__error") is not None:
+                logger.debug("%s doesn't support handshakes.",
+                             self._repr_remote())
+                return
+
+            options = response["__data"]
+            if options.get("framing") == self.LENGTH_FRAMING:
+                self._framing = self.LENGTH_FRAMING
+            codec = get_codec(options.get("codec", JSON_CODEC.name))
+            if codec is None:
+                logger.warning("%s chose an unknown codec.",
+                               self._repr_remote())
+                super(RemoteServiceClient, self).disconnect()
+                return
+            self._codec = codec
+            self._batching = options.get("batch", False) is True
 
     def _run(self):
         """Maintain the connection up, if required.
@@ -491,7 +1012,14 @@ class RemoteServiceClient(RemoteServiceBase):
         This method won't return as long as there's something to read,
         it's therefore advisable to spawn a greenlet to call it.
 
+        The handshake is done first, here rather than in connect, so
+        that it doesn't block the caller of the latter.
+
         """
+        if self.connected:
+            self._handshake()
+        self._ready.set()
+
         while True:
             try:
                 data = self._read()
@@ -507,32 +1035,58 @@ class RemoteServiceClient(RemoteServiceBase):
     def process_data(self, data):
         """Handle the message.
 
-        JSON-decode it and forward it to process_incoming_response
-        (unconditionally!).
+        Decode it and forward it (or, if it is a batch, each of its
+        items) to process_incoming_response (unconditionally!).
 
         data (bytes): the message read from the socket.
 
         """
         # Decode the incoming data.
         try:
-            message = json.loads(data, encoding='utf-8')
+            message = self._codec.decode(data)
         except ValueError:
             logger.warning("Cannot parse incoming message, discarding.")
             return
 
-        self.process_incoming_response(message)
+        if isinstance(message, dict) and "__batch" in message:
+            responses = message["__batch"]
+            for response in responses:
+                self.process_incoming_response(
+                    response, len(data) // len(responses))
+        else:
+            self.process_incoming_response(message, len(data))
+
+    def _get_statistics(self, method):
+        """Return where to record statistics about calls to a method.
+
+        method (string): the name of the method.
 
-    def process_incoming_response(self, response):
+        return (MethodStatistics): the statistics of the outgoing
+            calls to the method of the remote service.
+
+        """
+        return rpc_statistics.outgoing[
+            "%s.%s" % (self.remote_service_coord.name, method)]
+
+    def process_incoming_response(self, response, size=0):
         """Handle the response.
 
         Parse the response, determine the request it's for and its
         associated result and fill it.
 
-        response (dict): the JSON-decoded response.
+        response (dict): the decoded response (or chunk of a streamed
+            response).
+        size (int): the size of the encoded response, for statistics.
 
         """
+        if isinstance(response, dict) and "__chunk" in response:
+            self.process_incoming_chunk(response, size)
+            return
+
         # Validate the response.
-        if not {"__id", "__data", "__error"}.issubset(response.iterkeys()):
+        if not isinstance(response, dict) or \
+                not {"__id", "__data", "__error"}.issubset(
+                    response.iterkeys()):
             logger.warning("Response is missing some fields, ingoring.")
             return
 
@@ -545,6 +1099,10 @@ class RemoteServiceClient(RemoteServiceBase):
 
         request = self.pending_outgoing_requests.pop(id_)
         result = self.pending_outgoing_requests_results.pop(id_)
+        self._get_statistics(request["__method"]).response_bytes += size
+        chunks = self.pending_outgoing_requests_chunks.pop(id_, list())
+        chunk_handler = \
+            self.pending_outgoing_requests_chunk_handlers.pop(id_, None)
         error = response["__error"]
 
         if error is not None:
@@ -552,14 +1110,67 @@ class RemoteServiceClient(RemoteServiceBase):
                 self.remote_service_coord, request["__method"], error)
             logger.error(err_msg)
             result.set_exception(RPCError(error))
+        elif response.get("__stream", False):
+            result.set(chunks if chunk_handler is None else None)
         else:
             result.set(response["__data"])
 
-    def execute_rpc(self, method, data):
+    def process_incoming_chunk(self, message, size=0):
+        """Handle a chunk of a streamed response.
+
+        Collect it, or pass it to the handler given to execute_rpc.
+
+        message (dict): the decoded message holding the chunk.
+        size (int): the size of the encoded message, for statistics.
+
+        """
+        id_ = message.get("__id")
+        chunk = message["__chunk"]
+
+        if id_ not in self.pending_outgoing_requests:
+            logger.warning("No pending request with id %s found.", id_)
+            return
+        self._get_statistics(
+            self.pending_outgoing_requests[id_]["__method"]).response_bytes \
+            += size
+        if not isinstance(chunk, list):
+            logger.warning("Chunk isn't a list, ignoring.")
+            return
+
+        chunk_handler = self.pending_outgoing_requests_chunk_handlers.get(id_)
+        if chunk_handler is None:
+            self.pending_outgoing_requests_chunks.setdefault(
+                id_, list()).extend(chunk)
+        else:
+            try:
+                chunk_handler(chunk)
+            except Exception:
+                logger.error("RPC chunk handler for %s.%s raised exception.",
+                             self.remote_service_coord.name,
+                             self.pending_outgoing_requests[id_]["__method"],
+                             exc_info=True)
+
+    def execute_rpc(self, method, data, batch=False, on_chunk=None,
+                    timeout=None):
         """Send an RPC request to the remote service.
 
         method (string): the name of the method to call.
         data (dict): keyword arguments to pass to the methods.
+        batch (bool): whether the request can be delayed a little (at
+            most BATCH_WINDOW seconds) to be sent together with others
+            in a single message. The server executes the requests of a
+            batch concurrently, but answers once it has executed them
+            all: use it for methods that return quickly and whose
+            result isn't urgent, as notifications.
+        on_chunk (function|None): if given, and the result is streamed
+            by the server, each of its chunks (a list) is passed to
+            this function as soon as it arrives, in order, instead of
+            being collected, and the result of the call is None. It
+            must not block.
+        timeout (float|None): if given, how many seconds to wait for
+            the response before giving up and setting the result to an
+            error; the server is told too, and stops executing the
+            method once the time is over.
 
         return (AsyncResult): an object that holds (or will hold) the
             result of the call, either the value or the error that
@@ -576,26 +1187,115 @@ class RemoteServiceClient(RemoteServiceBase):
 
         result = gevent.event.AsyncResult()
 
-        # Encode it.
-        try:
-            data = json.dumps(request, encoding='utf-8')
-        except (TypeError, ValueError):
-            result.set_exception(RPCError("JSON encoding failed."))
+        # Record statistics once the result is set, whatever happens.
+        stats = self._get_statistics(method)
+        start = stats.start()
+        result.rawlink(lambda result: stats.end(start, result.successful()))
+
+        if timeout is not None:
+            request["__timeout"] = timeout
+            timer = gevent.spawn_later(
+                timeout, self._fail_request, id_,
+                "Timed out after %s seconds." % timeout, result)
+            result.rawlink(lambda result: timer.kill(block=False))
+
+        # Whether the server accepts batches is known only after the
+        # handshake.
+        self._ready.wait()
+        if batch and self._batching:
+            # Store it, and let _send_batch encode and send it.
+            self.pending_outgoing_requests[id_] = request
+            self.pending_outgoing_requests_results[id_] = result
+            if on_chunk is not None:
+                self.pending_outgoing_requests_chunk_handlers[id_] = on_chunk
+            self._batch.append(request)
+            if len(self._batch) >= self.BATCH_MAX_SIZE:
+                self._send_batch()
+            elif self._batch_timer is None:
+                self._batch_timer = gevent.spawn_later(self.BATCH_WINDOW,
+                                                       self._send_batch)
             return result
 
-        # Send it.
+        # Encode and send it.
         try:
-            self._write(data)
+            stats.request_bytes += self._send(request)
+        except (TypeError, ValueError):
+            result.set_exception(RPCError("Encoding failed."))
+            return result
         except IOError:
             result.set_exception(RPCError("Write failed."))
             return result
 
-        # Store it.
+        # Store it, unless it timed out in the meantime.
+        if result.ready():
+            return result
         self.pending_outgoing_requests[id_] = request
         self.pending_outgoing_requests_results[id_] = result
+        if on_chunk is not None:
+            self.pending_outgoing_requests_chunk_handlers[id_] = on_chunk
 
         return result
 
+    def _send_batch(self):
+        """Send the requests waiting to be batched in a single message.
+
+        """
+        if self._batch_timer is not None:
+            if self._batch_timer is not gevent.getcurrent():
+                self._batch_timer.kill(block=False)
+            self._batch_timer = None
+
+        # Skip the requests that timed out while waiting.
+        requests = [request for request in self._batch
+                    if request["__id"] in self.pending_outgoing_requests]
+        self._batch = list()
+        if len(requests) == 0:
+            return
+
+        # Encode and send them, failing the requests that can't be
+        # encoded.
+        try:
+            try:
+                size = self._send({"__batch": requests})
+            except (TypeError, ValueError):
+                encodable = list()
+                for request in requests:
+                    if self._is_encodable(request):
+                        encodable.append(request)
+                    else:
+                        self._fail_request(request["__id"],
+                                           "Encoding failed.")
+                requests = encodable
+                if len(requests) == 0:
+                    return
+                size = self._send({"__batch": requests})
+        except IOError:
+            for request in requests:
+                self._fail_request(request["__id"], "Write failed.")
+            return
+
+        for request in requests:
+            self._get_statistics(request["__method"]).request_bytes += \
+                size // len(requests)
+
+    def _fail_request(self, id_, reason, result=None):
+        """Forget a pending request and set its result to an error.
+
+        id_ (unicode): the ID of the request.
+        reason (unicode): the message of the error.
+        result (AsyncResult|None): the result of the request, if it
+            may not have been stored yet.
+
+        """
+        self.pending_outgoing_requests.pop(id_, None)
+        self.pending_outgoing_requests_chunks.pop(id_, None)
+        self.pending_outgoing_requests_chunk_handlers.pop(id_, None)
+        stored_result = self.pending_outgoing_requests_results.pop(id_, None)
+        if result is None:
+            result = stored_result
+        if result is not None and not result.ready():
+            result.set_exception(RPCError(reason))
+
     def __getattr__(self, method):
         """Syntactic sugar to enable a transparent proxy.
 
@@ -608,7 +1308,10 @@ class RemoteServiceClient(RemoteServiceBase):
         call to the returned function to be notified when the RPC ends.
         The callback should be a callable able to receive the data and
         (optionally) the plus object as positional args and the error
-        as a keyword arg. It will be run in a dedicated greenlet.
+        as a keyword arg. It will be run in a dedicated greenlet. The
+        "batch" and "timeout" items are instead passed to execute_rpc.
+        These names are therefore never passed to the remote method
+        (see RESERVED_ARGUMENTS).
 
         method (string): the name of the accessed method.
         return (function): a proxy to a RPC.
@@ -644,7 +1347,10 @@ class RemoteServiceClient(RemoteServiceBase):
             """
             callback = data.pop("callback", None)
             plus = data.pop("plus", None)
-            result = self.execute_rpc(method=method, data=data)
+            batch = data.pop("batch", False)
+            timeout = data.pop("timeout", None)
+            result = self.execute_rpc(method=method, data=data, batch=batch,
+                                      timeout=timeout)
             if callback is not None:
                 callback = functools.partial(run_callback, callback, plus)
                 result.rawlink(functools.partial(gevent.spawn, callback))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Statistics about the RPC calls made and served by this process.
+
+RemoteServiceServer records the calls it serves (incoming, by method
+name) and RemoteServiceClient the calls it makes (outgoing, by remote
+service name and method name) in the rpc_statistics object, that each
+service exposes through its rpc_statistics RPC method.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import bisect
+import time
+from collections import defaultdict
+
+from cmscommon.datetime import monotonic_time
+
+
+class MethodStatistics(object):
+    """Counters about the calls to a method.
+
+    """
+    # Upper bounds (in seconds) of the buckets of the latency
+    # histogram; an additional last bucket has no upper bound.
+    LATENCY_BUCKETS = [0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0]
+
+    def __init__(self):
+        # Number of calls completed, and how many of them failed.
+        self.calls = 0
+        self.errors = 0
+        # Number of calls started but not completed, now and at most.
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Time spent in completed calls, in total and at most.
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.latency_histogram = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        # Size of the messages (in bytes) with the requests and the
+        # responses, as encoded on the wire.
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def start(self):
+        """Record the start of a call.
+
+        return (float): the starting time, to pass to end.
+
+        """
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return monotonic_time()
+
+    def end(self, start, success):
+        """Record the end of a call.
+
+        start (float): the value returned by start for this call.
+        success (bool): whether the call succeeded.
+
+        """
+        elapsed = monotonic_time() - start
+        self.in_flight -= 1
+        self.calls += 1
+        if not success:
+            self.errors += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.latency_histogram[
+            bisect.bisect_left(self.LATENCY_BUCKETS, elapsed)] += 1
+
+    def export_to_dict(self):
+        """Return the counters as a dict, with the average latency.
+
+        return (dict): the counters.
+
+        """
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "total_time": self.total_time,
+            "average_time": (self.total_time / self.calls
+                             if self.calls > 0 else None),
+            "max_time": self.max_time,
+            "latency_histogram": [
+                [bound, count] for bound, count in zip(
+                    self.LATENCY_BUCKETS + [None], self.latency_histogram)],
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            }
+
+
+class RPCStatistics(object):
+    """The statistics about all the methods, in both directions.
+
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far.
+
+        """
+        self.since = time.time()
+        self.incoming = defaultdict(MethodStatistics)
+        self.outgoing = defaultdict(MethodStatistics)
+
+    def export_to_dict(self):
+        """Return the statistics as a dict.
+
+        return (dict): when the statistics started to be collected,
+            and the counters of each incoming and outgoing method.
+
+        """
+        return {
+            "since": self.since,
+            "incoming": dict((name, stats.export_to_dict())
+                             for name, stats in self.incoming.iteritems()),
+            "outgoing": dict((name, stats.export_to_dict())
+                             for name, stats in self.outgoing.iteritems()),
+            }
+
+
+rpc_statistics = RPCStatistics()
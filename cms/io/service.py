@@ -52,6 +52,7 @@ from cms.log import root_logger, shell_handler, ServiceFilter, \
 from cmscommon.datetime import monotonic_time
 
 from .rpc import rpc_method, RemoteServiceServer, RemoteServiceClient
+from .rpc_stats import rpc_statistics
 
 
 logger = logging.getLogger(__name__)
@@ -103,7 +104,12 @@ class Service(object):
                             self._my_coord)
             sys.exit(1)
 
-        self.rpc_server = StreamServer(address, self._connection_handler)
+        self.rpc_address = address
+        self.rpc_server = StreamServer((address.ip, address.port),
+                                       self._connection_handler)
+        # Server for the connections through the UNIX domain socket, if
+        # any; it starts and stops together with rpc_server.
+        self.rpc_unix_server = None
         self.backdoor = None
 
     def initialize_logging(self):
@@ -158,13 +164,16 @@ class Service(object):
         connection.
 
         """
-        try:
-            ipaddr, port = address
-            ipaddr = gevent.socket.gethostbyname(ipaddr)
-            address = Address(ipaddr, port)
-        except socket.error:
-            logger.warning("Unexpected error.", exc_info=True)
-            return
+        if sock.family == socket.AF_UNIX:
+            address = Address(None, None, self.rpc_address.path)
+        else:
+            try:
+                ipaddr, port = address[:2]
+                ipaddr = gevent.socket.gethostbyname(ipaddr)
+                address = Address(ipaddr, port)
+            except socket.error:
+                logger.warning("Unexpected error.", exc_info=True)
+                return
         remote_service = RemoteServiceServer(self, address)
         remote_service.handle(sock)
 
@@ -217,8 +226,46 @@ class Service(object):
 
         """
         logger.warning("%r received request to shut down.", self._my_coord)
+        if self.rpc_unix_server is not None:
+            self.rpc_unix_server.stop()
         self.rpc_server.stop()
 
+    def start_unix_server(self, backlog=256):
+        """Also listen for RPC connections on the UNIX domain socket.
+
+        Clients on the same host use it instead of TCP, saving the
+        overhead of the network stack on each message.
+
+        """
+        path = self.rpc_address.path
+        try:
+            os.remove(path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        else:
+            logger.info("A stale RPC socket has been found and deleted.")
+        mkdir(os.path.dirname(path))
+        sock = _socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.setblocking(0)
+        sock.bind(path)
+        sock.listen(backlog)
+        self.rpc_unix_server = StreamServer(sock, self._connection_handler)
+        self.rpc_unix_server.start()
+
+    def stop_unix_server(self):
+        """Stop listening on the UNIX domain socket and remove it.
+
+        """
+        if self.rpc_unix_server is not None:
+            self.rpc_unix_server.stop()
+            self.rpc_unix_server = None
+        try:
+            os.remove(self.rpc_address.path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+
     def get_backdoor_path(self):
         """Return the path for a UNIX domain socket to use as backdoor.
 
@@ -286,7 +333,7 @@ class Service(object):
             if error.errno == errno.EADDRINUSE:
                 logger.critical("Listening port %s for service %s is "
                                 "already in use, quitting.",
-                                self.rpc_server.address.port, self.name)
+                                self.rpc_address.port, self.name)
                 return False
             elif error.errno == errno.EADDRNOTAVAIL:
                 logger.critical("Service %s could not listen on "
@@ -296,6 +343,16 @@ class Service(object):
             else:
                 raise
 
+        if self.rpc_address.path is not None:
+            try:
+                self.start_unix_server()
+            except (OSError, socket.error) as error:
+                logger.critical("Service %s could not listen on UNIX domain "
+                                "socket %s: %s.", self.name,
+                                self.rpc_address.path, error)
+                self.rpc_server.stop()
+                return False
+
         if config.backdoor:
             self.start_backdoor()
 
@@ -306,6 +363,9 @@ class Service(object):
 
         logger.info("%s %d is shutting down", *self._my_coord)
 
+        if self.rpc_address.path is not None:
+            self.stop_unix_server()
+
         if config.backdoor:
             self.stop_backdoor()
 
@@ -330,6 +390,21 @@ class Service(object):
         """
         return string
 
+    @rpc_method
+    def rpc_statistics(self, reset=False):
+        """Return statistics about the RPC calls served and made.
+
+        reset (bool): whether to start collecting them anew after
+            returning them.
+
+        return (dict): see RPCStatistics.export_to_dict.
+
+        """
+        result = rpc_statistics.export_to_dict()
+        if reset:
+            rpc_statistics.reset()
+        return result
+
     @rpc_method
     def quit(self, reason=""):
         """Shut down the service
@@ -65,9 +65,13 @@ class RPCMiddleware(object):
     successful (i.e. status code 200). The response body will contain
     a JSON object with two fields: data and error (possibly null). The
     first contains the JSON-encoded result of the RPC, the second a
-    string describing the error that occured (if any).
+    string describing the error that occured (if any). RPCs taking
+    longer than TIMEOUT seconds result in an error.
 
     """
+    # Don't let a stuck service keep HTTP requests pending forever.
+    TIMEOUT = 10.0
+
     def __init__(self, service):
         """Create an HTTP-to-RPC proxy for the given service.
 
@@ -132,9 +136,8 @@ class RPCMiddleware(object):
             return ServiceUnavailable()
 
         result = self._service.remote_services[remote_service].execute_rpc(
-            args['method'], data)
+            args['method'], data, timeout=self.TIMEOUT)
 
-        # XXX We could set a timeout on the .wait().
         result.wait()
 
         response.status_code = 200
@@ -48,9 +48,12 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import curses
+import functools
 import logging
 import sys
+from collections import deque
 
+import gevent
 import gevent.coros
 
 
@@ -101,7 +104,20 @@ class LogServiceHandler(logging.Handler):
     For args, we just format them into msg to produce the message. We
     then store the message as msg and drop args.
 
+    Records are not sent one by one: they are queued and a greenlet
+    sends them in batches, every FLUSH_INTERVAL seconds or as soon as
+    BATCH_SIZE of them are waiting. While the LogService is not
+    reachable they stay in the queue, that holds at most QUEUE_SIZE
+    of them: when it is full the oldest ones are dropped (and counted
+    in dropped, that is also reported to the LogService). The records
+    of a batch whose sending fails are dropped too, as they may have
+    been logged anyway.
+
     """
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.1
+
     def __init__(self, log_service):
         """Initialize the handler.
 
@@ -112,6 +128,14 @@ class LogServiceHandler(logging.Handler):
         """
         logging.Handler.__init__(self)
         self._log_service = log_service
+        self._queue = deque()
+        self._flusher = None
+        self._flushing = False
+        # Records dropped since the start, not yet reported, and whose
+        # report is being sent.
+        self.dropped = 0
+        self._dropped_unreported = 0
+        self._dropped_reporting = 0
 
     def createLock(self):
         """Set self.lock to a new gevent RLock.
@@ -120,8 +144,8 @@ class LogServiceHandler(logging.Handler):
         self.lock = gevent.coros.RLock()
 
     # Taken from CPython, combining emit and makePickle, and adapted to
-    # not pickle the dictionary and use its items as keyword parameters
-    # for LogService.Log.
+    # not pickle the dictionary and to queue it instead of sending it
+    # (its items are the keyword parameters of LogService.Log).
     def emit(self, record):
         try:
             ei = record.exc_info
@@ -137,12 +161,89 @@ class LogServiceHandler(logging.Handler):
             d['args'] = None
             if ei:
                 record.exc_info = ei  # for next handler
-            self._log_service.Log(**d)
+            self._enqueue(d)
         except (KeyboardInterrupt, SystemExit):
             raise
         except:
             self.handleError(record)
 
+    def _enqueue(self, record_dict):
+        """Queue a record, and make sure it will be sent.
+
+        record_dict (dict): the attributes of the record.
+
+        """
+        if len(self._queue) >= self.QUEUE_SIZE:
+            self._queue.popleft()
+            self._drop(1)
+        self._queue.append(record_dict)
+
+        if self._flushing:
+            # The greenlet sending the records will also send this one.
+            return
+        if len(self._queue) >= self.BATCH_SIZE:
+            if self._flusher is not None:
+                self._flusher.kill(block=False)
+            self._flusher = gevent.spawn(self.flush)
+        elif self._flusher is None:
+            self._flusher = gevent.spawn_later(self.FLUSH_INTERVAL,
+                                               self.flush)
+
+    def flush(self):
+        """Send the queued records to the LogService, in batches.
+
+        If it is not connected, try again later.
+
+        """
+        if self._flushing:
+            return
+        if self._flusher is not None and \
+                self._flusher is not gevent.getcurrent():
+            self._flusher.kill(block=False)
+        self._flusher = None
+
+        # Sending may yield, and meanwhile more records may be queued.
+        self._flushing = True
+        try:
+            while len(self._queue) > 0:
+                if not self._log_service.connected:
+                    self._flusher = gevent.spawn_later(self.FLUSH_INTERVAL,
+                                                       self.flush)
+                    return
+                records = [self._queue.popleft() for _ in
+                           xrange(min(self.BATCH_SIZE, len(self._queue)))]
+                dropped = self._dropped_unreported - self._dropped_reporting
+                self._dropped_reporting += dropped
+                result = self._log_service.log_records(
+                    records=records, dropped=dropped)
+                result.rawlink(functools.partial(
+                    self._sent, len(records), dropped))
+        finally:
+            self._flushing = False
+
+    def _drop(self, count):
+        """Count some records as dropped.
+
+        count (int): the number of records.
+
+        """
+        self.dropped += count
+        self._dropped_unreported += count
+
+    def _sent(self, count, dropped, result):
+        """Account for the result of sending a batch.
+
+        count (int): the number of records in the batch.
+        dropped (int): the number of dropped records it reported.
+        result (AsyncResult): the result of the call.
+
+        """
+        self._dropped_reporting -= dropped
+        if result.successful():
+            self._dropped_unreported -= dropped
+        else:
+            self._drop(count)
+
 
 def has_color_support(stream):
     """Try to determine if the given stream supports colored output.
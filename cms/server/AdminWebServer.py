@@ -52,7 +52,8 @@ from cms.db import Session, Contest, User, Announcement, Question, Message, \
     Submission, SubmissionResult, File, Task, Dataset, Attachment, Manager, \
     Testcase, SubmissionFormatElement, Statement
 from cms.db.filecacher import FileCacher
-from cms.grading import compute_changes_for_dataset
+from cms.grading import compute_changes_for_dataset, get_task_scores, \
+    update_task_scores
 from cms.grading.tasktypes import get_task_type_class
 from cms.grading.scoretypes import get_score_type_class
 from cms.server import file_handler_gen, get_url_root, \
@@ -565,6 +566,20 @@ class ResourcesHandler(BaseHandler):
         self.render("resources.html", **self.r_params)
 
 
+class RPCStatisticsHandler(BaseHandler):
+    """Page showing statistics about the RPC calls of the services.
+
+    """
+    def get(self, contest_id=None):
+        if contest_id is not None:
+            self.contest = self.safe_get_item(Contest, contest_id)
+
+        self.r_params = self.render_params()
+        self.r_params["services"] = \
+            sorted(self.application.service.remote_services.iterkeys())
+        self.render("rpcstatistics.html", **self.r_params)
+
+
 class AddContestHandler(BaseHandler):
     """Adds a new contest.
 
@@ -1168,6 +1183,7 @@ class ActivateDatasetHandler(BaseHandler):
         self.contest = task.contest
 
         task.active_dataset = dataset
+        update_task_scores(self.sql_session, task.id)
 
         if try_commit(self.sql_session, self):
             # self.application.service.scoring_service.reinitialize()
@@ -1291,6 +1307,8 @@ class AddTestcaseHandler(BaseHandler):
         if try_commit(self.sql_session, self):
             # max_score and/or extra_headers might have changed.
             self.application.service.proxy_service.reinitialize()
+            self.application.service.scoring_service.dataset_updated(
+                dataset_id=dataset.id)
             self.redirect("/task/%s" % task.id)
         else:
             self.redirect("/add_testcase/%s" % dataset_id)
@@ -1449,6 +1467,8 @@ class AddTestcasesHandler(BaseHandler):
              ", ".join(overwritten_tc) if overwritten_tc else "none",
              ", ".join(skipped_tc) if skipped_tc else "none"))
         self.application.service.proxy_service.reinitialize()
+        self.application.service.scoring_service.dataset_updated(
+            dataset_id=dataset.id)
         self.redirect("/task/%s" % task.id)
 
 
@@ -1458,6 +1478,7 @@ class DeleteTestcaseHandler(BaseHandler):
     """
     def get(self, testcase_id):
         testcase = self.safe_get_item(Testcase, testcase_id)
+        dataset_id = testcase.dataset_id
         task = testcase.dataset.task
         self.contest = task.contest
 
@@ -1466,6 +1487,8 @@ class DeleteTestcaseHandler(BaseHandler):
         if try_commit(self.sql_session, self):
             # max_score and/or extra_headers might have changed.
             self.application.service.proxy_service.reinitialize()
+            self.application.service.scoring_service.dataset_updated(
+                dataset_id=dataset_id)
         self.redirect("/task/%s" % task.id)
 
 
@@ -1606,7 +1629,15 @@ class TaskHandler(BaseHandler):
             self.redirect("/task/%s" % task_id)
             return
 
+        # The datasets whose scores have to be computed again, since
+        # their score type or public testcases changed.
+        to_rescore = list()
+
         for dataset in task.datasets:
+            scoring = (dataset.score_type, dataset.score_type_parameters,
+                       set(codename for codename, testcase
+                           in dataset.testcases.iteritems()
+                           if testcase.public))
             try:
                 attrs = dataset.get_attrs()
 
@@ -1630,9 +1661,18 @@ class TaskHandler(BaseHandler):
                 testcase.public = bool(self.get_argument(
                     "testcase_%s_public" % testcase.id, False))
 
+            if scoring != (dataset.score_type, dataset.score_type_parameters,
+                           set(codename for codename, testcase
+                               in dataset.testcases.iteritems()
+                               if testcase.public)):
+                to_rescore.append(dataset.id)
+
         if try_commit(self.sql_session, self):
             # Update the task on RWS.
             self.application.service.proxy_service.reinitialize()
+            for dataset_id in to_rescore:
+                self.application.service.scoring_service.rescore_dataset(
+                    dataset_id=dataset_id)
         self.redirect("/task/%s" % task_id)
 
 
@@ -1671,20 +1711,16 @@ class RankingHandler(BaseHandler):
 
     """
     def get(self, contest_id, format="online"):
-        # This validates the contest id.
-        self.safe_get_item(Contest, contest_id)
-
-        # This massive joined load gets all the information which we will need
-        # to generating the rankings.
-        self.contest = self.sql_session.query(Contest)\
-            .filter(Contest.id == contest_id)\
-            .options(joinedload('users'))\
-            .options(joinedload('users.submissions'))\
-            .options(joinedload('users.submissions.token'))\
-            .options(joinedload('users.submissions.results'))\
-            .first()
+        self.contest = self.safe_get_item(Contest, contest_id)
+
+        # The scores of the users on the tasks are stored: just a small
+        # row for each of them has to be loaded (the missing ones are
+        # computed, and stored, first).
+        task_scores = get_task_scores(self.sql_session, self.contest.id)
+        self.sql_session.commit()
 
         self.r_params = self.render_params()
+        self.r_params["task_scores"] = task_scores
         if format == "txt":
             self.set_header("Content-Type", "text/plain")
             self.set_header("Content-Disposition",
@@ -2053,5 +2089,7 @@ _aws_handlers = [
     (r"/resources", ResourcesHandler),
     (r"/resources/([0-9]+|all)", ResourcesHandler),
     (r"/resources/([0-9]+|all)/([0-9]+)", ResourcesHandler),
+    (r"/rpcstatistics", RPCStatisticsHandler),
+    (r"/rpcstatistics/([0-9]+)", RPCStatisticsHandler),
     (r"/notifications", NotificationsHandler),
 ]
@@ -69,6 +69,7 @@ from cms.io import WebService
 from cms.db import Session, Contest, User, Task, Question, Submission, Token, \
     File, UserTest, UserTestFile, UserTestManager
 from cms.db.filecacher import FileCacher
+from cms.grading import update_task_scores
 from cms.grading.tasktypes import get_task_type
 from cms.grading.scoretypes import get_score_type
 from cms.server import file_handler_gen, extract_archive, \
@@ -266,6 +267,7 @@ class BaseHandler(CommonRequestHandler):
             else:
                 return cms_locale.ugettext(message)
         cms_locale.translate = translate
+        cms_locale.code = lang
 
         return cms_locale
 
@@ -1239,6 +1241,7 @@ class SubmitHandler(BaseHandler):
         for filename, digest in file_digests.items():
             self.sql_session.add(File(filename, digest, submission=submission))
         self.sql_session.add(submission)
+        update_task_scores(self.sql_session, task.id, [self.current_user.id])
         self.sql_session.commit()
         self.application.service.evaluation_service.new_submission(
             submission_id=submission.id)
@@ -1302,6 +1305,8 @@ class UseTokenHandler(BaseHandler):
         if submission.token is None:
             token = Token(self.timestamp, submission=submission)
             self.sql_session.add(token)
+            update_task_scores(self.sql_session, task.id,
+                               [self.current_user.id])
             self.sql_session.commit()
         else:
             self.application.service.add_notification(
@@ -1423,7 +1428,8 @@ class SubmissionDetailsHandler(BaseHandler):
                 details = sr.public_score_details
 
             if sr.scored():
-                details = score_type.get_html_details(details, self._)
+                details = score_type.get_html_details(
+                    details, self._, self.locale.code)
             else:
                 details = None
 
@@ -37,14 +37,15 @@ from __future__ import unicode_literals
 import logging
 import random
 from datetime import timedelta
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 
 from cms import ServiceCoord, get_service_shards
-from cms.io import Service, rpc_method
+from cms.io import Service, rpc_method, chunked
 from cms.db import SessionGen, Contest, Dataset, Submission, \
     SubmissionResult, UserTest, UserTestResult
 from cms.service import get_submission_results, get_datasets_to_judge
 from cmscommon.datetime import make_datetime, make_timestamp
+from cms.grading import update_task_scores
 from cms.grading.Job import JobGroup
 
 
@@ -312,12 +313,20 @@ class JobQueue(object):
                         representation of the job, the priority and
                         the timestamp.
         """
-        ret = []
-        for data in self._queue:
-            ret.append({'job': data[2],
-                        'priority': data[0],
-                        'timestamp': make_timestamp(data[1])})
-        return ret
+        return list(self.iter_status())
+
+    def iter_status(self):
+        """Iterate over the content of the queue, as it was when the
+        iteration started. See get_status.
+
+        yield (dict): the representation of a job, its priority and
+            its timestamp.
+
+        """
+        for data in list(self._queue):
+            yield {'job': data[2],
+                   'priority': data[0],
+                   'timestamp': make_timestamp(data[1])}
 
 
 class WorkerPool(object):
@@ -868,12 +877,13 @@ class EvaluationService(Service):
     @rpc_method
     def queue_status(self):
         """Returns a list whose elements are the jobs currently in the
-        queue (see Queue.get_status).
+        queue (see Queue.get_status). It is streamed in chunks.
 
-        returns (list): the list with the queued elements.
+        returns (generator): the chunks of the list with the queued
+            elements.
 
         """
-        return self.queue.get_status()
+        return chunked(self.queue.iter_status())
 
     @rpc_method
     def workers_status(self):
@@ -1129,7 +1139,8 @@ class EvaluationService(Service):
             submission_result.sa_session.commit()
             self.scoring_service.new_evaluation(
                 submission_id=submission_result.submission_id,
-                dataset_id=submission_result.dataset_id)
+                dataset_id=submission_result.dataset_id,
+                batch=True)
         # If compilation failed for our fault, we requeue or not.
         elif submission_result.compilation_outcome is None:
             if submission_result.compilation_tries > \
@@ -1170,7 +1181,8 @@ class EvaluationService(Service):
             submission_result.sa_session.commit()
             self.scoring_service.new_evaluation(
                 submission_id=submission_result.submission_id,
-                dataset_id=submission_result.dataset_id)
+                dataset_id=submission_result.dataset_id,
+                batch=True)
         # Evaluation unsuccessful, we requeue (or not).
         elif submission_result.evaluation_tries > \
                 EvaluationService.MAX_EVALUATION_TRIES:
@@ -1378,6 +1390,9 @@ class EvaluationService(Service):
             if len(submission_results) == 0:
                 return
 
+            # The users whose scores on the tasks change, by task.
+            to_update = defaultdict(set)
+
             for submission_result in submission_results:
                 jobs = [
                     JobQueueEntry(
@@ -1422,6 +1437,15 @@ class EvaluationService(Service):
                             EvaluationService.JOB_PRIORITY_MEDIUM,
                             submission_result.submission.timestamp)
 
+                # Both levels blank the score.
+                submission = submission_result.submission
+                if submission_result.dataset_id == \
+                        submission.task.active_dataset_id:
+                    to_update[submission.task_id].add(submission.user_id)
+
+            for task_id_, user_ids in to_update.iteritems():
+                update_task_scores(session, task_id_, list(user_ids))
+
             session.commit()
 
     @rpc_method
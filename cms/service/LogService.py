@@ -36,6 +36,7 @@ from collections import deque
 from cms import config, mkdir
 from cms.log import root_logger, shell_handler, FileHandler, CustomFormatter
 from cms.io import Service, rpc_method
+from cms.service.LogStore import LogStore
 
 
 logger = logging.getLogger(__name__)
@@ -48,8 +49,17 @@ class LogService(Service):
 
     LAST_MESSAGES_COUNT = 100
 
-    def __init__(self, shard):
+    def __init__(self, shard, store_path=None):
+        """Initialize the LogService.
+
+        shard (int): the shard of the service.
+        store_path (unicode|None): the path of the database storing
+            the messages (see LogStore), or None for messages.db in
+            the log directory.
+
+        """
         Service.__init__(self, shard)
+        self._store = None
 
         # Determine location of log file, and make directories.
         log_dir = os.path.join(config.log_dir, "cms")
@@ -77,6 +87,18 @@ class LogService(Service):
 
         self._last_messages = deque(maxlen=self.LAST_MESSAGES_COUNT)
 
+        # The messages of all runs, to search them with query_messages.
+        if store_path is None:
+            store_path = os.path.join(log_dir, "messages.db")
+        self._store = LogStore(store_path)
+
+    def exit(self):
+        """See Service.exit."""
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        Service.exit(self)
+
     @rpc_method
     def Log(self, **kwargs):
         """Log a message.
@@ -99,6 +121,34 @@ class LogService(Service):
             operation that is going on in the service.
         exc_text (string): the text of the logged exception.
 
+        """
+        self._handle(kwargs)
+
+    @rpc_method
+    def log_records(self, records, dropped=0):
+        """Log many messages.
+
+        records ([dict]): the attributes of each LogRecord, as the
+            keyword arguments of Log.
+        dropped (int): how many records the sender had to drop (since
+            the last call) because it couldn't send them fast enough.
+
+        """
+        for kwargs in records:
+            self._handle(kwargs)
+        if dropped > 0:
+            coord = ""
+            if len(records) > 0:
+                coord = "%s,%s" % (records[0].get("service_name", ""),
+                                   records[0].get("service_shard", ""))
+            logger.warning("%d log messages from %s have been dropped.",
+                           dropped, coord)
+
+    def _handle(self, kwargs):
+        """Rebuild a LogRecord and handle it.
+
+        kwargs (dict): the attributes of the record (see Log).
+
         """
         record = logging.makeLogRecord(kwargs)
 
@@ -107,6 +157,9 @@ class LogService(Service):
         shell_handler.handle(record)
         # Write on the global log file.
         self.file_handler.handle(record)
+        # Records may still arrive while the service is exiting.
+        if self._store is not None:
+            self._store.add(record)
 
         if record.levelno >= logging.WARNING:
             if hasattr(record, "service_name") and \
@@ -125,3 +178,18 @@ class LogService(Service):
     @rpc_method
     def last_messages(self):
         return list(self._last_messages)
+
+    @rpc_method
+    def query_messages(self, service_name=None, service_shard=None,
+                       operation=None, submission_id=None, severity=None,
+                       start=None, stop=None, before=None, limit=100):
+        """Search the log messages received so far, also in past runs.
+
+        See LogStore.query for the arguments and the return value.
+
+        """
+        return self._store.query(
+            service_name=service_name, service_shard=service_shard,
+            operation=operation, submission_id=submission_id,
+            severity=severity, start=start, stop=stop, before=before,
+            limit=limit)
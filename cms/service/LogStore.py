@@ -0,0 +1,222 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Structured, queryable storage of the log messages of LogService.
+
+Besides writing them in the log files, LogService appends the messages
+it receives to a SQLite database, indexed by service, operation,
+submission and time, so that they can be searched without grepping
+the files.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import re
+import sqlite3
+
+import gevent
+
+
+logger = logging.getLogger(__name__)
+
+
+class LogStore(object):
+    """An append-only, indexed store of log messages.
+
+    Insertions are committed in a single transaction every
+    COMMIT_INTERVAL seconds, to avoid paying a disk synchronization
+    for each message.
+
+    """
+    COMMIT_INTERVAL = 1.0
+
+    # Maximum number of messages returned by a query.
+    MAX_LIMIT = 1000
+
+    # How to find the id of the submission a message is about in its
+    # operation or, failing that, in its text.
+    SUBMISSION_RE = re.compile(r"\bsubmission (\d+)")
+
+    # Rows in an index are also sorted by id, so when a query filters
+    # on the indexed columns the most recent messages are found first.
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "id INTEGER PRIMARY KEY, "
+        "timestamp REAL NOT NULL, "
+        "severity TEXT NOT NULL, "
+        "levelno INTEGER NOT NULL, "
+        "service_name TEXT, "
+        "service_shard INTEGER, "
+        "operation TEXT, "
+        "submission_id INTEGER, "
+        "message TEXT, "
+        "exc_text TEXT)",
+        "CREATE INDEX IF NOT EXISTS messages_timestamp "
+        "ON messages (timestamp)",
+        "CREATE INDEX IF NOT EXISTS messages_service "
+        "ON messages (service_name, service_shard)",
+        "CREATE INDEX IF NOT EXISTS messages_operation "
+        "ON messages (operation)",
+        "CREATE INDEX IF NOT EXISTS messages_submission_id "
+        "ON messages (submission_id)",
+        ]
+
+    def __init__(self, path):
+        """Open (creating it, if needed) the store at the given path.
+
+        path (string): the path of the SQLite database.
+
+        """
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+        self._committer = None
+
+    def add(self, record):
+        """Append a message.
+
+        record (LogRecord): the message, as rebuilt by LogService.
+
+        """
+        operation = getattr(record, "operation", None)
+        message = record.getMessage()
+        match = None
+        if operation is not None:
+            match = self.SUBMISSION_RE.search(operation)
+        if match is None:
+            match = self.SUBMISSION_RE.search(message)
+        submission_id = int(match.group(1)) if match is not None else None
+
+        self._connection.execute(
+            "INSERT INTO messages (timestamp, severity, levelno, "
+            "service_name, service_shard, operation, submission_id, "
+            "message, exc_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record.created, record.levelname, record.levelno,
+             getattr(record, "service_name", None),
+             getattr(record, "service_shard", None),
+             operation, submission_id, message,
+             getattr(record, "exc_text", None)))
+
+        if self._committer is None:
+            self._committer = gevent.spawn_later(self.COMMIT_INTERVAL,
+                                                 self.commit)
+
+    def commit(self):
+        """Make the messages added so far persistent.
+
+        """
+        if self._committer is not None and \
+                self._committer is not gevent.getcurrent():
+            self._committer.kill(block=False)
+        self._committer = None
+        try:
+            self._connection.commit()
+        except sqlite3.Error as error:
+            logger.error("Couldn't store log messages: %s.", error)
+
+    def query(self, service_name=None, service_shard=None, operation=None,
+              submission_id=None, severity=None, start=None, stop=None,
+              before=None, limit=100):
+        """Return the messages satisfying all the given conditions.
+
+        Messages are returned from the most recent; to get the next
+        page, repeat the query passing as before the returned value
+        of "next".
+
+        service_name (unicode|None): the service that sent them.
+        service_shard (int|None): the shard of that service.
+        operation (unicode|None): their operation.
+        submission_id (int|None): the submission they are about.
+        severity (unicode|None): the minimum severity, e.g., "WARNING".
+        start (float|None): the minimum timestamp.
+        stop (float|None): the maximum timestamp (excluded).
+        before (int|None): the maximum id (excluded).
+        limit (int): the maximum number of messages to return.
+
+        return (dict): "messages", a list of dicts with the same fields
+            as LogService.last_messages plus "id", and "next", the value
+            of before to get the next page (or None if there is none).
+
+        raise (ValueError): if severity is not a level name.
+
+        """
+        conditions = list()
+        params = list()
+        for column, value in [("service_name", service_name),
+                              ("service_shard", service_shard),
+                              ("operation", operation),
+                              ("submission_id", submission_id)]:
+            if value is not None:
+                conditions.append("%s = ?" % column)
+                params.append(value)
+        if severity is not None:
+            levelno = logging.getLevelName(severity)
+            if not isinstance(levelno, int):
+                raise ValueError("Unknown severity %s." % severity)
+            conditions.append("levelno >= ?")
+            params.append(levelno)
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if stop is not None:
+            conditions.append("timestamp < ?")
+            params.append(stop)
+        if before is not None:
+            conditions.append("id < ?")
+            params.append(before)
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        # Fetch one more row, to know whether there is another page.
+        query = "SELECT id, timestamp, severity, service_name, " \
+            "service_shard, operation, message, exc_text FROM messages"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self._connection.execute(query, params).fetchall()
+
+        messages = list()
+        for row in rows[:limit]:
+            id_, timestamp, severity_, name, shard, operation_, message, \
+                exc_text = row
+            messages.append({
+                "id": id_,
+                "message": message,
+                "coord": "%s,%s" % (name, shard) if name is not None else "",
+                "operation": operation_ if operation_ is not None else "",
+                "severity": severity_,
+                "timestamp": timestamp,
+                "exc_text": exc_text})
+        return {
+            "messages": messages,
+            "next": messages[-1]["id"] if len(rows) > limit else None,
+            }
+
+    def close(self):
+        """Commit and close the store.
+
+        """
+        self.commit()
+        self._connection.close()
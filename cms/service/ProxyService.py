@@ -43,6 +43,7 @@ from urlparse import urljoin, urlsplit
 from cms import config
 from cms.io import Service, rpc_method
 from cms.db import SessionGen, Contest, Task, Submission
+from cms.grading.ScoreType import decode_details
 from cms.grading.scoretypes import get_score_type
 from cmscommon.datetime import make_timestamp
 
@@ -387,7 +388,7 @@ class ProxyService(Service):
             # We're sending the unrounded score to RWS
             subchange_data["score"] = submission_result.score
             subchange_data["extra"] = \
-                json.loads(submission_result.ranking_score_details)
+                decode_details(submission_result.ranking_score_details)
 
         # Adding operations to the queue.
         for ranking in self.rankings:
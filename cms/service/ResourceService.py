@@ -29,10 +29,10 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import bisect
 import logging
 import os
 import time
+from array import array
 
 import psutil
 
@@ -62,12 +62,136 @@ else:
          "get_memory_info", "get_num_threads"]
 
 
+# The metrics of the machine whose history we keep, by group.
+HISTORY_METRICS = {
+    "cpu": ["user", "nice", "system", "idle", "iowait", "irq", "softirq"],
+    "memory": ["ram_total", "ram_available", "ram_cached", "ram_buffers",
+               "ram_used", "swap_total", "swap_available", "swap_used"],
+    }
+
+
+def delta_encode(values):
+    """Encode a sequence of integers as the differences between each
+    one and the previous one (the first is left as is).
+
+    values ([int]): the values.
+
+    return ([int]): their encoding, usually with smaller numbers.
+
+    """
+    return [b - a for a, b in zip([0] + values, values)]
+
+
+def delta_decode(deltas):
+    """Invert delta_encode.
+
+    deltas ([int]): the encoded values.
+
+    return ([int]): the values.
+
+    """
+    values = list()
+    value = 0
+    for delta in deltas:
+        value += delta
+        values.append(value)
+    return values
+
+
+class ResourceHistory(object):
+    """The latest values of some integer metrics, sampled together.
+
+    Each metric (and the time of the samples) is stored in a ring
+    buffer backed by an array of fixed size, so that adding a sample
+    costs the same when the history is full, without allocating, and
+    the values after a given time can be extracted as slices.
+
+    """
+    def __init__(self, metrics, size):
+        """Create an empty history.
+
+        metrics ([object]): the (hashable) keys of the metrics.
+        size (int): how many samples to keep at most.
+
+        """
+        self.size = size
+        self._times = array(b"l", [0]) * size
+        self._values = dict((metric, array(b"l", [0]) * size)
+                            for metric in metrics)
+        # Position of the oldest sample, and number of samples.
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, time_, values):
+        """Add a sample, dropping the oldest if the history is full.
+
+        time_ (int): the time of the sample, not smaller than the
+            previous ones.
+        values ({object: int}): the value of each metric.
+
+        """
+        pos = (self._start + self._count) % self.size
+        if self._count == self.size:
+            self._start = (self._start + 1) % self.size
+        else:
+            self._count += 1
+        self._times[pos] = time_
+        for metric, buf in self._values.iteritems():
+            buf[pos] = values[metric]
+
+    def _time_at(self, index):
+        """Return the time of the index-th oldest sample."""
+        return self._times[(self._start + index) % self.size]
+
+    def _slice(self, buf, index):
+        """Return the values of a buffer from the index-th oldest."""
+        begin = self._start + index
+        end = self._start + self._count
+        if end <= self.size:
+            return buf[begin:end].tolist()
+        elif begin >= self.size:
+            return buf[begin - self.size:end - self.size].tolist()
+        else:
+            return buf[begin:].tolist() + buf[:end - self.size].tolist()
+
+    def since(self, last_time):
+        """Return the samples taken after the given time.
+
+        last_time (float): the time.
+
+        return (([int], {object: [int]})): the times of the samples,
+            and the values of each metric.
+
+        """
+        # Bisect on the (sorted) times.
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._time_at(mid) <= last_time:
+                low = mid + 1
+            else:
+                high = mid
+        return (self._slice(self._times, low),
+                dict((metric, self._slice(buf, low))
+                     for metric, buf in self._values.iteritems()))
+
+
 class ResourceService(Service):
     """This service looks at the resources usage (CPU, load, memory,
     network) every seconds, stores it locally, and offer (new) data
     upon request.
 
     """
+    # How many samples to keep (almost 7 hours).
+    HISTORY_SIZE = 5000
+
+    # How often (in seconds) to look for the processes of the services
+    # that are not running even if no process started or ended.
+    PROCESS_SCAN_INTERVAL = 60.0
+
     def __init__(self, shard, contest_id=None):
         """If contest_id is not None, we assume the user wants the
         autorestart feature.
@@ -77,8 +201,13 @@ class ResourceService(Service):
 
         self.contest_id = contest_id
 
-        # _local_store is a dictionary indexed by time in int(epoch)
-        self._local_store = []
+        # History of the metrics of the machine, and the data of the
+        # latest sample (that also includes the services).
+        self._history = ResourceHistory(
+            [(group, field) for group, fields in HISTORY_METRICS.iteritems()
+             for field in fields],
+            self.HISTORY_SIZE)
+        self._last_data = None
         # Floating point epoch using for precise measurement of percents
         self._last_saved_time = time.time()
         # Starting point for cpu times
@@ -92,6 +221,10 @@ class ResourceService(Service):
         # Found process associate to the ServiceCoord.
         self._procs = dict((service, None)
                            for service in self._local_services)
+        # The PIDs existing when we last looked for the processes of
+        # the services, and when that was.
+        self._scanned_pids = None
+        self._last_scan_time = 0.0
         # Previous cpu time for each service.
         self._services_prev_cpu_times = \
             dict((service, (0.0, 0.0)) for service in self._local_services)
@@ -121,6 +254,7 @@ class ResourceService(Service):
         self._launched_processes = new_launched_processes
 
         # Look for dead processes, and restart them.
+        self._refresh_procs()
         for service in self._local_services:
             # We let the user start logservice and resourceservice.
             if service.name == "LogService" or \
@@ -132,27 +266,7 @@ class ResourceService(Service):
             if not self._will_restart[service]:
                 continue
 
-            running = True
-            proc = self._procs[service]
-            # If we don't have a previously found process for the
-            # service, we find it
-            if proc is None:
-                proc = self._find_proc(service)
-            if proc is None:
-                running = False
-            else:
-                self._procs[service] = proc
-                # We have a process, but maybe it has been shut down
-                if not proc.is_running():
-                    # If so, let us find the new one
-                    proc = self._find_proc(service)
-                    # If there is no new one, continue
-                    if proc is None:
-                        running = False
-                    else:
-                        self._procs[service] = proc
-
-            if not running:
+            if self._procs[service] is None:
                 # We give contest_id even if the service doesn't need
                 # it, since it causes no trouble.
                 logger.info("Restarting (%s, %s)..." % (service.name,
@@ -234,26 +348,51 @@ class ResourceService(Service):
 
         return True
 
-    def _find_proc(self, service):
-        """Returns the pid of a given service running on this machine.
+    def _refresh_procs(self):
+        """Update the processes of the services running on this machine.
 
-        service (ServiceCoord): the service we are interested in
-        returns (psutil.Process): the process of service, or None if
-                                  not found
+        The processes found before are kept while they are running.
+        Those of the other services are looked for among all the
+        processes, but only if some process started or ended since
+        the last time we looked (or if that was long ago), as that is
+        expensive.
 
         """
-        logger.debug("ResourceService._find_proc")
-        for proc in psutil.get_process_list():
+        missing = set()
+        for service in self._local_services:
+            proc = self._procs[service]
+            if proc is not None and not proc.is_running():
+                self._procs[service] = None
+                proc = None
+            if proc is None:
+                missing.add(service)
+        if len(missing) == 0:
+            return
+
+        pids = frozenset(psutil.pids() if PSUTIL2 else psutil.get_pid_list())
+        now = time.time()
+        if pids == self._scanned_pids and \
+                now - self._last_scan_time < self.PROCESS_SCAN_INTERVAL:
+            return
+        logger.debug("ResourceService._refresh_procs")
+        self._scanned_pids = pids
+        self._last_scan_time = now
+
+        for proc in psutil.process_iter():
             try:
                 proc_info = proc.as_dict(attrs=PSUTIL_PROC_ATTRS)
+            except psutil.NoSuchProcess:
+                continue
+            for service in missing:
                 if ResourceService._is_service_proc(
                         service, proc_info["cmdline"]):
+                    self._procs[service] = proc
                     self._services_prev_cpu_times[service] = \
                         proc_info["cpu_times"]
-                    return proc
-            except psutil.NoSuchProcess:
-                continue
-        return None
+                    missing.discard(service)
+                    break
+            if len(missing) == 0:
+                break
 
     @staticmethod
     def _get_cpu_times():
@@ -320,34 +459,22 @@ class ResourceService(Service):
 
         data["services"] = {}
         # Details of our services
+        self._refresh_procs()
         for service in self._local_services:
             dic = {"autorestart": self._will_restart[service],
                    "running": True}
             proc = self._procs[service]
-            # If we don't have a previously found process for the
-            # service, we find it
-            if proc is None:
-                proc = self._find_proc(service)
-            # If we still do not find it, there is no process
+            # If there is no process, we have nothing to do.
             if proc is None:
                 dic["running"] = False
-            # We have a process, but maybe it has been shut down
-            elif not proc.is_running():
-                # If so, let us find the new one
-                proc = self._find_proc(service)
-                # If there is no new one, continue
-                if proc is None:
-                    dic["running"] = False
-            # If the process is not running, we have nothing to do.
-            if not dic["running"]:
                 data["services"][str(service)] = dic
                 continue
 
             try:
                 proc_info = proc.as_dict(attrs=PSUTIL_PROC_ATTRS)
                 dic["since"] = self._last_saved_time - proc_info["create_time"]
-                dic["resident"], dic["virtual"] = \
-                    (x // B_TO_MB for x in proc_info["memory_info"])
+                dic["resident"] = proc_info["memory_info"].rss // B_TO_MB
+                dic["virtual"] = proc_info["memory_info"].vms // B_TO_MB
                 cpu_times = proc_info["cpu_times"]
                 dic["user"] = int(
                     round((cpu_times[0] -
@@ -363,17 +490,19 @@ class ResourceService(Service):
                 except AttributeError:
                     dic["threads"] = 0  # 0 = Not implemented
 
-                self._procs[service] = proc
             except psutil.NoSuchProcess:
                 # Shut down while we operated?
+                self._procs[service] = None
                 dic = {"autorestart": self._will_restart[service],
                        "running": False}
             data["services"][str(service)] = dic
 
         if store:
-            if len(self._local_store) >= 5000:  # almost 7 hours
-                self._local_store = self._local_store[1:]
-            self._local_store.append((now, data))
+            self._history.append(now, dict(
+                ((group, field), int(round(data[group][field])))
+                for group, fields in HISTORY_METRICS.iteritems()
+                for field in fields))
+            self._last_data = data
 
         return True
 
@@ -382,13 +511,36 @@ class ResourceService(Service):
         """Returns the resurce usage information from last_time to
         now.
 
+        The history of each metric of the machine is a list of
+        integers (percentages for the CPU, MiB for the memory), delta
+        encoded (see delta_encode), as are the timestamps of the
+        samples. Only the latest state of the services is returned.
+
         last_time (float): timestamp of the last time the caller
             called this method.
 
+        returns (dict): the "time" of each sample after last_time, the
+            history of the metrics in "cpu" and "memory" (dicts of
+            lists, with the same keys of the ones in _store_resources),
+            the number of CPUs in "num_cpu" and the data of the
+            services in "services" (or None, if no sample is stored).
+
         """
         logger.debug("ResourceService._get_resources")
-        index = bisect.bisect_right(self._local_store, (last_time, 0))
-        return self._local_store[index:]
+        times, values = self._history.since(last_time)
+        result = {
+            "time": delta_encode(times),
+            "num_cpu": None,
+            "services": None,
+            }
+        for group, fields in HISTORY_METRICS.iteritems():
+            result[group] = dict(
+                (field, delta_encode(values[(group, field)]))
+                for field in fields)
+        if self._last_data is not None:
+            result["num_cpu"] = self._last_data["cpu"]["num_cpu"]
+            result["services"] = self._last_data["services"]
+        return result
 
     @rpc_method
     def kill_service(self, service):
@@ -30,14 +30,20 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import logging
+from collections import defaultdict, deque
 
 import gevent
-from gevent.queue import JoinableQueue
 from gevent.event import Event
+from sqlalchemy import or_, tuple_
+from sqlalchemy.orm import joinedload, subqueryload
 
 from cms import ServiceCoord
 from cms.io import Service, rpc_method
-from cms.db import SessionGen, Submission, Dataset
+from cms.db import SessionGen, Submission, Dataset, SubmissionResult, \
+    Evaluation, Testcase, Token, User
+from cms.grading import get_task_scores, task_score_from_results, \
+    update_task_scores
+from cms.grading.ScoreType import OutcomeMatrix
 from cms.grading.scoretypes import get_score_type
 from cms.service import get_submission_results
 from cmscommon.datetime import monotonic_time
@@ -46,6 +52,99 @@ from cmscommon.datetime import monotonic_time
 logger = logging.getLogger(__name__)
 
 
+class ScorerQueue(object):
+    """The submission results waiting to be scored.
+
+    Items are (submission_id, dataset_id) pairs, each with a priority:
+    those with higher priority are extracted first, those with the
+    same priority in FIFO order. An item is never in the queue twice:
+    putting it again just raises its priority, if the new one is
+    higher.
+
+    """
+    # Priorities, from the highest: results of live submissions (just
+    # evaluated), and results to score because of a bulk operation
+    # (an invalidation, or a sweep).
+    PRIORITY_LIVE = 0
+    PRIORITY_BULK = 1
+    PRIORITY_NAMES = ["live", "bulk"]
+
+    def __init__(self):
+        # A FIFO for each priority. Items whose priority is raised are
+        # left also in the FIFO of the old one, and skipped there.
+        self._fifos = [deque() for _ in self.PRIORITY_NAMES]
+        # The priority of each item in the queue.
+        self._priorities = dict()
+        # How many items each FIFO contains, not counting the skipped.
+        self._depths = [0 for _ in self.PRIORITY_NAMES]
+        # Set when the queue is not empty.
+        self._not_empty = Event()
+        # How many items have been put, and how many of them were
+        # already in the queue.
+        self.put_count = 0
+        self.duplicate_count = 0
+
+    def __len__(self):
+        return len(self._priorities)
+
+    def put(self, item, priority):
+        """Add an item, or raise its priority if already present.
+
+        item ((int, int)): the item.
+        priority (int): its priority, one of the PRIORITY_* constants.
+
+        """
+        self.put_count += 1
+        old_priority = self._priorities.get(item)
+        if old_priority is not None:
+            self.duplicate_count += 1
+            if old_priority <= priority:
+                return
+            self._depths[old_priority] -= 1
+        self._priorities[item] = priority
+        self._fifos[priority].append(item)
+        self._depths[priority] += 1
+        self._not_empty.set()
+
+    def get(self, max_count):
+        """Extract the first items, waiting if the queue is empty.
+
+        max_count (int): the maximum number of items to return.
+
+        return ([(int, int)]): the items (at least one).
+
+        """
+        while len(self._priorities) == 0:
+            self._not_empty.clear()
+            self._not_empty.wait()
+
+        items = list()
+        for priority, fifo in enumerate(self._fifos):
+            while len(items) < max_count and len(fifo) > 0:
+                item = fifo.popleft()
+                if self._priorities.get(item) != priority:
+                    continue
+                del self._priorities[item]
+                self._depths[priority] -= 1
+                items.append(item)
+        return items
+
+    def status(self):
+        """Return the metrics of the queue.
+
+        return (dict): the number of items waiting for each priority
+            (as a dict indexed by their names), the total number of
+            items put in the queue and how many of them were already
+            present.
+
+        """
+        return {
+            "depth": dict(zip(self.PRIORITY_NAMES, self._depths)),
+            "put": self.put_count,
+            "duplicates": self.duplicate_count,
+            }
+
+
 class ScoringService(Service):
     """A service that assigns a score to submission results.
 
@@ -58,17 +157,26 @@ class ScoringService(Service):
     defined by the dataset of the result.
 
     ScoringService keeps a queue of (submission_id, dataset_id) pairs
-    identifying submission results to score. A greenlet is spawned to
-    consume this queue, one item at a time. The queue is filled by the
-    new_evaluation and the invalidate_submissions RPC methods, and by a
-    sweeper greenlet, whose duty is to regularly check all submissions
-    in the database and put the unscored ones in the queue (this check
-    can also be forced by the search_jobs_not_done RPC method).
+    identifying submission results to score (see ScorerQueue). A
+    greenlet is spawned to consume this queue, many items at a time.
+    The queue is filled by the new_evaluation (with high priority) and
+    the invalidate_submissions RPC methods, and by a sweeper greenlet,
+    whose duty is to regularly check all submissions in the database
+    and put the unscored ones in the queue (this check can also be
+    forced by the search_jobs_not_done RPC method).
 
     """
 
-    # How often we look for submission results not scored.
+    # How often we look for submission results not scored, and how
+    # many of them we fetch at a time.
     SWEEPER_TIMEOUT = 347.0
+    SWEEPER_PAGE_SIZE = 1000
+
+    # How many submission results to score at most in a transaction.
+    SCORER_BATCH_SIZE = 100
+
+    # How many submission results rescore_dataset scores at a time.
+    RESCORE_PAGE_SIZE = 1000
 
     def __init__(self, shard):
         """Initialize the ScoringService.
@@ -81,9 +189,13 @@ class ScoringService(Service):
 
         # Set up and spawn the scorer.
         # TODO Link to greenlet: when it dies, log CRITICAL and exit.
-        self._scorer_queue = JoinableQueue()
+        self._scorer_queue = ScorerQueue()
         gevent.spawn(self._scorer_loop)
 
+        # The ScoreType of each dataset, with the name and parameters it
+        # was built from.
+        self._score_types = dict()
+
         # Set up and spawn the sweeper.
         # TODO Link to greenlet: when it dies, log CRITICAL and exit.
         self._sweeper_start = None
@@ -91,88 +203,152 @@ class ScoringService(Service):
         gevent.spawn(self._sweeper_loop)
 
     def _scorer_loop(self):
-        """Monitor the queue, scoring its top element.
+        """Monitor the queue, scoring its top elements.
 
-        This is an infinite loop that, at each iteration, gets an item
-        from the queue (blocking until there is one, if the queue is
-        empty) and scores it. Any error during the scoring is sent to
-        the logger and then suppressed, because the loop must go on.
+        This is an infinite loop that, at each iteration, gets the
+        first items in the queue (up to SCORER_BATCH_SIZE of them,
+        blocking until there is one, if the queue is empty) and scores
+        them. Any error during the scoring is sent to the logger and
+        then suppressed, because the loop must go on.
 
         """
         while True:
-            submission_id, dataset_id = self._scorer_queue.get()
+            items = self._scorer_queue.get(self.SCORER_BATCH_SIZE)
             try:
-                self._score(submission_id, dataset_id)
+                self._score_batch(items)
             except Exception:
-                logger.error("Unexpected error when scoring submission %d on "
-                             "dataset %d.", submission_id, dataset_id,
-                             exc_info=True)
-            finally:
-                self._scorer_queue.task_done()
+                logger.error("Unexpected error when scoring %d submission "
+                             "results.", len(items), exc_info=True)
 
-    def _score(self, submission_id, dataset_id):
-        """Assign a score to a submission result.
+    @staticmethod
+    def _load_submission_results(session, items):
+        """Load some submission results with all they need for scoring.
 
-        This is the core of ScoringService: here we retrieve the result
-        from the database, check if it is in the correct status,
-        instantiate its ScoreType, compute its score, store it back in
-        the database and tell ProxyService to update RWS if needed.
+        A constant number of queries is issued, independently of the
+        number of results: their submissions and datasets are joined,
+        and their evaluations and the testcases of the datasets are
+        loaded with a query each.
 
-        submission_id (int): the id of the submission that has to be
-            scored.
-        dataset_id (int): the id of the dataset to use.
+        session (Session): the session to use.
+        items ([(int, int)]): the ids of the submissions and the
+            datasets of the results.
+
+        return ({(int, int): SubmissionResult}): the results found,
+            indexed by their submission id and dataset id.
 
         """
-        with SessionGen() as session:
-            # Obtain submission.
-            submission = Submission.get_from_id(submission_id, session)
-            if submission is None:
-                raise ValueError("Submission %d not found in the database." %
-                                 submission_id)
+        submission_results = session.query(SubmissionResult)\
+            .filter(tuple_(SubmissionResult.submission_id,
+                           SubmissionResult.dataset_id).in_(items))\
+            .options(joinedload(SubmissionResult.submission)
+                     .joinedload(Submission.task))\
+            .options(joinedload(SubmissionResult.dataset)
+                     .subqueryload(Dataset.testcases))\
+            .options(subqueryload(SubmissionResult.evaluations)).all()
+        # The testcases of the evaluations need no further query, as
+        # they are already in the session with those of the datasets.
+        return dict(((sr.submission_id, sr.dataset_id), sr)
+                    for sr in submission_results)
+
+    def _get_score_type(self, dataset):
+        """Return the ScoreType of a dataset, reusing it if possible.
+
+        Building a ScoreType means decoding its parameters and
+        computing the maximum scores, so we keep the one of each
+        dataset, and build it again only if the name of the score type
+        or its parameters change, or if we are told that the dataset
+        changed (see dataset_updated), e.g., its testcases.
+
+        dataset (Dataset): the dataset.
+
+        return (ScoreType): its score type.
 
-            # Obtain dataset.
-            dataset = Dataset.get_from_id(dataset_id, session)
-            if dataset is None:
-                raise ValueError("Dataset %d not found in the database." %
-                                 dataset_id)
-
-            # Obtain submission result.
-            submission_result = submission.get_result(dataset)
-
-            # It means it was not even compiled (for some reason).
-            if submission_result is None:
-                raise ValueError("Submission result %d(%d) was not found." %
-                                 (submission_id, dataset_id))
-
-            # Check if it's ready to be scored.
-            if not submission_result.needs_scoring():
-                if submission_result.scored():
-                    logger.info("Submission result %d(%d) is already scored.",
-                                submission_id, dataset_id)
-                    return
-                else:
-                    raise ValueError("The state of the submission result "
-                                     "%d(%d) doesn't allow scoring." %
-                                     (submission_id, dataset_id))
-
-            # Instantiate the score type.
-            score_type = get_score_type(dataset=dataset)
-
-            # Compute score and fill it in the database.
-            submission_result.score, \
-                submission_result.score_details, \
-                submission_result.public_score, \
-                submission_result.public_score_details, \
-                submission_result.ranking_score_details = \
-                score_type.compute_score(submission_result)
-
-            # Store it.
+        """
+        key = (dataset.score_type, dataset.score_type_parameters)
+        cached = self._score_types.get(dataset.id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        score_type = get_score_type(dataset=dataset)
+        self._score_types[dataset.id] = (key, score_type)
+        return score_type
+
+    def _score_batch(self, items):
+        """Assign a score to some submission results.
+
+        This is the core of ScoringService: here we retrieve the results
+        from the database, check if they are in the correct status,
+        instantiate their ScoreTypes, compute their scores, store them
+        back in the database (in a single transaction), together with
+        the scores of the users on the tasks, and tell ProxyService to
+        update RWS if needed.
+
+        items ([(int, int)]): the ids of the submissions and datasets
+            of the results that have to be scored.
+
+        """
+        to_notify = list()
+        # The users whose scores on the tasks change, by task.
+        to_update = defaultdict(set)
+
+        with SessionGen() as session:
+            submission_results = \
+                self._load_submission_results(session, items)
+
+            for submission_id, dataset_id in items:
+                submission_result = \
+                    submission_results.get((submission_id, dataset_id))
+
+                # It means it was not even compiled (for some reason),
+                # or that the submission or the dataset don't exist.
+                if submission_result is None:
+                    logger.error("Submission result %d(%d) was not found.",
+                                 submission_id, dataset_id)
+                    continue
+
+                # Check if it's ready to be scored.
+                if not submission_result.needs_scoring():
+                    if submission_result.scored():
+                        logger.info("Submission result %d(%d) is already "
+                                    "scored.", submission_id, dataset_id)
+                    else:
+                        logger.error("The state of the submission result "
+                                     "%d(%d) doesn't allow scoring.",
+                                     submission_id, dataset_id)
+                    continue
+
+                try:
+                    # Instantiate the score type.
+                    score_type = self._get_score_type(
+                        submission_result.dataset)
+
+                    # Compute score and fill it in the database.
+                    submission_result.score, \
+                        submission_result.score_details, \
+                        submission_result.public_score, \
+                        submission_result.public_score_details, \
+                        submission_result.ranking_score_details = \
+                        score_type.compute_score(submission_result)
+                except Exception:
+                    logger.error("Unexpected error when scoring submission "
+                                 "%d on dataset %d.", submission_id,
+                                 dataset_id, exc_info=True)
+                    continue
+
+                # If dataset is the active one, RWS will need an update.
+                submission = submission_result.submission
+                if dataset_id == submission.task.active_dataset_id:
+                    to_notify.append(submission_id)
+                    to_update[submission.task_id].add(submission.user_id)
+
+            for task_id, user_ids in to_update.iteritems():
+                update_task_scores(session, task_id, list(user_ids))
+
+            # Store them.
             session.commit()
 
-            # If dataset is the active one, update RWS.
-            if dataset is submission.task.active_dataset:
-                self.proxy_service.submission_scored(
-                    submission_id=submission.id)
+        for submission_id in to_notify:
+            self.proxy_service.submission_scored(
+                submission_id=submission_id, batch=True)
 
     def _sweeper_loop(self):
         """Regularly check the database for unscored results.
@@ -209,22 +385,363 @@ class ScoringService(Service):
     def _sweep(self):
         """Check the database for unscored submission results.
 
-        Obtain a list of all the submission results in the database,
-        check each of them to see if it's still unscored and, in case,
-        put it in the queue.
+        Ask the database for the submission results that need scoring
+        (see SubmissionResult.needs_scoring), fetching only their ids,
+        a page at a time, and put them in the queue.
 
         """
         counter = 0
+        last = None
 
         with SessionGen() as session:
-            for sr in get_submission_results(session=session):
-                if sr is not None and sr.needs_scoring():
-                    self._scorer_queue.put((sr.submission_id, sr.dataset_id))
-                    counter += 1
+            while True:
+                page = self._get_unscored_page(session, last)
+                for item in page:
+                    self._scorer_queue.put(item, ScorerQueue.PRIORITY_BULK)
+                counter += len(page)
+                if len(page) < self.SWEEPER_PAGE_SIZE:
+                    break
+                last = page[-1]
 
         if counter > 0:
             logger.info("Found %d unscored submissions.", counter)
 
+    @classmethod
+    def _get_unscored_page(cls, session, last=None):
+        """Return the ids of some submission results needing scoring.
+
+        That is, those whose compilation failed or that have been
+        evaluated, and that miss any of the score fields.
+
+        session (Session): the session to use.
+        last ((int, int)|None): return only the results after this
+            (submission_id, dataset_id) pair.
+
+        return ([(int, int)]): the ids of the submissions and datasets
+            of at most SWEEPER_PAGE_SIZE results, in order.
+
+        """
+        query = session.query(SubmissionResult.submission_id,
+                              SubmissionResult.dataset_id)\
+            .filter(or_(SubmissionResult.compilation_outcome == "fail",
+                        SubmissionResult.evaluation_outcome.isnot(None)))\
+            .filter(or_(SubmissionResult.score.is_(None),
+                        SubmissionResult.score_details.is_(None),
+                        SubmissionResult.public_score.is_(None),
+                        SubmissionResult.public_score_details.is_(None),
+                        SubmissionResult.ranking_score_details.is_(None)))
+        if last is not None:
+            query = query.filter(tuple_(SubmissionResult.submission_id,
+                                        SubmissionResult.dataset_id) >
+                                 tuple_(*last))
+        return [tuple(row) for row in query
+                .order_by(SubmissionResult.submission_id,
+                          SubmissionResult.dataset_id)
+                .limit(cls.SWEEPER_PAGE_SIZE).all()]
+
+    @staticmethod
+    def _load_outcome_matrix(session, dataset_id, codenames, last=None,
+                             limit=None):
+        """Load the outcomes of the scorable results of a dataset.
+
+        Only two queries are issued, both returning plain columns, so
+        that no SubmissionResult or Evaluation object is built.
+
+        session (Session): the session to use.
+        dataset_id (int): the id of the dataset.
+        codenames ([unicode]): the codenames of its testcases.
+        last (int|None): load only the results of the submissions
+            after this one.
+        limit (int|None): load at most this many results (the first
+            ones, by submission id), or all of them if None.
+
+        return ((OutcomeMatrix, [int])): a row for each result whose
+            compilation failed or that was evaluated, and the ids of the
+            submissions of those left out because they lack some
+            evaluation.
+
+        """
+        results = session.query(SubmissionResult.submission_id,
+                                SubmissionResult.evaluation_outcome)\
+            .filter(SubmissionResult.dataset_id == dataset_id)\
+            .filter(or_(SubmissionResult.compilation_outcome == "fail",
+                        SubmissionResult.evaluation_outcome.isnot(None)))
+        if last is not None:
+            results = results.filter(SubmissionResult.submission_id > last)
+        results = results.order_by(SubmissionResult.submission_id)\
+            .limit(limit).all()
+        evaluated = set(submission_id
+                        for submission_id, outcome in results
+                        if outcome is not None)
+
+        evaluations = defaultdict(list)
+        if len(evaluated) > 0:
+            query = session.query(Evaluation.submission_id,
+                                  Testcase.codename,
+                                  Evaluation.outcome,
+                                  Evaluation.text,
+                                  Evaluation.execution_time,
+                                  Evaluation.execution_memory)\
+                .join(Evaluation.testcase)\
+                .filter(Evaluation.dataset_id == dataset_id)
+            if last is not None or limit is not None:
+                query = query.filter(Evaluation.submission_id.between(
+                    results[0][0], results[-1][0]))
+            for row in query:
+                if row[0] in evaluated:
+                    evaluations[row[0]].append(row[1:])
+
+        matrix = OutcomeMatrix(codenames)
+        incomplete = list()
+        for submission_id, _ in results:
+            try:
+                matrix.add_row(submission_id,
+                               evaluations[submission_id]
+                               if submission_id in evaluated else None)
+            except KeyError as error:
+                logger.error("Submission result %d(%d) has no evaluation "
+                             "on testcase %s.", submission_id, dataset_id,
+                             error)
+                incomplete.append(submission_id)
+        return matrix, incomplete
+
+    @rpc_method
+    def rescore_dataset(self, dataset_id):
+        """Compute again the scores of all the results of a dataset.
+
+        To be used when only the score type of the dataset, its
+        parameters or the public testcases changed, and thus the
+        evaluations are still valid. The results are processed a page
+        of RESCORE_PAGE_SIZE at a time, each in its own transaction,
+        yielding to the other greenlets in between: the outcomes of the
+        page are loaded at once, scored in bulk by the score type and
+        written back with a single bulk update. If the score type can't
+        do it, the results are invalidated and scored one by one; so
+        are those lacking some evaluation, that can't be scored in bulk.
+
+        dataset_id (int): the id of the dataset.
+
+        """
+        logger.info("Rescoring dataset %d.", dataset_id)
+        self._score_types.pop(dataset_id, None)
+
+        counter = 0
+        incomplete = list()
+        last = None
+        while True:
+            with SessionGen() as session:
+                dataset = Dataset.get_from_id(dataset_id, session)
+                if dataset is None:
+                    logger.error("Dataset %d was not found.", dataset_id)
+                    return
+                active = dataset_id == dataset.task.active_dataset_id
+                score_type = self._get_score_type(dataset)
+
+                matrix, page_incomplete = self._load_outcome_matrix(
+                    session, dataset_id, score_type.public_testcases.keys(),
+                    last=last, limit=self.RESCORE_PAGE_SIZE)
+                try:
+                    scores = score_type.compute_scores(matrix)
+                except NotImplementedError:
+                    scores = None
+                    break
+                session.bulk_update_mappings(SubmissionResult, [{
+                    "submission_id": submission_id,
+                    "dataset_id": dataset_id,
+                    "score": score,
+                    "score_details": score_details,
+                    "public_score": public_score,
+                    "public_score_details": public_score_details,
+                    "ranking_score_details": ranking_score_details,
+                    } for submission_id, (score, score_details,
+                                          public_score, public_score_details,
+                                          ranking_score_details)
+                    in zip(matrix.submission_ids, scores)])
+                if active and len(matrix) > 0:
+                    update_task_scores(
+                        session, dataset.task_id,
+                        [user_id for user_id, in session.query(
+                            Submission.user_id)
+                         .filter(Submission.id.in_(matrix.submission_ids))
+                         .distinct()])
+                session.commit()
+
+            if active:
+                for submission_id in matrix.submission_ids:
+                    self.proxy_service.submission_scored(
+                        submission_id=submission_id, batch=True)
+            counter += len(matrix)
+            incomplete += page_incomplete
+
+            page = matrix.submission_ids + page_incomplete
+            if len(page) < self.RESCORE_PAGE_SIZE:
+                break
+            last = max(page)
+            gevent.sleep(0)
+
+        if scores is None:
+            logger.info("Score type %s can't rescore in bulk, "
+                        "invalidating instead.",
+                        score_type.__class__.__name__)
+            self.invalidate_submission(dataset_id=dataset_id)
+            return
+
+        logger.info("Rescored %d submission results of dataset %d.",
+                    counter, dataset_id)
+
+        # Not to leave them with the score given by the old parameters.
+        for submission_id in incomplete:
+            self.invalidate_submission(submission_id=submission_id,
+                                       dataset_id=dataset_id)
+
+    @rpc_method
+    def dataset_updated(self, dataset_id):
+        """Forget the ScoreType of a dataset, built again when needed.
+
+        To be called when something the ScoreType is built from,
+        besides the name of the score type and its parameters, has
+        changed, i.e., the testcases of the dataset or which of them
+        are public.
+
+        dataset_id (int): the id of the dataset.
+
+        """
+        self._score_types.pop(dataset_id, None)
+
+    @rpc_method
+    def preview_score_type(self, dataset_id, score_type_parameters,
+                           score_type=None):
+        """Compute how the scores would change with another score type.
+
+        The results of the dataset are scored in memory with the
+        candidate score type, as rescore_dataset would do, and compared
+        with the stored ones. The users are ranked as in the ranking of
+        the contest, adding their stored scores on the other tasks
+        (computed, if missing). Nothing is written in the database.
+
+        dataset_id (int): the id of the dataset.
+        score_type_parameters (unicode): the candidate parameters,
+            JSON-encoded as in Dataset.
+        score_type (unicode|None): the candidate score type, or None to
+            keep the one of the dataset.
+
+        return (dict): "submissions", the [submission id, old score,
+            new score, old public score, new public score] of each
+            result whose score would change (old scores are None if not
+            scored yet), and "users", the [user id, old total score,
+            new total score, old rank, new rank] in the ranking of each
+            (non hidden) user of the contest whose total or rank would
+            change, as if the dataset were the active one.
+
+        raise (KeyError): if the dataset doesn't exist.
+        raise (ValueError): if the parameters can't be decoded.
+
+        """
+        with SessionGen() as session:
+            dataset = Dataset.get_from_id(dataset_id, session)
+            if dataset is None:
+                raise KeyError("Dataset %d not found." % dataset_id)
+            public_testcases = dict(
+                (codename, testcase.public)
+                for codename, testcase in dataset.testcases.iteritems())
+            candidate = get_score_type(
+                name=score_type if score_type is not None
+                else dataset.score_type,
+                parameters=score_type_parameters,
+                public_testcases=public_testcases)
+
+            matrix, unused_incomplete = self._load_outcome_matrix(
+                session, dataset_id, public_testcases.keys())
+            try:
+                new_scores = candidate.compute_scores(matrix)
+            except NotImplementedError:
+                submission_results = self._load_submission_results(
+                    session, [(submission_id, dataset_id)
+                              for submission_id in matrix.submission_ids])
+                new_scores = [
+                    candidate.compute_score(
+                        submission_results[(submission_id, dataset_id)])
+                    for submission_id in matrix.submission_ids]
+            new_scores = dict(
+                (submission_id, (score, public_score))
+                for submission_id, (score, _, public_score, _, _)
+                in zip(matrix.submission_ids, new_scores))
+
+            old_scores = dict(
+                (submission_id, (score, public_score))
+                for submission_id, score, public_score in session.query(
+                    SubmissionResult.submission_id,
+                    SubmissionResult.score,
+                    SubmissionResult.public_score)
+                .filter(SubmissionResult.dataset_id == dataset_id))
+
+            submissions = session.query(Submission.id, Submission.user_id,
+                                        Submission.timestamp, Token.id)\
+                .outerjoin(Submission.token)\
+                .filter(Submission.task_id == dataset.task_id).all()
+
+            # The ranking sums the scores on the tasks, each rounded to
+            # the precision of its task.
+            contest = dataset.task.contest
+            precisions = dict((task.id, task.score_precision)
+                              for task in contest.tasks)
+            task_precision = dataset.task.score_precision
+            contest_precision = contest.score_precision
+            other_totals = dict(
+                (user_id, 0.0) for user_id, in session.query(User.id)
+                .filter(User.contest_id == contest.id)
+                .filter(User.hidden == False))
+            for (user_id, task_id), (score, unused_partial) in \
+                    get_task_scores(session, contest.id,
+                                    store=False).iteritems():
+                if task_id != dataset.task_id and user_id in other_totals:
+                    other_totals[user_id] += round(score,
+                                                   precisions[task_id])
+
+        changed = list()
+        old_results = defaultdict(list)
+        new_results = defaultdict(list)
+        for submission_id, user_id, timestamp, token_id in submissions:
+            old = old_scores.get(submission_id, (None, None))
+            new = new_scores.get(submission_id, (None, None))
+            if old != new:
+                changed.append([submission_id, old[0], new[0],
+                                old[1], new[1]])
+            old_results[user_id].append(
+                (timestamp, token_id is not None, old[0]))
+            new_results[user_id].append(
+                (timestamp, token_id is not None, new[0]))
+
+        def totals(results):
+            """Return the total score of each user."""
+            return dict(
+                (user_id, round(
+                    other_total + round(task_score_from_results(
+                        results.get(user_id, []))[0], task_precision),
+                    contest_precision))
+                for user_id, other_total in other_totals.iteritems())
+
+        def ranks(scores):
+            """Return the position of each user, ties sharing it."""
+            positions = dict()
+            ordered = sorted(scores.itervalues(), reverse=True)
+            for position, score in enumerate(ordered):
+                positions.setdefault(score, position + 1)
+            return dict((user_id, positions[score])
+                        for user_id, score in scores.iteritems())
+
+        old_totals = totals(old_results)
+        new_totals = totals(new_results)
+        old_ranks = ranks(old_totals)
+        new_ranks = ranks(new_totals)
+        users = [[user_id, old_totals[user_id], new_totals[user_id],
+                  old_ranks[user_id], new_ranks[user_id]]
+                 for user_id in sorted(other_totals)
+                 if old_totals[user_id] != new_totals[user_id] or
+                 old_ranks[user_id] != new_ranks[user_id]]
+
+        return {"submissions": changed, "users": users}
+
     @rpc_method
     def search_jobs_not_done(self):
         """Make the sweeper loop fire the sweeper as soon as possible.
@@ -232,6 +749,15 @@ class ScoringService(Service):
         """
         self._sweeper_event.set()
 
+    @rpc_method
+    def queue_status(self):
+        """Return the metrics of the queue of results to score.
+
+        return (dict): see ScorerQueue.status.
+
+        """
+        return self._scorer_queue.status()
+
     @rpc_method
     def new_evaluation(self, submission_id, dataset_id):
         """Schedule the given submission result for scoring.
@@ -244,7 +770,8 @@ class ScoringService(Service):
         dataset_id (int): the id of the dataset to use.
 
         """
-        self._scorer_queue.put((submission_id, dataset_id))
+        self._scorer_queue.put((submission_id, dataset_id),
+                               ScorerQueue.PRIORITY_LIVE)
 
     @rpc_method
     def invalidate_submission(self, submission_id=None, dataset_id=None,
@@ -277,6 +804,8 @@ class ScoringService(Service):
         # been invalidated (and committed to the database). Therefore
         # we temporarily save them somewhere else.
         temp_queue = list()
+        # The users whose scores on the tasks change, by task.
+        to_update = defaultdict(set)
 
         with SessionGen() as session:
             submission_results = \
@@ -288,10 +817,17 @@ class ScoringService(Service):
                 if sr.scored():
                     sr.invalidate_score()
                     temp_queue.append((sr.submission_id, sr.dataset_id))
+                    submission = sr.submission
+                    if sr.dataset_id == submission.task.active_dataset_id:
+                        to_update[submission.task_id].add(
+                            submission.user_id)
+
+            for task_id_, user_ids in to_update.iteritems():
+                update_task_scores(session, task_id_, list(user_ids))
 
             session.commit()
 
         for item in temp_queue:
-            self._scorer_queue.put(item)
+            self._scorer_queue.put(item, ScorerQueue.PRIORITY_BULK)
 
         logger.info("Invalidated %d submissions.", len(temp_queue))
@@ -30,7 +30,7 @@ import netifaces
 import os
 import sys
 from argparse import ArgumentParser
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 
 import gevent.socket
 
@@ -53,8 +53,21 @@ def mkdir(path):
     return True
 
 
-class Address(namedtuple("Address", "ip port")):
+class Address(namedtuple("Address", "ip port path")):
+    """The address a service listens on: a TCP one, and optionally
+    the path of a UNIX domain socket, that clients running on the
+    same host use instead, as it is faster.
+
+    The RemoteServiceServers of connections coming through the UNIX
+    domain socket have an address with only the path.
+
+    """
+    def __new__(cls, ip, port, path=None):
+        return super(Address, cls).__new__(cls, ip, port, path)
+
     def __repr__(self):
+        if self.ip is None:
+            return "unix:%s" % self.path
         return "%s:%d" % (self.ip, self.port)
 
 
@@ -67,6 +80,79 @@ class ServiceCoord(namedtuple("ServiceCoord", "name shard")):
         return "%s,%d" % (self.name, self.shard)
 
 
+class LRUCache(object):
+    """A dict-like cache holding items up to a given total weight
+    (by default, a given number of items), discarding the least
+    recently used ones when full.
+
+    """
+    def __init__(self, size, weigh=None):
+        """Initialize the cache.
+
+        size (int): the maximum total weight of the items.
+        weigh (function|None): the function returning the weight of an
+            item, given its key and its value, e.g., its size in bytes;
+            if None each item weighs 1, i.e., size is the maximum
+            number of items.
+
+        """
+        self.size = size
+        self._weigh = weigh
+        # The total weight of the items.
+        self.weight = 0
+        # The items, with their weights, from the least recently used.
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return the value of a key, marking it as used.
+
+        key (object): the key.
+        default (object): what to return if the key is missing.
+
+        return (object): the value of the key, or default.
+
+        """
+        try:
+            item = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = item
+        return item[0]
+
+    def put(self, key, value):
+        """Set the value of a key, discarding items if needed.
+
+        An item weighing more than the size of the cache is not stored.
+
+        key (object): the key.
+        value (object): its value.
+
+        """
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.weight -= old[1]
+        weight = self._weigh(key, value) if self._weigh is not None else 1
+        if weight > self.size:
+            return
+        self._items[key] = (value, weight)
+        self.weight += weight
+        while self.weight > self.size:
+            self.weight -= self._items.popitem(last=False)[1][1]
+
+    def clear(self):
+        """Discard all the items.
+
+        """
+        self._items.clear()
+        self.weight = 0
+
+
 class Config(object):
     """This class will contain the configuration for the
     services. This needs to be populated at the initilization stage.
@@ -244,7 +330,7 @@ def _get_shard_from_addresses(service, addrs):
             ipv6_addrs.add(addr)
     while True:
         try:
-            host, port = get_service_address(ServiceCoord(service, i))
+            host, port, _ = get_service_address(ServiceCoord(service, i))
             res_ipv4_addrs = set()
             res_ipv6_addrs = set()
             # For magic numbers, see getaddrinfo() documentation
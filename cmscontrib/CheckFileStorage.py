@@ -0,0 +1,100 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Utility to check the integrity of the file storage.
+
+It looks for files whose content doesn't match their digest (corrupt)
+and for files referenced in the database that are not in the storage
+(missing), and reports which objects reference each of them.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import sys
+
+from cms.db import SessionGen, enumerate_referenced_files, \
+    get_file_references
+from cms.db.filecacher import FileCacher
+
+
+logger = logging.getLogger(__name__)
+
+
+def check_file_storage(delete=False, concurrency=1, checkpoint_path=None):
+    """Check the file storage and print a report.
+
+    delete (bool): whether to delete the corrupt files.
+    concurrency (int): how many files to check at the same time.
+    checkpoint_path (string|None): the file recording the progress,
+        to resume an interrupted check.
+
+    return (bool): True if no corrupt or missing file was found.
+
+    """
+    file_cacher = FileCacher()
+
+    try:
+        corrupt = file_cacher.find_corrupt_files(
+            delete, concurrency, checkpoint_path)
+        stored = set(digest for digest, unused_desc in file_cacher.list())
+    finally:
+        file_cacher.destroy_cache()
+
+    with SessionGen() as session:
+        missing = enumerate_referenced_files(session) - stored
+        if delete:
+            missing -= set(corrupt)
+        references = get_file_references(set(corrupt) | missing, session)
+
+    for title, digests in [("Corrupt", sorted(corrupt)),
+                           ("Missing", sorted(missing))]:
+        print("%s files: %d" % (title, len(digests)))
+        for digest in digests:
+            print("  %s, referenced by: %s" % (
+                digest, ", ".join(references[digest]) or "nothing"))
+
+    return len(corrupt) == 0 and len(missing) == 0
+
+
+def main():
+    """Parse arguments and launch process.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Check the integrity of the file storage of CMS.")
+    parser.add_argument("-j", "--jobs", action="store", type=int, default=4,
+                        help="how many files to check at the same time")
+    parser.add_argument("-c", "--checkpoint", action="store",
+                        help="file where to record the progress; if it "
+                        "exists, resume from where it was left")
+    parser.add_argument("-d", "--delete", action="store_true",
+                        help="delete the corrupt files")
+    args = parser.parse_args()
+
+    success = check_file_storage(args.delete, args.jobs, args.checkpoint)
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
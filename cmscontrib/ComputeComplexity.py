@@ -92,7 +92,8 @@ def file_length(digest, file_cacher=None, file_lengther=None):
     digest (string): the digest of the file.
     file_cacher (FileCacher): the cacher to use, or None.
     file_lengther (type): a File-like object that tell the dimension
-        of the input (see example above for how to write one).
+        of the input (see example above for how to write one); if not
+        given, the length is the size in bytes.
 
     return (int): the length of the tile.
 
@@ -100,7 +101,8 @@ def file_length(digest, file_cacher=None, file_lengther=None):
     if file_cacher is None:
         file_cacher = FileCacher()
     if file_lengther is None:
-        file_lengther = FileLengther
+        # Just ask for the size, instead of reading the file.
+        return file_cacher.get_size(digest)
     lengther = file_lengther()
     file_cacher.get_file_to_fobj(digest, lengther)
     return lengther.tell()
@@ -47,7 +47,7 @@ from sqlalchemy.types import \
 
 from cms.db import version as model_version
 from cms.db import SessionGen, Contest, ask_for_contest, \
-    Submission, UserTest, SubmissionResult, UserTestResult, \
+    Submission, UserTest, SubmissionResult, UserTestResult, TaskScore, \
     RepeatedUnicode
 from cms.db.filecacher import FileCacher
 from cms.io.GeventUtils import rmtree
@@ -296,6 +296,11 @@ class ContestExporter(object):
                                                      UserTestResult):
                 continue
 
+            # Skip the scores of the users, that are derived data
+            # filled again when needed
+            if other_cls is TaskScore:
+                continue
+
             val = getattr(obj, prp.key)
             if val is None:
                 data[prp.key] = None
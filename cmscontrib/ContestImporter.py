@@ -56,7 +56,6 @@ from cms.db import SessionGen, init_db, drop_db, Submission, UserTest, \
 from cms.db.filecacher import FileCacher
 from cms.io.GeventUtils import rmtree
 
-from cmscontrib import sha1sum
 from cmscommon.datetime import make_datetime
 
 
@@ -435,21 +434,17 @@ class ContestImporter(object):
         except IOError:
             description = ''
 
-        # Put the file.
+        # Put the file, letting FileCacher check that its content
+        # matches the digest it is named after (and skip it entirely if
+        # it's already stored).
         try:
-            digest = self.file_cacher.put_file_from_path(path, description)
+            self.file_cacher.put_file_from_path(
+                path, description, os.path.basename(path))
         except Exception as error:
             logger.critical("File %s could not be put to file server (%r), "
                             "aborting." % (path, error))
             return False
 
-        # Then check the digest.
-        calc_digest = sha1sum(path)
-        if digest != calc_digest:
-            logger.critical("File %s has hash %s, but the server returned %s, "
-                            "aborting." % (path, calc_digest, digest))
-            return False
-
         return True
 
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Utility to move the files stored as large objects in the database
+into a file system storage (see FSBackend).
+
+Files are copied one at a time, streaming them, so memory usage does
+not depend on their size. Files already in the destination are
+skipped, hence an interrupted migration can just be run again.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import sys
+
+from cms import config
+from cms.db.filecacher import DBBackend, FSBackend, FileCacher
+from cms.io.GeventUtils import copyfileobj
+
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_file_storage(path, compress=False, delete=False):
+    """Copy all the files from the database to the given directory.
+
+    path (string): the root of the file system storage.
+    compress (bool): whether to compress the files.
+    delete (bool): whether to delete the large objects from the
+        database once they have been copied.
+
+    return (bool): True if all files were copied successfully.
+
+    """
+    src = DBBackend()
+    dst = FSBackend(path)
+
+    files = src.list()
+    copied = 0
+    skipped = 0
+    failed = 0
+
+    for i, (digest, desc) in enumerate(files):
+        dst_fobj = dst.put_file(digest, desc, compress)
+        if dst_fobj is None:
+            skipped += 1
+        else:
+            try:
+                try:
+                    with src.get_file(digest) as src_fobj:
+                        copyfileobj(src_fobj, dst_fobj, FileCacher.CHUNK_SIZE)
+                finally:
+                    dst_fobj.close()
+            except (IOError, KeyError) as error:
+                logger.error("Couldn't copy file %s: %s.", digest, error)
+                failed += 1
+                continue
+            copied += 1
+
+        if delete:
+            src.delete(digest)
+
+        if (i + 1) % 1000 == 0:
+            logger.info("Processed %d files out of %d.", i + 1, len(files))
+
+    logger.info("Migration finished: %d files copied, %d already present, "
+                "%d failed.", copied, skipped, failed)
+
+    return failed == 0
+
+
+def main():
+    """Parse arguments and launch process.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Move the files stored in the database of CMS to a "
+        "file system storage.")
+    parser.add_argument("path", nargs="?", default=config.file_storage_path,
+                        help="root of the file system storage (default: "
+                        "file_storage_path in the configuration)")
+    parser.add_argument("-z", "--compress", action="store_true",
+                        default=config.file_storage_compress,
+                        help="compress the files")
+    parser.add_argument("-d", "--delete", action="store_true",
+                        help="delete the files from the database once "
+                        "they have been copied")
+    args = parser.parse_args()
+
+    if args.path is None:
+        parser.error("no path given and file_storage_path not configured")
+
+    success = migrate_file_storage(args.path, args.compress, args.delete)
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,18 @@
 
 # Usage: setup_fs_storage.sh ORIG_DIR DEST_DIR
 # For each regular file in ORIG_DIR (the directory is scanned
-# recursively) create a symbolic link in DEST_DIR with basename the
-# SHA1 sum of the file. You can use this script to set up a directory
-# for the FileCacher file system backend.
+# recursively) create a symbolic link in DEST_DIR/ab/cd/ with basename
+# the SHA1 sum of the file (which begins with abcd). You can use this
+# script to set up a directory for the FileCacher file system backend.
 
-ORIG_DIR="$1"
+ORIG_DIR="$(cd "$1" && pwd)"
 DEST_DIR="$2"
-REL_ORIG_DIR="$(python -c "import os.path; print os.path.relpath('$ORIG_DIR', '$DEST_DIR')")"
-echo $REL_ORIG_DIR
 
 mkdir -p "$DEST_DIR"
-(cd "$DEST_DIR" ; find "$REL_ORIG_DIR" -type f -print0 | xargs -0 sha1sum -b) | sed "s|^\([^ ]*\) \*\(.*\)$|ln -s \2 $DEST_DIR/\1|" | bash -v
+find "$ORIG_DIR" -type f -print0 | xargs -0 sha1sum -b | \
+while read -r SUM FILE ; do
+	FILE="${FILE#\*}"
+	SHARD_DIR="$DEST_DIR/${SUM:0:2}/${SUM:2:2}"
+	mkdir -p "$SHARD_DIR"
+	ln -sfv "$FILE" "$SHARD_DIR/$SUM"
+done
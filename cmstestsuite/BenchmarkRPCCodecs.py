@@ -0,0 +1,146 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmark of the available RPC codecs.
+
+Measure the size and the encoding and decoding times of the messages
+that ES and the Workers exchange for the evaluation of a submission,
+i.e., JobGroups serialized with export_to_dict.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import sys
+import timeit
+from argparse import ArgumentParser
+
+from cms.db import Executable, File, Manager
+from cms.grading.Job import EvaluationJob, JobGroup
+from cms.io.codec import JSON_CODEC, MsgpackCodec, msgpack
+
+
+def _digest(name):
+    """Return a fake but realistic digest."""
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+
+def make_job_group(testcases, evaluated):
+    """Build a JobGroup evaluating a submission on many testcases.
+
+    testcases (int): the number of testcases (i.e., of jobs).
+    evaluated (bool): whether to fill the results, as the Workers do.
+
+    return (JobGroup): the job group.
+
+    """
+    jobs = dict()
+    for i in xrange(testcases):
+        codename = "%03d" % i
+        job = EvaluationJob(
+            task_type="Batch",
+            task_type_parameters=["alone", ["input.txt", "output.txt"],
+                                  "comparator"],
+            shard=i % 8,
+            sandboxes=[],
+            info="evaluate submission 123456 on testcase %s" % codename,
+            language="c++",
+            files={"task.%l": File("task.%l", _digest("source"))},
+            managers={"checker": Manager("checker", _digest("checker"))},
+            executables={"task": Executable("task", _digest("executable"))},
+            input=_digest("input %s" % codename),
+            output=_digest("output %s" % codename),
+            time_limit=1.0,
+            memory_limit=256 * 1024 * 1024)
+        if evaluated:
+            job.success = True
+            job.outcome = "1.0"
+            job.text = ["Output is correct"]
+            job.sandboxes = ["/tmp/tmpAbCdEf"]
+            job.plus = {"execution_time": 0.123,
+                        "execution_wall_clock_time": 0.456,
+                        "execution_memory": 12345678,
+                        "exit_status": "ok"}
+        jobs[codename] = job
+    return JobGroup(jobs)
+
+
+def benchmark(codec, obj, number):
+    """Measure a codec on an object.
+
+    codec (Codec): the codec.
+    obj (object): the object to encode and decode.
+    number (int): how many times to repeat each operation.
+
+    return ((int, float, float)): the size of the serialization, and
+        the average encoding and decoding times, in seconds.
+
+    """
+    data = codec.encode(obj)
+    encode_time = min(timeit.repeat(lambda: codec.encode(obj),
+                                    repeat=3, number=number)) / number
+    decode_time = min(timeit.repeat(lambda: codec.decode(data),
+                                    repeat=3, number=number)) / number
+    return len(data), encode_time, decode_time
+
+
+def main():
+    """Parse arguments and launch the benchmark.
+
+    """
+    parser = ArgumentParser(
+        description="Compare the RPC codecs on JobGroup payloads.")
+    parser.add_argument(
+        "-t", "--testcases", action="store", type=int, default=200,
+        help="number of testcases of the evaluation (default 200)")
+    parser.add_argument(
+        "-n", "--number", action="store", type=int, default=100,
+        help="how many times to repeat each measure (default 100)")
+    args = parser.parse_args()
+
+    # msgpack is measured even if it is too slow to be used by RPC.
+    codecs = [JSON_CODEC]
+    if msgpack is not None:
+        codecs.append(MsgpackCodec())
+
+    payloads = [
+        ("request", make_job_group(args.testcases, False)),
+        ("response", make_job_group(args.testcases, True)),
+        ]
+
+    print("%-10s %-10s %10s %12s %12s" %
+          ("payload", "codec", "size (B)", "encode (ms)", "decode (ms)"))
+    for payload_name, job_group in payloads:
+        obj = {"__id": "0" * 32,
+               "__method": "execute_job_group",
+               "__data": {"job_group_dict": job_group.export_to_dict()}}
+        for codec in codecs:
+            size, encode_time, decode_time = benchmark(codec, obj,
+                                                       args.number)
+            print("%-10s %-10s %10d %12.3f %12.3f" %
+                  (payload_name, codec.name, size,
+                   encode_time * 1000, decode_time * 1000))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmark of the bundled score types.
+
+Measure how many submission results per second each score type
+scores, one at a time with compute_score (as ScoringService does with
+new results) and, if supported, all together with compute_scores (as
+ScoringService does when rescoring a dataset), on synthetic results
+with the given number of testcases and subtasks, and the peak of the
+memory used meanwhile.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import random
+import resource
+import sys
+import timeit
+from argparse import ArgumentParser
+
+from cms.grading.ScoreType import OutcomeMatrix
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.grading.scoretypes.GroupMul import GroupMul
+from cms.grading.scoretypes.GroupThreshold import GroupThreshold
+from cms.grading.scoretypes.NamedGroup import NamedGroup
+from cms.grading.scoretypes.Sum import Sum
+
+
+class FakeEvaluation(object):
+    """The fields of an Evaluation read by the score types."""
+
+    def __init__(self, codename, outcome):
+        self.codename = codename
+        self.outcome = outcome
+        self.text = '["Output is correct"]'
+        self.execution_time = 0.123
+        self.execution_memory = 12345678
+
+
+class FakeSubmissionResult(object):
+    """The fields of a SubmissionResult read by the score types."""
+
+    def __init__(self, submission_id, evaluations):
+        self.submission_id = submission_id
+        self.evaluations = evaluations
+
+    def evaluated(self):
+        return True
+
+
+def make_submission_results(codenames, count):
+    """Build evaluated submission results with random outcomes.
+
+    codenames ([unicode]): the codenames of the testcases.
+    count (int): how many results to build.
+
+    return ([FakeSubmissionResult]): the results.
+
+    """
+    outcomes = ["0.0", "1.0", "1.0", "1.0", "0.5"]
+    submission_results = []
+    for i in xrange(count):
+        evaluations = [FakeEvaluation(codename, random.choice(outcomes))
+                       for codename in codenames]
+        submission_results.append(FakeSubmissionResult(i, evaluations))
+    return submission_results
+
+
+def make_score_types(codenames, subtasks):
+    """Build an instance of each bundled score type.
+
+    codenames ([unicode]): the codenames of the testcases, that are
+        split as evenly as possible among the subtasks.
+    subtasks (int): the number of subtasks.
+
+    return ([ScoreType]): the score types.
+
+    """
+    public_testcases = dict((codename, i % 2 == 0)
+                            for i, codename in enumerate(codenames))
+    groups = [codenames[i * len(codenames) // subtasks:
+                        (i + 1) * len(codenames) // subtasks]
+              for i in xrange(subtasks)]
+    max_score = 100.0 / subtasks
+    return [
+        Sum(100.0 / len(codenames), public_testcases),
+        GroupMin([[max_score, len(group)] for group in groups],
+                 public_testcases),
+        GroupMul([[max_score, len(group)] for group in groups],
+                 public_testcases),
+        GroupThreshold([[max_score, len(group), 0.5] for group in groups],
+                       public_testcases),
+        NamedGroup([{"score": max_score, "type": "min",
+                     "public": group[:1], "private": group[1:],
+                     "hidden": []} for group in groups],
+                   public_testcases),
+        ]
+
+
+def measure_memory(func):
+    """Measure the peak of the memory used during a call of a function.
+
+    The call is done in a child process, whose peak resident set size
+    before it is the current one of this process: its growth is thus
+    not hidden by the peaks reached by previous calls.
+
+    func (function): the function to call.
+
+    return (int): how much the peak resident set size grew during the
+        call, in KiB.
+
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        func()
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write_fd, b"%d" % (after - before))
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as pipe:
+        data = pipe.read()
+    os.waitpid(pid, 0)
+    return int(data)
+
+
+def measure(func, number):
+    """Measure the throughput and memory usage of a scoring function.
+
+    func (function): the function, scoring a batch of results.
+    number (int): how many times to repeat it.
+
+    return ((float, int)): the average time of a call, in seconds, and
+        the peak of the memory used during one, in KiB.
+
+    """
+    elapsed = min(timeit.repeat(func, repeat=3, number=number)) / number
+    return elapsed, measure_memory(func)
+
+
+def main():
+    """Parse arguments and launch the benchmark.
+
+    """
+    parser = ArgumentParser(
+        description="Measure the throughput of the bundled score types.")
+    parser.add_argument(
+        "-t", "--testcases", action="store", type=int, default=50,
+        help="number of testcases of the dataset (default 50)")
+    parser.add_argument(
+        "-s", "--subtasks", action="store", type=int, default=5,
+        help="number of subtasks of the dataset (default 5)")
+    parser.add_argument(
+        "-r", "--results", action="store", type=int, default=1000,
+        help="number of submission results to score (default 1000)")
+    parser.add_argument(
+        "-n", "--number", action="store", type=int, default=3,
+        help="how many times to repeat each measure (default 3)")
+    args = parser.parse_args()
+
+    if not 0 < args.subtasks <= args.testcases:
+        parser.error("There must be between 1 and TESTCASES subtasks.")
+
+    random.seed(0)
+    codenames = ["%03d" % i for i in xrange(args.testcases)]
+    submission_results = make_submission_results(codenames, args.results)
+
+    print("%-16s %-8s %14s %14s" %
+          ("score type", "mode", "results/s", "peak (KiB)"))
+    for score_type in make_score_types(codenames, args.subtasks):
+        modes = [("single", lambda: [score_type.compute_score(sr)
+                                     for sr in submission_results])]
+
+        # Building the matrix is part of the work of a bulk rescoring.
+        def bulk():
+            matrix = OutcomeMatrix(codenames)
+            for sr in submission_results:
+                matrix.add_submission_result(sr)
+            return score_type.compute_scores(matrix)
+        try:
+            score_type.compute_scores(OutcomeMatrix(codenames))
+        except NotImplementedError:
+            pass
+        else:
+            modes.append(("bulk", bulk))
+
+        for mode, func in modes:
+            elapsed, peak = measure(func, args.number)
+            print("%-16s %-8s %14.1f %14d" %
+                  (score_type.__class__.__name__, mode,
+                   args.results / elapsed, peak))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,9 +32,15 @@ import random
 from StringIO import StringIO
 import hashlib
 import shutil
+import tempfile
+import threading
 import unittest
 
-from cms.db.filecacher import FileCacher
+from mock import Mock, patch
+
+from cms import config
+from cms.db import SessionGen, FSObject
+from cms.db.filecacher import FileCacher, FSBackend
 
 
 class RandomFile(object):
@@ -320,6 +326,259 @@ class TestFileCacher(unittest.TestCase):
         finally:
             self.file_cacher.delete(self.digest)
 
+    def test_known_digest(self):
+        """Put a file passing its digest, then put it again and check
+        that the second time its content isn't even read.
+
+        Then put a different content with the same digest.
+
+        """
+        content = b"Known digest.\n"
+        digest = hashlib.sha1(content).hexdigest().decode("ascii")
+
+        try:
+            self.assertEqual(
+                self.file_cacher.put_file_content(content, u"Test #008",
+                                                  digest),
+                digest)
+
+            src = Mock()
+            self.assertEqual(
+                self.file_cacher.put_file_from_fobj(src, u"Test #008",
+                                                    digest),
+                digest)
+            self.assertFalse(src.read.called)
+
+            self.file_cacher.delete(digest)
+            with self.assertRaises(ValueError):
+                self.file_cacher.put_file_content(b"Other content.\n",
+                                                  u"Test #008", digest)
+            with self.assertRaises(KeyError):
+                self.file_cacher.get_file(digest)
+        finally:
+            self.file_cacher.delete(digest)
+
+    def test_backend_integrity(self):
+        """Corrupt a file in the storage and check that it is found,
+        also when resuming from a checkpoint.
+
+        """
+        good = self.file_cacher.put_file_content(b"Good content.\n",
+                                                 u"Test #012")
+        bad = self.file_cacher.put_file_content(b"Bad content.\n",
+                                                u"Test #012")
+        checkpoint_path = os.path.join(self.cache_base_path, "checkpoint")
+
+        try:
+            self.assertTrue(self.file_cacher.check_backend_integrity(
+                concurrency=4))
+
+            real_get_file = self.file_cacher.backend.get_file
+
+            def get_file(digest):
+                if digest == bad:
+                    return StringIO(b"Corrupt content.\n")
+                return real_get_file(digest)
+
+            with patch.object(self.file_cacher.backend, "get_file",
+                              get_file):
+                self.assertEqual(self.file_cacher.find_corrupt_files(
+                    concurrency=4, checkpoint_path=checkpoint_path), [bad])
+
+            # Resuming, nothing is read again and the result is the
+            # same.
+            with patch.object(self.file_cacher.backend, "get_file") as m:
+                self.assertEqual(self.file_cacher.find_corrupt_files(
+                    concurrency=4, checkpoint_path=checkpoint_path), [bad])
+                with open(checkpoint_path) as checkpoint:
+                    checked = set(line.split()[0] for line in checkpoint)
+                self.assertFalse(any(call[0][0] in checked
+                                     for call in m.call_args_list))
+
+            # A line left truncated by a crash is ignored, and the file
+            # is checked again.
+            with open(checkpoint_path, "wb") as checkpoint:
+                checkpoint.write(b"%s ok\n%s co" % (good, bad))
+            with patch.object(self.file_cacher.backend, "get_file",
+                              get_file):
+                self.assertEqual(self.file_cacher.find_corrupt_files(
+                    checkpoint_path=checkpoint_path), [bad])
+            with open(checkpoint_path) as checkpoint:
+                lines = checkpoint.read().splitlines()
+            self.assertEqual(lines[1], b"%s co" % bad)
+            self.assertIn(b"%s corrupt" % bad, lines[2:])
+        finally:
+            self.file_cacher.delete(good)
+            self.file_cacher.delete(bad)
+
+
+class TestFileCacherFS(TestFileCacher):
+    """Run the same tests of TestFileCacher using a FileCacher backed
+    by the file system storage.
+
+    """
+
+    compress = False
+
+    def setUp(self):
+        TestFileCacher.setUp(self)
+        self.storage_path = tempfile.mkdtemp()
+        self.file_cacher.backend = FSBackend(self.storage_path)
+        patcher = patch.object(config, "file_storage_compress",
+                               self.compress)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        TestFileCacher.tearDown(self)
+        shutil.rmtree(self.storage_path, ignore_errors=True)
+
+    def test_sharded_layout(self):
+        """Store a file and check where it ends up in the storage, and
+        that its description and size are preserved.
+
+        """
+        content = b"Sharded content.\n" * 1000
+        digest = self.file_cacher.put_file_content(content, u"Test #010")
+
+        path = os.path.join(self.storage_path, digest[0:2], digest[2:4],
+                            digest)
+        if self.compress:
+            path += FSBackend.COMPRESSED_SUFFIX
+        self.assertTrue(os.path.isfile(path))
+        if self.compress:
+            self.assertLess(os.path.getsize(path), len(content))
+
+        self.assertEqual(self.file_cacher.describe(digest), u"Test #010")
+        self.assertEqual(self.file_cacher.get_size(digest), len(content))
+        self.assertEqual(self.file_cacher.list(), [(digest, u"Test #010")])
+
+        os.unlink(os.path.join(self.cache_base_path, digest))
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+    def test_permissions(self):
+        """Check that stored files get the permissions given by the
+        umask, as if created by open.
+
+        """
+        old_umask = os.umask(0o027)
+        try:
+            digest = self.file_cacher.put_file_content(
+                b"Content.\n" * 1000, u"Test #011")
+        finally:
+            os.umask(old_umask)
+
+        path = os.path.join(self.storage_path, digest[0:2], digest[2:4],
+                            digest)
+        paths = [path + FSBackend.DESCRIPTION_SUFFIX,
+                 path + FSBackend.COMPRESSED_SUFFIX if self.compress
+                 else path]
+        for path in paths:
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+    def test_integrity_in_threads(self):
+        """Check that the files are read and hashed in other threads.
+
+        """
+        digests = [self.file_cacher.put_file_content(
+            b"Content %d.\n" % i, u"Test #013") for i in xrange(3)]
+        threads = set()
+        real_get_file = self.file_cacher.backend.get_file
+
+        def get_file(digest):
+            threads.add(threading.current_thread())
+            return real_get_file(digest)
+
+        try:
+            with patch.object(self.file_cacher.backend, "get_file",
+                              get_file):
+                self.assertEqual(
+                    self.file_cacher.find_corrupt_files(concurrency=2), [])
+            self.assertGreater(len(threads), 0)
+            self.assertNotIn(threading.current_thread(), threads)
+        finally:
+            for digest in digests:
+                self.file_cacher.delete(digest)
+
+    def test_wrong_digest(self):
+        """Write to the storage a content that doesn't match the digest
+        and check that it doesn't get published.
+
+        """
+        backend = self.file_cacher.backend
+        digest = hashlib.sha1(b"Right content.").hexdigest().decode("ascii")
+
+        fobj = backend.put_file(digest)
+        fobj.write(b"Wrong content.")
+        with self.assertRaises(IOError):
+            fobj.close()
+
+        with self.assertRaises(KeyError):
+            backend.get_file(digest)
+        self.assertEqual(os.listdir(backend.temp_path), [])
+
+
+class TestFileCacherCompressedFS(TestFileCacherFS):
+    """Run the same tests of TestFileCacherFS compressing the files.
+
+    """
+
+    compress = True
+
+
+class TestFileCacherCompressedDB(TestFileCacher):
+    """Run the same tests of TestFileCacher compressing the files that
+    are worth it in the database.
+
+    """
+
+    def setUp(self):
+        TestFileCacher.setUp(self)
+        patcher = patch.object(config, "file_storage_compress", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compressible_file(self):
+        """Store a compressible file, check that it's actually stored
+        compressed and that it's transparently decompressed.
+
+        """
+        content = b"1 2 3 4 5 6 7 8 9 10\n" * 1000
+        path = os.path.join(self.cache_base_path, "compressible")
+        with open(path, "wb") as fobj:
+            fobj.write(content)
+        self.assertTrue(self.file_cacher.should_compress(path))
+
+        digest = self.file_cacher.put_file_content(content, u"Test #011")
+        try:
+            self.assertEqual(digest, hashlib.sha1(content).hexdigest())
+            with SessionGen() as session:
+                fso = FSObject.get_from_digest(digest, session)
+                self.assertTrue(fso.compressed)
+                with fso.get_lobject() as lobj:
+                    self.assertLess(len(lobj.read()), len(content))
+
+            self.assertEqual(self.file_cacher.get_size(digest), len(content))
+            self.file_cacher.drop(digest)
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             content)
+        finally:
+            self.file_cacher.delete(digest)
+
+    def test_should_compress(self):
+        """Check that small and incompressible files aren't compressed.
+
+        """
+        path = os.path.join(self.cache_base_path, "small")
+        with open(path, "wb") as fobj:
+            fobj.write(b"a" * 100)
+        self.assertFalse(self.file_cacher.should_compress(path))
+
+        path = os.path.join(self.cache_base_path, "random")
+        with open(path, "wb") as fobj:
+            fobj.write(os.urandom(100000))
+        self.assertFalse(self.file_cacher.should_compress(path))
+
 
 if __name__ == "__main__":
     unittest.main()
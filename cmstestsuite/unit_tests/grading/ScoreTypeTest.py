@@ -0,0 +1,168 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the rendering of the score details."""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+from mock import Mock, patch
+
+import cms.grading.ScoreType
+from cms.grading.ScoreType import OutcomeMatrix, ScoreType, decode_details
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.grading.scoretypes.GroupThreshold import GroupThreshold
+from cms.grading.scoretypes.Sum import Sum
+from cms.util import LRUCache
+
+
+DETAILS = json.dumps([{"idx": "0", "outcome": "Correct", "text": ["OK"],
+                       "time": 0.5, "memory": 1024}])
+
+
+class TestGetHtmlDetails(unittest.TestCase):
+    """Test the caching of ScoreType.get_html_details."""
+
+    def setUp(self):
+        ScoreType._html_cache.clear()
+        self.score_type = Sum(10, {"0": True})
+
+    def test_template_compiled_once(self):
+        self.assertIs(Sum.get_template(), Sum.get_template())
+
+    def test_cached(self):
+        html = self.score_type.get_html_details(DETAILS)
+        self.assertIn(b"Correct", html)
+        with patch.object(Sum, "get_template") as get_template:
+            self.assertEqual(self.score_type.get_html_details(DETAILS), html)
+            get_template.assert_not_called()
+
+    def test_cached_by_locale(self):
+        html_en = self.score_type.get_html_details(
+            DETAILS, lambda s: s, "en")
+        html_it = self.score_type.get_html_details(
+            DETAILS, lambda s: "[%s]" % s, "it")
+        self.assertNotEqual(html_en, html_it)
+        self.assertEqual(self.score_type.get_html_details(
+            DETAILS, lambda s: s, "it"), html_it)
+
+    def test_not_cached_without_locale_code(self):
+        self.score_type.get_html_details(DETAILS, lambda s: s)
+        self.assertEqual(len(ScoreType._html_cache), 0)
+
+    def test_invalid_details(self):
+        self.assertEqual(self.score_type.get_html_details(None),
+                         "Score details temporarily unavailable.")
+        self.assertEqual(len(ScoreType._html_cache), 0)
+
+    def test_bounded(self):
+        # The size is in bytes, of the details and of the HTML.
+        html = self.score_type.get_html_details(DETAILS)
+        weight = len(DETAILS) + len(html)
+        self.assertEqual(ScoreType._html_cache.weight, weight)
+        cache = LRUCache(weight * 5 // 2, weigh=ScoreType._html_cache._weigh)
+        with patch.object(ScoreType, "_html_cache", cache):
+            for i in xrange(3):
+                self.score_type.get_html_details(
+                    DETAILS.replace("0.5", "%d.5" % i))
+            self.assertEqual(len(ScoreType._html_cache), 2)
+            self.assertNotIn((Sum, DETAILS, None), ScoreType._html_cache)
+
+
+class TestCaching(unittest.TestCase):
+    """Test the reuse of decoded details."""
+
+    def test_decode_details(self):
+        details = decode_details(DETAILS)
+        self.assertEqual(details, json.loads(DETAILS))
+        self.assertIs(decode_details(DETAILS), details)
+        with self.assertRaises(TypeError):
+            decode_details(None)
+
+    def test_decode_details_bounded(self):
+        # The size is the total length of the encodings.
+        cache = LRUCache(len(DETAILS) * 5 // 2,
+                         weigh=cms.grading.ScoreType._decoded_details._weigh)
+        with patch("cms.grading.ScoreType._decoded_details", cache):
+            for i in xrange(3):
+                decode_details(DETAILS.replace("0.5", "%d.5" % i))
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.weight, len(DETAILS) * 2)
+
+
+class TestComputeScores(unittest.TestCase):
+    """Test the scoring of many results at once."""
+
+    CODENAMES = ["0", "1", "2", "3"]
+    PUBLIC = {"0": True, "1": True, "2": False, "3": True}
+    OUTCOMES = [["1.0", "1.0", "1.0", "1.0"],
+                ["1.0", "0.0", "0.5", "1.0"],
+                None,
+                ["0.2", "0.1", "1.0", "0.0"]]
+
+    @staticmethod
+    def new_sr(submission_id, outcomes):
+        sr = Mock()
+        sr.submission_id = submission_id
+        sr.evaluated.return_value = outcomes is not None
+        sr.evaluations = []
+        for codename, outcome in zip(TestComputeScores.CODENAMES,
+                                     outcomes or []):
+            sr.evaluations.append(Mock(codename=codename, outcome=outcome,
+                                       text="[\"ok\"]",
+                                       execution_time=0.1,
+                                       execution_memory=1024))
+        return sr
+
+    def assert_same_as_compute_score(self, score_type):
+        srs = [self.new_sr(i, outcomes)
+               for i, outcomes in enumerate(self.OUTCOMES)]
+        matrix = OutcomeMatrix(self.CODENAMES)
+        for sr in srs:
+            matrix.add_submission_result(sr)
+        self.assertEqual(matrix.submission_ids, [0, 1, 2, 3])
+        self.assertEqual(score_type.compute_scores(matrix),
+                         [score_type.compute_score(sr) for sr in srs])
+
+    def test_sum(self):
+        self.assert_same_as_compute_score(Sum(10, self.PUBLIC))
+
+    def test_group_min(self):
+        score_type = GroupMin([[40, 2], [60, 2]], self.PUBLIC)
+        self.assert_same_as_compute_score(score_type)
+        self.assertEqual(
+            score_type.compute_score(self.new_sr(1, self.OUTCOMES[1]))[0],
+            30.0)
+
+    def test_group_threshold(self):
+        self.assert_same_as_compute_score(
+            GroupThreshold([[40, 2, 0.5], [60, 2, 0.5]], self.PUBLIC))
+
+    def test_missing_evaluation(self):
+        matrix = OutcomeMatrix(self.CODENAMES)
+        with self.assertRaises(KeyError):
+            matrix.add_row(1, [("0", "1.0", "", 0.1, 1024)])
+        self.assertEqual(len(matrix), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the computation of the score of a user on a task."""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+from datetime import datetime
+from mock import MagicMock, Mock, call, patch
+
+from cms.grading import task_score_from_results
+from cms.service.EvaluationService import EvaluationService
+
+
+T1 = datetime(2014, 1, 1, 10)
+T2 = datetime(2014, 1, 1, 11)
+T3 = datetime(2014, 1, 1, 12)
+
+
+class TestTaskScoreFromResults(unittest.TestCase):
+
+    def test_no_submissions(self):
+        self.assertEqual(task_score_from_results([]), (0.0, False))
+
+    def test_last_submission(self):
+        self.assertEqual(task_score_from_results(
+            [(T2, False, 30.0), (T1, False, 50.0)]), (30.0, False))
+
+    def test_last_not_scored(self):
+        self.assertEqual(task_score_from_results(
+            [(T1, False, 50.0), (T2, False, None)]), (0.0, True))
+
+    def test_tokened(self):
+        self.assertEqual(task_score_from_results(
+            [(T1, True, 50.0), (T2, False, 30.0), (T3, True, 40.0)]),
+            (50.0, False))
+
+    def test_tokened_not_scored(self):
+        self.assertEqual(task_score_from_results(
+            [(T1, True, None), (T2, False, 30.0)]), (30.0, True))
+
+
+class TestInvalidationUpdatesTaskScores(unittest.TestCase):
+
+    @staticmethod
+    def new_sr(submission_id, user_id, dataset_id):
+        """Return a result of a submission on task 1 (active dataset 10).
+
+        """
+        sr = Mock(submission_id=submission_id, dataset_id=dataset_id)
+        sr.submission.task_id = 1
+        sr.submission.user_id = user_id
+        sr.submission.task.active_dataset_id = 10
+        return sr
+
+    def test_evaluation_service(self):
+        """Only results on the active dataset change the task scores.
+
+        """
+        srs = [self.new_sr(1, 100, 10), self.new_sr(2, 100, 10),
+               self.new_sr(3, 101, 10), self.new_sr(4, 102, 11)]
+        service = Mock(contest_id=5)
+        session = MagicMock()
+        session_gen = MagicMock()
+        session_gen.return_value.__enter__.return_value = session
+        calls = Mock()
+        session.commit = calls.commit
+
+        with patch("cms.service.EvaluationService.SessionGen",
+                   session_gen), \
+                patch("cms.service.EvaluationService."
+                      "get_submission_results", return_value=srs), \
+                patch("cms.service.EvaluationService.to_evaluate",
+                      return_value=False), \
+                patch("cms.service.EvaluationService.update_task_scores",
+                      calls.update_task_scores):
+            EvaluationService.invalidate_submission.__func__(
+                service, task_id=1, level="evaluation")
+
+        for sr in srs:
+            sr.invalidate_evaluation.assert_called_once_with()
+        self.assertEqual(len(calls.mock_calls), 2)
+        self.assertEqual(calls.mock_calls[0][0], "update_task_scores")
+        self.assertIs(calls.mock_calls[0][1][0], session)
+        self.assertEqual(calls.mock_calls[0][1][1], 1)
+        self.assertEqual(sorted(calls.mock_calls[0][1][2]), [100, 101])
+        self.assertEqual(calls.mock_calls[1], call.commit())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the RPC codecs.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from cms.io.codec import CODECS, JSON_CODEC, MsgpackCodec, get_codec, \
+    msgpack
+
+
+class TestCodecs(unittest.TestCase):
+
+    def setUp(self):
+        # Test msgpack even if it's not fast enough to be used.
+        self.codecs = [JSON_CODEC]
+        if msgpack is not None:
+            self.codecs.append(MsgpackCodec())
+
+    def test_json_available(self):
+        self.assertIs(get_codec("json"), JSON_CODEC)
+        self.assertIn(JSON_CODEC, CODECS)
+        self.assertIsNone(get_codec("foo"))
+
+    def test_round_trip(self):
+        obj = {"__id": "abc",
+               "__data": {"list": [1, 2.5, None, True, "è"],
+                          "tuple": (1, 2),
+                          "bytes": b"foo"}}
+        for codec in self.codecs:
+            decoded = codec.decode(codec.encode(obj))
+            self.assertEqual(decoded,
+                             {"__id": "abc",
+                              "__data": {"list": [1, 2.5, None, True,
+                                                  "è"],
+                                         "tuple": [1, 2],
+                                         "bytes": "foo"}},
+                             codec.name)
+            self.assertIsInstance(decoded["__data"]["bytes"], unicode)
+
+    def test_keys(self):
+        # Keys that aren't strings become strings, as JSON does.
+        obj = {1: "a", 2.5: "b", False: "c", None: "d", b"e": "f"}
+        expected = JSON_CODEC.decode(JSON_CODEC.encode(obj))
+        self.assertEqual(expected["1"], "a")
+        self.assertEqual(expected["2.5"], "b")
+        self.assertEqual(expected["null"], "d")
+        self.assertEqual(expected["e"], "f")
+        for codec in self.codecs:
+            decoded = codec.decode(codec.encode(obj))
+            self.assertEqual(decoded, expected, codec.name)
+            for key in decoded:
+                self.assertIsInstance(key, unicode)
+            with self.assertRaises((TypeError, ValueError)):
+                codec.encode({(1, 2): "a"})
+
+    def test_invalid_utf8(self):
+        # Byte strings that aren't UTF-8 fail when sent, not received.
+        for codec in self.codecs:
+            with self.assertRaises(ValueError):
+                codec.encode({"foo": [b"\xff"]})
+            with self.assertRaises(ValueError):
+                codec.encode({b"\xff": 1})
+
+    def test_unencodable(self):
+        for codec in self.codecs:
+            with self.assertRaises((TypeError, ValueError)):
+                codec.encode({"foo": RuntimeError()})
+
+    def test_undecodable(self):
+        for codec in self.codecs:
+            with self.assertRaises(ValueError):
+                codec.decode(b"\xc1foo")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,6 +24,11 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import json
+import os
+import shutil
+import socket
+import tempfile
 import unittest
 
 import gevent
@@ -31,11 +36,13 @@ import gevent.socket
 import gevent.event
 from gevent.server import StreamServer
 
-from mock import Mock, patch
+from mock import ANY, Mock, patch
 
 from cms import Address, ServiceCoord
-from cms.io import RPCError, rpc_method, RemoteServiceServer, \
+from cms.io import RPCError, rpc_method, chunked, RemoteServiceServer, \
     RemoteServiceClient
+from cms.io.codec import CODECS, JSON_CODEC
+from cms.io.rpc_stats import rpc_statistics
 
 
 class MockService(object):
@@ -59,6 +66,20 @@ class MockService(object):
         gevent.sleep(0.01)
         return value
 
+    @rpc_method
+    def sleep(self, seconds):
+        gevent.sleep(seconds)
+        return seconds
+
+    @rpc_method
+    def stream(self, count, size):
+        return chunked(range(count), size)
+
+    @rpc_method
+    def stream_error(self):
+        yield [1, 2]
+        raise RuntimeError()
+
     @rpc_method
     def infinite(self):
         event = gevent.event.Event()
@@ -124,7 +145,7 @@ class TestRPC(unittest.TestCase):
 
         Instantiate a RemoteServiceClient, spawn its greenlet and add
         it to self.clients. It will try to connect to the service at
-        the given coordinates.
+        the given coordinates, and wait for the handshake to end.
 
         coord (ServiceCoord): the (name, shard) of the service
         auto_retry (float|None): how long to wait after a disconnection
@@ -134,6 +155,7 @@ class TestRPC(unittest.TestCase):
         """
         client = RemoteServiceClient(coord, auto_retry)
         client.connect()
+        client._ready.wait()
         self.clients.append(client)
         return client
 
@@ -364,6 +386,330 @@ class TestRPC(unittest.TestCase):
         self.servers[0].disconnect()
         gevent.sleep(0.002)
 
+    def test_handshake(self):
+        # Check that both ends agree on using length framing.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        gevent.sleep(0.002)
+        self.assertEqual(client._framing, client.LENGTH_FRAMING)
+        self.assertEqual(self.servers[0]._framing, client.LENGTH_FRAMING)
+        self.test_method_return_list()
+
+    def test_handshake_on_connect(self):
+        # Check that connect doesn't wait for the handshake, and that
+        # requests issued meanwhile (as on_connect handlers do) are
+        # sent after it, with the options agreed upon.
+        client = RemoteServiceClient(ServiceCoord("Foo", 0))
+        results = list()
+        client.add_on_connect_handler(
+            lambda coord: results.append(client.echo(value=42)))
+        client.connect()
+        self.clients.append(client)
+        self.assertFalse(client._ready.is_set())
+        results.append(client.echo(value=43))
+        gevent.sleep(0.002)
+        gevent.wait(results, timeout=1)
+        self.assertEqual(sorted(result.value for result in results),
+                         [42, 43])
+        self.assertTrue(client.connected)
+        self.assertEqual(client._framing, client.LENGTH_FRAMING)
+
+    def test_encode_when_sending(self):
+        # Check that messages are encoded with the codec in use when
+        # they're written, not when they're issued.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        codec = Mock()
+        codec.encode.return_value = b"{}"
+        with client._write_lock:
+            gevent.spawn(client.echo, value=42)
+            gevent.sleep(0.002)
+            client._codec = codec
+        gevent.sleep(0.002)
+        codec.encode.assert_called_once_with(
+            {"__id": ANY, "__method": "echo", "__data": {"value": 42}})
+
+    def test_handshake_not_supported(self):
+        # Check that a server not knowing about handshakes (that
+        # replies with an error) is spoken to with line framing.
+        with patch.object(RemoteServiceServer, "_handshake",
+                          return_value=False):
+            client = self.get_client(ServiceCoord("Foo", 0))
+        gevent.sleep(0.002)
+        self.assertTrue(client.connected)
+        self.assertEqual(client._framing, client.LINE_FRAMING)
+        self.assertEqual(self.servers[0]._framing, client.LINE_FRAMING)
+        self.test_method_return_list()
+
+    def test_codec(self):
+        # Check that the preferred codec is chosen, or JSON if the
+        # client doesn't know any other.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        self.assertIs(client._codec, CODECS[0])
+        with patch("cms.io.rpc.CODECS", [JSON_CODEC]):
+            client = self.get_client(ServiceCoord("Foo", 0))
+        gevent.sleep(0.002)
+        self.assertIs(client._codec, JSON_CODEC)
+        self.assertIs(self.servers[1]._codec, JSON_CODEC)
+        result = client.echo(value={"foo": ["bar", 4.2, None]})
+        result.wait()
+        self.assertEqual(result.value, {"foo": ["bar", 4.2, None]})
+
+    def test_batch(self):
+        # Check that batched requests are sent in a single message and
+        # get the right results.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        with patch.object(client, "_write", wraps=client._write) as write:
+            results = [client.echo(value=i, batch=True) for i in range(10)]
+            results.append(client.not_existent(batch=True))
+            for result in results:
+                result.wait()
+        self.assertEqual(write.call_count, 1)
+        for i in range(10):
+            self.assertTrue(results[i].successful())
+            self.assertEqual(results[i].value, i)
+        self.assertIsInstance(results[10].exception, RPCError)
+
+    def test_batch_concurrent(self):
+        # Check that the requests of a batch are executed concurrently.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        results = [client.sleep(seconds=0.05, batch=True) for i in range(5)]
+        gevent.wait(results, timeout=0.2)
+        self.assertEqual([result.value for result in results], [0.05] * 5)
+
+    def test_reserved_arguments(self):
+        with self.assertRaises(ValueError):
+            @rpc_method
+            def method(self, timeout):
+                pass
+
+    def test_batch_max_size(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        client.BATCH_MAX_SIZE = 3
+        with patch.object(client, "_write", wraps=client._write) as write:
+            results = [client.echo(value=i, batch=True) for i in range(7)]
+            self.assertEqual(write.call_count, 2)
+            gevent.wait(results)
+        self.assertEqual(write.call_count, 3)
+        self.assertEqual([result.value for result in results], range(7))
+
+    def test_batch_unencodable(self):
+        # Only the unencodable request fails.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result1 = client.echo(value=RuntimeError(), batch=True)
+        result2 = client.echo(value=42, batch=True)
+        gevent.wait([result1, result2])
+        self.assertIsInstance(result1.exception, RPCError)
+        self.assertEqual(result2.value, 42)
+
+    def test_batch_not_supported(self):
+        # Without support by the server requests are sent one by one.
+        with patch.object(RemoteServiceServer, "_handshake",
+                          return_value=False):
+            client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo(value=42, batch=True)
+        self.assertEqual(len(client._batch), 0)
+        result.wait()
+        self.assertEqual(result.value, 42)
+
+    def test_stream(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        with patch.object(self.servers[0], "_write",
+                          wraps=self.servers[0]._write) as write:
+            result = client.stream(count=10, size=3)
+            result.wait()
+        # Four chunks, and the end of the stream.
+        self.assertEqual(write.call_count, 5)
+        self.assertTrue(result.successful())
+        self.assertEqual(result.value, range(10))
+
+    def test_stream_empty(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.stream(count=0, size=3)
+        result.wait()
+        self.assertEqual(result.value, [])
+
+    def test_stream_on_chunk(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        chunks = list()
+        result = client.execute_rpc("stream", {"count": 10, "size": 3},
+                                    on_chunk=chunks.append)
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertIsNone(result.value)
+        self.assertEqual(chunks, [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+    def test_stream_error(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.stream_error()
+        result.wait()
+        self.assertFalse(result.successful())
+        self.assertIsInstance(result.exception, RPCError)
+        self.assertEqual(client.pending_outgoing_requests_chunks, {})
+
+    def test_stream_not_supported(self):
+        # Without support by the client (or in batches) the chunks are
+        # concatenated by the server.
+        with patch.object(RemoteServiceServer, "_handshake",
+                          return_value=False):
+            client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.stream(count=10, size=3)
+        result.wait()
+        self.assertEqual(result.value, range(10))
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.stream(count=10, size=3, batch=True)
+        result.wait()
+        self.assertEqual(result.value, range(10))
+
+    def test_statistics(self):
+        rpc_statistics.reset()
+        client = self.get_client(ServiceCoord("Foo", 0))
+        gevent.wait([client.echo(value=42), client.echo(value=43),
+                     client.raise_exception(), client.not_existent(),
+                     client.echo(value=44, batch=True)])
+        result = client.infinite()
+        gevent.sleep(0.002)
+
+        incoming = rpc_statistics.export_to_dict()["incoming"]
+        self.assertItemsEqual(incoming.keys(),
+                              ["echo", "raise_exception", "infinite"])
+        self.assertEqual(incoming["echo"]["calls"], 3)
+        self.assertEqual(incoming["echo"]["errors"], 0)
+        self.assertEqual(sum(count for unused_bound, count
+                             in incoming["echo"]["latency_histogram"]), 3)
+        self.assertGreater(incoming["echo"]["request_bytes"], 0)
+        self.assertGreater(incoming["echo"]["response_bytes"], 0)
+        self.assertEqual(incoming["raise_exception"]["errors"], 1)
+        self.assertEqual(incoming["infinite"]["in_flight"], 1)
+
+        outgoing = rpc_statistics.export_to_dict()["outgoing"]
+        self.assertEqual(outgoing["Foo.echo"]["calls"], 3)
+        self.assertEqual(outgoing["Foo.not_existent"]["errors"], 1)
+        self.assertEqual(outgoing["Foo.infinite"]["in_flight"], 1)
+        self.assertEqual(outgoing["Foo.echo"]["request_bytes"],
+                         incoming["echo"]["request_bytes"])
+        self.assertEqual(outgoing["Foo.echo"]["response_bytes"],
+                         incoming["echo"]["response_bytes"])
+
+        # Interrupted calls are accounted for.
+        client.disconnect()
+        gevent.sleep(0.002)
+        self.assertFalse(result.successful())
+        incoming = rpc_statistics.export_to_dict()["incoming"]
+        self.assertEqual(incoming["infinite"]["in_flight"], 0)
+        self.assertEqual(incoming["infinite"]["errors"], 1)
+
+    def test_timeout(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.infinite(timeout=0.01)
+        gevent.sleep(0.002)
+        self.assertFalse(result.ready())
+        server = self.servers[0]
+        self.assertEqual(len(server.pending_incoming_requests_threads), 1)
+        result.wait()
+        self.assertFalse(result.successful())
+        self.assertIsInstance(result.exception, RPCError)
+        self.assertEqual(client.pending_outgoing_requests, {})
+        # The server stopped executing the method.
+        gevent.sleep(0.002)
+        self.assertEqual(len(server.pending_incoming_requests_threads), 0)
+        # The connection is still usable.
+        self.test_method_return_int()
+
+    def test_timeout_not_expired(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo_slow(value=42, timeout=1.0)
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertEqual(result.value, 42)
+        result = client.echo_slow(value=43, timeout=1.0, batch=True)
+        result.wait()
+        self.assertEqual(result.value, 43)
+
+    def test_timeout_batch(self):
+        client = self.get_client(ServiceCoord("Foo", 0))
+        client.BATCH_WINDOW = 0.05
+        result1 = client.echo(value=42, timeout=0.01, batch=True)
+        result2 = client.echo(value=43, batch=True)
+        gevent.wait([result1, result2])
+        self.assertIsInstance(result1.exception, RPCError)
+        self.assertEqual(result2.value, 43)
+
+    def test_large_message(self):
+        # Messages larger than MAX_MESSAGE_SIZE are sent in many
+        # chunks.
+        client = self.get_client(ServiceCoord("Foo", 0))
+        value = "x" * (3 * RemoteServiceClient.MAX_MESSAGE_SIZE)
+        result = client.echo(value=value)
+        result.wait()
+        self.assertTrue(result.successful())
+        self.assertEqual(result.value, value)
+
+    def test_unix_socket(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "Foo_0")
+        listener = gevent.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(5)
+        unix_server = StreamServer(listener, self.get_server)
+        unix_server.start()
+        self.addCleanup(unix_server.stop)
+        self.mock.return_value = Address(self.host, self.port, path)
+
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo(value=42)
+        self.assertEqual(result.get(timeout=0.5), 42)
+        self.assertEqual(client._socket.family, socket.AF_UNIX)
+
+    def test_unix_socket_missing(self):
+        # Services on other hosts are reached through TCP.
+        self.mock.return_value = Address(self.host, self.port,
+                                         "/nonexistent/Foo_0")
+        client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo(value=42)
+        self.assertEqual(result.get(timeout=0.5), 42)
+        self.assertEqual(client._socket.family, socket.AF_INET)
+
+    def test_unix_socket_not_created(self):
+        # If the UNIX domain socket can't even be created (e.g., too
+        # many open files) TCP is used.
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "Foo_0")
+        open(path, "w").close()
+        self.mock.return_value = Address(self.host, self.port, path)
+
+        real_socket = gevent.socket.socket
+
+        def create_socket(family, *args):
+            if family == socket.AF_UNIX:
+                raise socket.error("Too many open files.")
+            return real_socket(family, *args)
+
+        with patch("gevent.socket.socket", create_socket):
+            client = self.get_client(ServiceCoord("Foo", 0))
+        result = client.echo(value=42)
+        self.assertEqual(result.get(timeout=0.5), 42)
+        self.assertEqual(client._socket.family, socket.AF_INET)
+
+    def test_tcp_socket_closed(self):
+        # The socket is closed if connecting fails.
+        sock = Mock()
+        sock.connect.side_effect = socket.error("Connection refused.")
+        with patch("gevent.socket.socket", return_value=sock):
+            client = RemoteServiceClient(ServiceCoord("Foo", 0))
+            client._connect()
+        self.assertFalse(client.connected)
+        sock.close.assert_called_once_with()
+
+    def test_send_line_framing(self):
+        # Check that clients not doing the handshake are understood.
+        sock = gevent.socket.create_connection((self.host, self.port))
+        sock.sendall('{"__id": "foo", "__method": "echo", '
+                     '"__data": {"value": 42}}\r\n')
+        response = sock.makefile().readline()
+        self.assertEqual(json.loads(response),
+                         {"__id": "foo", "__data": 42, "__error": None})
+
     def test_send_invalid_json(self):
         sock = gevent.socket.create_connection((self.host, self.port))
         sock.sendall("foo\r\n")
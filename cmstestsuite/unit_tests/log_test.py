@@ -0,0 +1,113 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the logging handlers."""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import logging
+import unittest
+
+import gevent
+from gevent.event import AsyncResult
+
+from mock import Mock
+
+from cms.log import LogServiceHandler
+
+
+class TestLogServiceHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.log_service = Mock()
+        self.log_service.connected = True
+        self.handler = LogServiceHandler(self.log_service)
+        self.handler.QUEUE_SIZE = 10
+        self.handler.BATCH_SIZE = 4
+        self.handler.FLUSH_INTERVAL = 0.01
+
+    def emit(self, count):
+        for i in xrange(count):
+            self.handler.emit(logging.makeLogRecord(
+                {"msg": "message %d", "args": (i,)}))
+
+    def sent_messages(self):
+        messages = list()
+        for call in self.log_service.log_records.call_args_list:
+            messages += [record["msg"] for record in call[1]["records"]]
+        return messages
+
+    def test_batched(self):
+        self.emit(3)
+        self.assertFalse(self.log_service.log_records.called)
+        gevent.sleep(0.02)
+        self.assertEqual(self.log_service.log_records.call_count, 1)
+        self.assertEqual(self.sent_messages(),
+                         ["message 0", "message 1", "message 2"])
+
+    def test_full_batch(self):
+        self.emit(4)
+        gevent.sleep(0)
+        self.assertEqual(self.log_service.log_records.call_count, 1)
+        self.assertEqual(len(self.sent_messages()), 4)
+
+    def test_not_connected(self):
+        self.log_service.connected = False
+        self.handler.BATCH_SIZE = 100
+        self.emit(13)
+        gevent.sleep(0.02)
+        self.assertFalse(self.log_service.log_records.called)
+        self.assertEqual(self.handler.dropped, 3)
+
+        # The oldest records have been dropped, the others are sent
+        # once the LogService is back.
+        self.log_service.connected = True
+        gevent.sleep(0.02)
+        self.assertEqual(self.sent_messages(),
+                         ["message %d" % i for i in xrange(3, 13)])
+        self.assertEqual(
+            self.log_service.log_records.call_args[1]["dropped"], 3)
+
+    def test_failed_send(self):
+        results = [AsyncResult() for _ in xrange(3)]
+        self.log_service.log_records.side_effect = results
+
+        # The records of a failed batch are counted as dropped...
+        self.emit(4)
+        gevent.sleep(0)
+        results[0].set_exception(Exception())
+        gevent.sleep(0)
+        self.assertEqual(self.handler.dropped, 4)
+
+        # ... and reported with the next batch, until it succeeds.
+        self.emit(4)
+        gevent.sleep(0)
+        self.assertEqual(
+            self.log_service.log_records.call_args[1]["dropped"], 4)
+        results[1].set(None)
+        gevent.sleep(0)
+        self.emit(4)
+        gevent.sleep(0)
+        self.assertEqual(
+            self.log_service.log_records.call_args[1]["dropped"], 0)
+        self.assertEqual(self.handler.dropped, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,6 +25,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import logging
+import sqlite3
 import unittest
 
 from cms.service.LogService import LogService
@@ -40,7 +41,7 @@ class TestLogService(unittest.TestCase):
     EXC_TEXT = "Random exception"
 
     def setUp(self):
-        self.service = LogService(0)
+        self.service = LogService(0, store_path=":memory:")
 
     def test_last_messages(self):
         for severity in ["CRITICAL",
@@ -80,6 +81,68 @@ class TestLogService(unittest.TestCase):
         else:
             self.assertNotEquals(last_message["severity"], severity)
 
+    def test_log_records(self):
+        records = [{"msg": TestLogService.MSG + severity,
+                    "levelname": severity,
+                    "levelno": getattr(logging, severity),
+                    "created": TestLogService.CREATED,
+                    "service_name": TestLogService.SERVICE_NAME,
+                    "service_shard": TestLogService.SERVICE_SHARD}
+                   for severity in ["ERROR", "INFO", "WARNING"]]
+        self.service.log_records(records=records, dropped=3)
+        last_messages = self.service.last_messages()
+        self.assertEquals([m["message"] for m in last_messages[-2:]],
+                          [TestLogService.MSG + "ERROR",
+                           TestLogService.MSG + "WARNING"])
+
+    def test_query_messages(self):
+        for i in xrange(5):
+            for submission_id in [41, 42]:
+                self.service.Log(
+                    msg=TestLogService.MSG + " %d" % i,
+                    levelname="WARNING" if i == 2 else "INFO",
+                    levelno=logging.WARNING if i == 2 else logging.INFO,
+                    created=TestLogService.CREATED + i,
+                    service_name=TestLogService.SERVICE_NAME,
+                    service_shard=submission_id - 41,
+                    operation="evaluate submission %d" % submission_id)
+
+        result = self.service.query_messages(submission_id=42, limit=3)
+        self.assertEquals([m["message"] for m in result["messages"]],
+                          [TestLogService.MSG + " %d" % i
+                           for i in [4, 3, 2]])
+        self.assertEquals(result["messages"][0]["coord"],
+                          TestLogService.SERVICE_NAME + ",1")
+        self.assertEquals(result["messages"][0]["timestamp"],
+                          TestLogService.CREATED + 4)
+        result = self.service.query_messages(submission_id=42, limit=3,
+                                             before=result["next"])
+        self.assertEquals([m["message"] for m in result["messages"]],
+                          [TestLogService.MSG + " %d" % i for i in [1, 0]])
+        self.assertIsNone(result["next"])
+
+        result = self.service.query_messages(
+            service_name=TestLogService.SERVICE_NAME, service_shard=0,
+            severity="WARNING")
+        self.assertEquals([m["operation"] for m in result["messages"]],
+                          ["evaluate submission 41"])
+        result = self.service.query_messages(
+            start=TestLogService.CREATED + 1,
+            stop=TestLogService.CREATED + 2)
+        self.assertEquals(len(result["messages"]), 2)
+
+    def test_exit(self):
+        store = self.service._store
+        self.service.exit()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            store.query()
+        # Messages arriving late are still shown.
+        self.service.Log(msg=TestLogService.MSG, levelname="ERROR",
+                         levelno=logging.ERROR,
+                         created=TestLogService.CREATED)
+        self.assertEquals(self.service.last_messages()[-1]["message"],
+                          TestLogService.MSG)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -26,8 +26,11 @@ from __future__ import print_function
 
 import unittest
 
+from mock import Mock, patch
+
 from cms import ServiceCoord
-from cms.service.ResourceService import ResourceService
+from cms.service.ResourceService import ResourceHistory, ResourceService, \
+    delta_decode, delta_encode
 
 
 class TestResourceService(unittest.TestCase):
@@ -82,5 +85,68 @@ class TestResourceService(unittest.TestCase):
         self.assertFalse(ResourceService._is_service_proc(
             service, cmdline.split(" ")), cmdline)
 
+    def test_refresh_procs(self):
+        """Test that processes are looked for only when needed.
+
+        """
+        service = ServiceCoord("Worker", 0)
+        resource_service = ResourceService.__new__(ResourceService)
+        resource_service._local_services = [service]
+        resource_service._procs = {service: None}
+        resource_service._services_prev_cpu_times = {}
+        resource_service._scanned_pids = None
+        resource_service._last_scan_time = 0.0
+
+        proc = Mock()
+        proc.as_dict.return_value = {
+            "cmdline": ["/usr/bin/python2", "cmsWorker", "0"],
+            "cpu_times": (1.0, 2.0)}
+        with patch("cms.service.ResourceService.psutil") as psutil:
+            psutil.pids.return_value = [1, 2]
+            psutil.process_iter.return_value = []
+            resource_service._refresh_procs()
+            self.assertIsNone(resource_service._procs[service])
+            self.assertEqual(psutil.process_iter.call_count, 1)
+
+            # No process started, so no need to look again.
+            psutil.process_iter.return_value = [proc]
+            resource_service._refresh_procs()
+            self.assertEqual(psutil.process_iter.call_count, 1)
+
+            psutil.pids.return_value = [1, 2, 3]
+            resource_service._refresh_procs()
+            self.assertIs(resource_service._procs[service], proc)
+            self.assertEqual(
+                resource_service._services_prev_cpu_times[service],
+                (1.0, 2.0))
+
+            # The process is known, and running.
+            psutil.pids.return_value = [1, 2, 3, 4]
+            resource_service._refresh_procs()
+            self.assertEqual(psutil.process_iter.call_count, 2)
+
+
+class TestResourceHistory(unittest.TestCase):
+
+    def test_since(self):
+        history = ResourceHistory(["a", "b"], 4)
+        self.assertEqual(history.since(0), ([], {"a": [], "b": []}))
+        for i in xrange(1, 7):
+            history.append(10 * i, {"a": i, "b": -i})
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history.since(0),
+                         ([30, 40, 50, 60], {"a": [3, 4, 5, 6],
+                                             "b": [-3, -4, -5, -6]}))
+        self.assertEqual(history.since(45),
+                         ([50, 60], {"a": [5, 6], "b": [-5, -6]}))
+        self.assertEqual(history.since(60), ([], {"a": [], "b": []}))
+
+    def test_delta_encoding(self):
+        values = [1000, 1005, 1010, 1010, 990]
+        self.assertEqual(delta_encode(values), [1000, 5, 5, 0, -20])
+        self.assertEqual(delta_decode(delta_encode(values)), values)
+        self.assertEqual(delta_encode([]), [])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -32,10 +32,10 @@ gevent.monkey.patch_all()
 import gevent
 import random
 import unittest
-from mock import Mock, call
+from mock import MagicMock, Mock, PropertyMock, call, patch
 
 import cms.service.ScoringService
-from cms.service.ScoringService import ScoringService
+from cms.service.ScoringService import ScorerQueue, ScoringService
 
 
 class TestScoringService(unittest.TestCase):
@@ -53,7 +53,7 @@ class TestScoringService(unittest.TestCase):
         sr = TestScoringService.new_sr_to_score()
         score_type = Mock()
         score_type.compute_score.return_value = score_info
-        TestScoringService.set_up_db([sr], score_type)
+        self.set_up_db([sr], score_type)
 
         self.service.new_evaluation(123, 456)
 
@@ -74,7 +74,7 @@ class TestScoringService(unittest.TestCase):
         score_type.compute_score.return_value = (1, "1", 2, "2", ["1", "2"])
         sr_a = TestScoringService.new_sr_to_score()
         sr_b = TestScoringService.new_sr_to_score()
-        TestScoringService.set_up_db([sr_a, sr_b], score_type)
+        self.set_up_db([sr_a, sr_b], score_type)
 
         self.service.new_evaluation(123, 456)
         self.service.new_evaluation(124, 456)
@@ -82,6 +82,26 @@ class TestScoringService(unittest.TestCase):
         gevent.sleep(0)  # Needed to trigger the score loop.
         # Asserts that compute_score was called.
         assert score_type.compute_score.mock_calls == [call(sr_a), call(sr_b)]
+        # Asserts that they were loaded together.
+        assert len(self.service._load_submission_results.mock_calls) == 1
+
+    def test_new_evaluation_error(self):
+        """An error scoring a submission doesn't affect the others.
+
+        """
+        score_info = self.new_score_info()
+        score_type = Mock()
+        score_type.compute_score.side_effect = [ValueError(), score_info]
+        sr_a = TestScoringService.new_sr_to_score()
+        sr_b = TestScoringService.new_sr_to_score()
+        self.set_up_db([sr_a, sr_b], score_type)
+
+        self.service.new_evaluation(123, 456)
+        self.service.new_evaluation(124, 456)
+
+        gevent.sleep(0)  # Needed to trigger the score loop.
+        assert score_type.compute_score.mock_calls == [call(sr_a), call(sr_b)]
+        assert sr_b.score == score_info[0]
 
     def test_new_evaluation_already_scored(self):
         """One submission is not re-scored if already scored.
@@ -90,7 +110,7 @@ class TestScoringService(unittest.TestCase):
         sr = TestScoringService.new_sr_scored()
         score_type = Mock()
         score_type.compute_score.return_value = (1, "1", 2, "2", ["1", "2"])
-        TestScoringService.set_up_db([sr], score_type)
+        self.set_up_db([sr], score_type)
 
         self.service.new_evaluation(123, 456)
 
@@ -98,9 +118,188 @@ class TestScoringService(unittest.TestCase):
         # Asserts that compute_score was called.
         assert score_type.compute_score.mock_calls == []
 
+    def test_new_evaluation_same_dataset(self):
+        """The score type of a dataset is built only once.
+
+        """
+        score_type = Mock()
+        score_type.compute_score.return_value = (1, "1", 2, "2", ["1", "2"])
+        sr_a = TestScoringService.new_sr_to_score()
+        sr_b = TestScoringService.new_sr_to_score()
+        sr_b.dataset = sr_a.dataset
+        self.set_up_db([sr_a, sr_b], score_type)
+
+        self.service.new_evaluation(123, 456)
+        gevent.sleep(0)
+        self.service.new_evaluation(124, 456)
+        gevent.sleep(0)
+
+        assert score_type.compute_score.mock_calls == [call(sr_a), call(sr_b)]
+        assert cms.service.ScoringService.get_score_type.call_count == 1
+
+        # But again if its parameters change (set_up_db gives a new
+        # get_score_type mock).
+        sr_c = TestScoringService.new_sr_to_score()
+        sr_c.dataset = sr_a.dataset
+        sr_c.dataset.score_type_parameters = "[42]"
+        self.set_up_db([sr_c], score_type)
+        self.service.new_evaluation(125, 456)
+        gevent.sleep(0)
+        assert cms.service.ScoringService.get_score_type.call_count == 1
+
+    # Testing rescore_dataset.
+
+    def test_rescore_dataset_incomplete(self):
+        """Results lacking some evaluation are invalidated.
+
+        """
+        score_type = Mock()
+        score_type.compute_scores.return_value = [(1, "1", 2, "2", ["1"])]
+        matrix = MagicMock(submission_ids=[123])
+        self.service._get_score_type = Mock(return_value=score_type)
+        self.service._load_outcome_matrix = Mock(
+            return_value=(matrix, [124]))
+        self.service.invalidate_submission = Mock()
+        dataset = Mock(id=456)
+        dataset.task.active_dataset_id = 789
+
+        with patch("cms.service.ScoringService.SessionGen", MagicMock()), \
+                patch.object(cms.service.ScoringService.Dataset,
+                             "get_from_id", return_value=dataset):
+            self.service.rescore_dataset(456)
+
+        assert score_type.compute_scores.mock_calls == [call(matrix)]
+        assert self.service.invalidate_submission.mock_calls == \
+            [call(submission_id=124, dataset_id=456)]
+
+    def test_rescore_dataset_paged(self):
+        """Results are rescored a page at a time, yielding in between.
+
+        """
+        self.service.RESCORE_PAGE_SIZE = 2
+        pages = [(MagicMock(submission_ids=[1, 2]), []),
+                 (MagicMock(submission_ids=[3]), [4]),
+                 (MagicMock(submission_ids=[]), [])]
+        score_type = Mock()
+        score_type.compute_scores.return_value = []
+        self.service._get_score_type = Mock(return_value=score_type)
+        self.service._load_outcome_matrix = Mock(side_effect=pages)
+        self.service.invalidate_submission = Mock()
+        dataset = Mock(id=456)
+        dataset.task.active_dataset_id = 789
+
+        with patch("cms.service.ScoringService.SessionGen", MagicMock()), \
+                patch.object(cms.service.ScoringService.Dataset,
+                             "get_from_id", return_value=dataset), \
+                patch("cms.service.ScoringService.gevent.sleep") as sleep:
+            self.service.rescore_dataset(456)
+
+        assert [c[2]["last"] for c in
+                self.service._load_outcome_matrix.mock_calls] == \
+            [None, 2, 4]
+        assert score_type.compute_scores.mock_calls == \
+            [call(matrix) for matrix, _ in pages]
+        assert sleep.mock_calls == [call(0), call(0)]
+        assert self.service.invalidate_submission.mock_calls == \
+            [call(submission_id=4, dataset_id=456)]
+
+    # Testing the cache of the score types.
+
+    def test_score_type_cached(self):
+        """Score types are built again only if needed.
+
+        """
+        dataset = Mock(id=456, score_type="Sum", score_type_parameters="1")
+        # The testcases are not loaded to check the cache.
+        type(dataset).testcases = PropertyMock(side_effect=AssertionError)
+        get_score_type = Mock(side_effect=lambda dataset: Mock())
+
+        with patch("cms.service.ScoringService.get_score_type",
+                   get_score_type):
+            score_type = self.service._get_score_type(dataset)
+            assert self.service._get_score_type(dataset) is score_type
+            dataset.score_type_parameters = "2"
+            score_type = self.service._get_score_type(dataset)
+            assert self.service._get_score_type(dataset) is score_type
+            self.service.dataset_updated(dataset_id=456)
+            assert self.service._get_score_type(dataset) is not score_type
+
+        assert get_score_type.call_count == 3
+
+    # Testing preview_score_type.
+
+    def test_preview_score_type(self):
+        """Changes are computed in memory, nothing is written.
+
+        """
+        matrix = MagicMock(submission_ids=[10, 11, 12])
+        candidate = Mock()
+        candidate.compute_scores.return_value = [
+            (50.0, "", 50.0, "", []),
+            (40.0, "", 40.0, "", []),
+            (10.0, "", 10.0, "", [])]
+        self.service._load_outcome_matrix = Mock(return_value=(matrix, []))
+        dataset = Mock(id=456, task_id=1, score_type="Sum",
+                       testcases={"0": Mock(public=True)})
+        dataset.task.score_precision = 0
+        dataset.task.contest = Mock(id=5, score_precision=0,
+                                    tasks=[Mock(id=1, score_precision=0),
+                                           Mock(id=2, score_precision=0)])
+        # Queries for the old scores, the submissions and the users.
+        session = MagicMock()
+        session.query.side_effect = [
+            self.new_query([(10, 50.0, 50.0), (11, 20.0, 20.0),
+                            (12, 30.0, 30.0)]),
+            self.new_query([(10, 100, 1, None), (11, 100, 2, None),
+                            (12, 101, 1, None)]),
+            self.new_query([(100,), (101,), (102,)])]
+        session_gen = MagicMock()
+        session_gen.return_value.__enter__.return_value = session
+        get_task_scores = Mock(return_value={
+            (100, 2): (10.0, False), (101, 1): (30.0, False),
+            (102, 2): (60.0, False)})
+
+        with patch("cms.service.ScoringService.SessionGen", session_gen), \
+                patch.object(cms.service.ScoringService.Dataset,
+                             "get_from_id", return_value=dataset), \
+                patch("cms.service.ScoringService.get_score_type",
+                      Mock(return_value=candidate)), \
+                patch("cms.service.ScoringService.get_task_scores",
+                      get_task_scores):
+            preview = self.service.preview_score_type(456, "[]")
+
+        # User 100 goes from 20 + 10 to 40 + 10 and user 101 from 30 to
+        # 10; user 102 stays first with 60 on the other task.
+        self.assertEqual(preview, {
+            "submissions": [[11, 20.0, 40.0, 20.0, 40.0],
+                            [12, 30.0, 10.0, 30.0, 10.0]],
+            "users": [[100, 30.0, 50.0, 2, 2],
+                      [101, 30.0, 10.0, 2, 3]]})
+        assert get_task_scores.mock_calls == [call(session, 5, store=False)]
+        for method in ["add", "delete", "execute", "flush", "commit"]:
+            assert not getattr(session, method).called, method
+
+    # Testing the sweeper.
+
+    def test_sweep(self):
+        """Unscored results are fetched a page at a time.
+
+        """
+        self.service.SWEEPER_PAGE_SIZE = 2
+        self.service._get_unscored_page = Mock(
+            side_effect=[[(1, 1), (2, 1)], [(3, 1)]])
+
+        self.service._sweep()
+
+        assert [c[1][1] for c in
+                self.service._get_unscored_page.mock_calls] == \
+            [None, (2, 1)]
+        assert self.service._scorer_queue.status()["depth"]["bulk"] == 3
+
     @staticmethod
     def new_sr_to_score():
         sr = Mock()
+        sr.dataset.testcases = {"0": Mock(public=True)}
         sr.needs_scoring.return_value = True
         sr.scored.return_value = False
         return sr
@@ -123,16 +322,61 @@ class TestScoringService(unittest.TestCase):
         )
 
     @staticmethod
-    def set_up_db(srs, score_type):
-        submission = Mock()
-        submission.get_result = Mock(side_effect=srs)
-        cms.service.ScoringService.Submission.get_from_id = \
-            Mock(return_value=submission)
-        cms.service.ScoringService.Dataset.get_from_id = \
-            Mock(return_value=Mock())
+    def new_query(rows):
+        query = MagicMock()
+        query.filter.return_value = query
+        query.outerjoin.return_value = query
+        query.all.return_value = rows
+        query.__iter__.side_effect = lambda: iter(rows)
+        return query
+
+    def set_up_db(self, srs, score_type):
+        srs = iter(srs)
+        self.service._load_submission_results = Mock(
+            side_effect=lambda session, items:
+            dict((item, next(srs)) for item in items))
         cms.service.ScoringService.get_score_type = \
             Mock(return_value=score_type)
 
 
+class TestScorerQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = ScorerQueue()
+
+    def test_priority(self):
+        self.queue.put((1, 1), ScorerQueue.PRIORITY_BULK)
+        self.queue.put((2, 1), ScorerQueue.PRIORITY_BULK)
+        self.queue.put((3, 1), ScorerQueue.PRIORITY_LIVE)
+        self.assertEqual(self.queue.get(2), [(3, 1), (1, 1)])
+        self.assertEqual(self.queue.get(2), [(2, 1)])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_duplicates(self):
+        self.queue.put((1, 1), ScorerQueue.PRIORITY_BULK)
+        self.queue.put((2, 1), ScorerQueue.PRIORITY_BULK)
+        self.queue.put((1, 1), ScorerQueue.PRIORITY_BULK)
+        self.queue.put((2, 1), ScorerQueue.PRIORITY_LIVE)
+        self.queue.put((2, 1), ScorerQueue.PRIORITY_BULK)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.status(),
+                         {"depth": {"live": 1, "bulk": 1},
+                          "put": 5, "duplicates": 3})
+        self.assertEqual(self.queue.get(10), [(2, 1), (1, 1)])
+        self.assertEqual(self.queue.status()["depth"],
+                         {"live": 0, "bulk": 0})
+
+        # Once extracted, they can be put again.
+        self.queue.put((2, 1), ScorerQueue.PRIORITY_BULK)
+        self.assertEqual(self.queue.get(10), [(2, 1)])
+
+    def test_get_waits(self):
+        greenlet = gevent.spawn(self.queue.get, 10)
+        gevent.sleep(0)
+        self.assertFalse(greenlet.ready())
+        self.queue.put((1, 1), ScorerQueue.PRIORITY_LIVE)
+        self.assertEqual(greenlet.get(timeout=1), [(1, 1)])
+
+
 if __name__ == "__main__":
     unittest.main()
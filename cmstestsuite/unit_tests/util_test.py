@@ -28,6 +28,7 @@ import unittest
 from mock import Mock
 
 import cms.util
+from cms.util import LRUCache
 from cms import Address, ServiceCoord, \
     get_safe_shard, get_service_address, get_service_shards
 
@@ -157,5 +158,39 @@ class TestGetServiceShards(unittest.TestCase):
         self.assertEqual(get_service_shards("ServiceNotPresent"), 0)
 
 
+class TestLRUCache(unittest.TestCase):
+    """Test the class cms.util.LRUCache.
+
+    """
+    def test_least_recently_used_discarded(self):
+        """Test that the least recently used item is discarded."""
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b", 0), 0)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_weight(self):
+        """Test that the total weight of the items is bounded."""
+        cache = LRUCache(10, weigh=lambda key, value: len(value))
+        cache.put("a", "x" * 4)
+        cache.put("b", "x" * 4)
+        cache.put("a", "x" * 5)
+        self.assertEqual(cache.weight, 9)
+        cache.put("c", "x" * 3)
+        self.assertEqual(cache.weight, 8)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        # Too heavy to be stored.
+        cache.put("d", "x" * 11)
+        self.assertNotIn("d", cache)
+        self.assertEqual(cache.weight, 8)
+
+
 if __name__ == "__main__":
     unittest.main()
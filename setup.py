@@ -147,6 +147,8 @@ def do_setup():
                   "cmsContestImporter=cmscontrib.ContestImporter:main",
                   "cmsDumpUpdater=cmscontrib.DumpUpdater:main",
                   "cmsRWSHelper=cmscontrib.RWSHelper:main",
+                  "cmsMigrateFileStorage=cmscontrib.MigrateFileStorage:main",
+                  "cmsCheckFileStorage=cmscontrib.CheckFileStorage:main",
 
                   "cmsMake=cmstaskenv.cmsMake:main",
 